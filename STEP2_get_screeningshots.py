@@ -1,15 +1,33 @@
 
 
-import pyautogui
 import time
 import os
-import tkinter as tk
-from tkinter import simpledialog
+import argparse
+from multiprocessing import Pool, cpu_count
+
+import metrics
+from screen_capture import PyAutoGUIScreen, ReplayScreen, PageSettleDetector, SETTLE_TIMEOUT
+from streaming_ocr import StreamingOCR
 
 # --- Configuration ---
 SCREENSHOTS_FOLDER = 'screenshots'
 COORDS_FILENAME = 'STEP1_mouse_config/mouse_clicks_two_columns.txt'
 
+# After clicking 'Next Page', wait until the new page has rendered (detected on screen)
+# instead of sleeping a fixed time. SETTLE_TIMEOUT is the longest wait for one turn.
+ADAPTIVE_PAGE_TURN = True
+
+# Fixed wait used when ADAPTIVE_PAGE_TURN is off (--fixed-delay)
+PAGE_TURN_DELAY = 1.5  # Adjust this delay as necessary
+
+# Extra clicks when the page didn't turn, before giving up (usually the end of the book)
+MAX_TURN_RETRIES = 2
+
+# Streaming mode: OCR workers running during the capture, and the size of the queue between them
+STREAM_WORKERS = 2
+STREAM_BATCH_SIZE = 4
+STREAM_QUEUE_SIZE = 16
+
 def clear_screenshots_folder(folder):
     """Deletes all files in the specified folder."""
     print(f"Clearing the '{folder}' directory...")
@@ -29,6 +47,9 @@ def clear_screenshots_folder(folder):
 
 def get_number_of_pages():
     """Shows an input box to ask the user for the number of pages to process."""
+    import tkinter as tk
+    from tkinter import simpledialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     # Bring the dialog to the front
@@ -60,8 +81,33 @@ def get_bounding_box(four_points):
     height = max(y_coords) - top
     return (left, top, width, height)
 
-def take_screenshots_two_columns(coordinates, num_pages, folder):
-    """Takes screenshots of two columns and advances the page."""
+def wait_for_page_turn(screen, detector, next_button, previous):
+    """
+    Waits until the page shown differs from `previous` and has stopped changing,
+    clicking 'Next Page' again if it didn't turn. Returns the new page snapshot,
+    or None if the page never changed.
+    """
+    for attempt in range(MAX_TURN_RETRIES + 1):
+        if attempt:
+            print(f"  - The page didn't turn, clicking again ({attempt}/{MAX_TURN_RETRIES}).")
+            screen.click(next_button)
+        current = detector.wait_for_new_page(previous)
+        if current is not None:
+            return current
+    return None
+
+
+def take_screenshots_two_columns(coordinates, num_pages, folder, screen=None, on_capture=None,
+                                 page_turn_delay=PAGE_TURN_DELAY, adaptive=ADAPTIVE_PAGE_TURN,
+                                 settle_timeout=SETTLE_TIMEOUT):
+    """
+    Takes screenshots of two columns and advances the page.
+    on_capture(file_path) is called as soon as each column image is saved.
+    With adaptive=True each capture happens as soon as the new page has rendered,
+    and a page that didn't turn is never saved twice.
+    """
+    screen = screen or PyAutoGUIScreen()
+
     # Define regions from the 10 coordinates
     left_col_region = get_bounding_box(coordinates[0:4])
     right_col_region = get_bounding_box(coordinates[4:8])
@@ -73,50 +119,148 @@ def take_screenshots_two_columns(coordinates, num_pages, folder):
     print(f"Right column region: {right_col_region}")
     print(f"Next button at: {next_button}")
 
+    detector = None
+    if adaptive:
+        detector = PageSettleDetector(screen, [left_col_region, right_col_region], timeout=settle_timeout)
+        current_page = detector.snapshot()
+
     # Start with an initial screenshot number
     screenshot_number = 1
 
     for i in range(num_pages):
         print(f"\nProcessing page {i + 1}/{num_pages}...")
 
-        # Take screenshot of the left column
-        print(f"  - Capturing left column...")
-        filename_left = f"{folder}/page_{str(screenshot_number).zfill(4)}.png"
-        pyautogui.screenshot(filename_left, region=left_col_region)
-        print(f"    Saved as {filename_left}")
-        screenshot_number += 1
-
-        # Take screenshot of the right column
-        print(f"  - Capturing right column...")
-        filename_right = f"{folder}/page_{str(screenshot_number).zfill(4)}.png"
-        pyautogui.screenshot(filename_right, region=right_col_region)
-        print(f"    Saved as {filename_right}")
-        screenshot_number += 1
+        for side, region in (("left", left_col_region), ("right", right_col_region)):
+            # Take screenshot of the column
+            print(f"  - Capturing {side} column...")
+            filename = f"{folder}/page_{str(screenshot_number).zfill(4)}.png"
+            with metrics.timer('step2', 'capture', item=filename):
+                screen.grab(region).save(filename)
+            metrics.count('step2', 'bytes_written', metrics.file_size(filename))
+            print(f"    Saved as {filename}")
+            screenshot_number += 1
+            if on_capture:
+                on_capture(filename)
 
         # Click the "next" button if it's not the last page
         if i < num_pages - 1:
             print("  - Clicking 'Next Page' button.")
-            pyautogui.click(next_button)
+            screen.click(next_button)
+            if detector is None:
+                # Wait for the page to load
+                time.sleep(page_turn_delay)
+                continue
+
             # Wait for the page to load
-            time.sleep(1.5)  # Adjust this delay as necessary
+            with metrics.timer('step2', 'page_turn'):
+                current_page = wait_for_page_turn(screen, detector, next_button, current_page)
+            if current_page is None:
+                print("  - The page is still the same after several clicks; stopping (end of the book?).")
+                break
 
     print("\nScreenshot process completed.")
 
+
+def take_screenshots_streaming(coordinates, num_pages, folder, screen=None, num_workers=STREAM_WORKERS,
+                               batch_size=STREAM_BATCH_SIZE, queue_size=STREAM_QUEUE_SIZE,
+                               page_turn_delay=PAGE_TURN_DELAY, adaptive=ADAPTIVE_PAGE_TURN, read_batch=None):
+    """
+    Captures the book like take_screenshots_two_columns while OCR workers read the
+    images already saved. The detections go into the STEP5 OCR cache as each batch
+    is read (an interrupted capture keeps them), so STEP5 only has to assemble the
+    chapters once the markers are known.
+    read_batch(paths) can replace the easyocr worker pool (e.g. a stub in headless tests).
+    Returns {file_path: detections}.
+    """
+    pool = cache = on_batch = None
+    if read_batch is None:
+        import ocr_cache
+        import STEP5_ocr_subfolders as step5
+
+        # Start loading the models now; they are ready after the first page turns
+        pool = Pool(processes=num_workers, initializer=step5.init_reader,
+                    initargs=(step5.OCR_LANGUAGES, True, max(1, cpu_count() // num_workers),
+                              step5.PREPROCESS))
+
+        def read_batch(paths):
+            return pool.apply(step5.ocr_batch, (paths,))
+
+        # One cache shared by the consumer threads; every entry is committed as it is put
+        settings = step5.ocr_settings()
+        cache = ocr_cache.OCRCache(step5.CACHE_PATH, max_bytes=step5.CACHE_MAX_MB * 1024 * 1024)
+
+        def on_batch(paths, detections):
+            for file_path, page_detections in zip(paths, detections):
+                if page_detections is not None:
+                    cache.put(ocr_cache.image_key(file_path, settings), page_detections)
+
+    stream = StreamingOCR(read_batch, num_consumers=num_workers, batch_size=batch_size, queue_size=queue_size,
+                          on_batch=on_batch)
+    try:
+        take_screenshots_two_columns(coordinates, num_pages, folder, screen=screen, on_capture=stream.submit,
+                                     page_turn_delay=page_turn_delay, adaptive=adaptive)
+        print("Waiting for the OCR of the last pages...")
+        results = stream.close()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if cache is not None:
+            cache.close()
+    print(f"OCR finished for {len(results)} images (max queue depth {stream.max_queue_depth}).")
+    if cache is not None:
+        print("OCR results saved to the STEP5 cache.")
+    return results
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Captures the two columns of each page of the book.")
+    parser.add_argument('--stream', action='store_true',
+                        help="OCR the captured images while the capture is still running.")
+    parser.add_argument('--replay', metavar='FOLDER',
+                        help="Replay the screenshots of FOLDER as a fake screen (headless test run).")
+    parser.add_argument('--workers', type=int, default=STREAM_WORKERS, help="OCR workers in streaming mode.")
+    parser.add_argument('--fixed-delay', type=float, metavar='SECONDS',
+                        help="Sleep a fixed time after each page turn instead of detecting when the page rendered.")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args, 'step2')
+    if args.replay and os.path.abspath(args.replay) == os.path.abspath(SCREENSHOTS_FOLDER):
+        parser.error("--replay must be a different folder than the one being captured.")
+
     clear_screenshots_folder(SCREENSHOTS_FOLDER)
-    
-    num_pages = get_number_of_pages()
+
+    screen = None
+    if args.replay:
+        coordinates = read_coordinates(COORDS_FILENAME)
+        screen = ReplayScreen(args.replay, left_region=get_bounding_box(coordinates[0:4]))
+        num_pages = screen.num_pages
+    else:
+        num_pages = get_number_of_pages()
+
     if not num_pages:
         print("Operation cancelled by user.")
     else:
         coordinates = read_coordinates(COORDS_FILENAME)
         if coordinates:
-            # Give the user a moment to switch to the correct window
-            print("\nYou have 5 seconds to switch to your reader window...")
-            time.sleep(5)
-            
-            take_screenshots_two_columns(coordinates, num_pages, SCREENSHOTS_FOLDER)
-            
-            print("\nNext step: Run the OCR script to extract text from the images.")
+            if screen is None:
+                # Give the user a moment to switch to the correct window
+                print("\nYou have 5 seconds to switch to your reader window...")
+                time.sleep(5)
+
+            turn_options = {'adaptive': args.fixed_delay is None}
+            if args.fixed_delay is not None:
+                turn_options['page_turn_delay'] = args.fixed_delay
+
+            if args.stream:
+                with metrics.profile('step2'), metrics.timer('step2', 'total'):
+                    take_screenshots_streaming(coordinates, num_pages, SCREENSHOTS_FOLDER, screen=screen,
+                                               num_workers=args.workers, **turn_options)
+                print("\nNext step: Mark the chapters (STEP3/STEP4); STEP5 will reuse the OCR results.")
+            else:
+                with metrics.profile('step2'), metrics.timer('step2', 'total'):
+                    take_screenshots_two_columns(coordinates, num_pages, SCREENSHOTS_FOLDER, screen=screen,
+                                                 **turn_options)
+                print("\nNext step: Run the OCR script to extract text from the images.")
 
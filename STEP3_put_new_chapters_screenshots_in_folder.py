@@ -1,30 +1,91 @@
 
 import os
+import shutil
+import argparse
+
+import metrics
 
 # --- Configuration ---
 NEW_CHAPTERS_FOLDER = 'STEP3_new_chapters_screenshots'
+SCREENSHOTS_FOLDER = 'STEP2_get_screenshots'
+
+
+def print_instructions():
+    print("\nThis script checks for screenshots of new chapter pages.")
+    print("You need to manually copy the first page of each new chapter into a specific folder.")
+
+    print(f"\nPlease perform the following steps:")
+    print(f"1. Open the '{SCREENSHOTS_FOLDER}' folder.")
+    print(f"2. Identify the screenshot corresponding to the FIRST page of each NEW chapter.")
+    print(f"3. Copy these specific screenshots.")
+    print(f"4. Paste them into the '{NEW_CHAPTERS_FOLDER}' folder.")
+
+    print("\nOnce you have copied all the necessary screenshots, you can proceed to the next step.")
+    print("Tip: run this script with --detect to have the chapter starts proposed automatically.")
+
+
+def detect_chapters(replace=False, write_manifest=False):
+    """Proposes the chapter starts from the screenshots and writes them as markers for STEP4."""
+    # Imported here so the manual mode doesn't need OpenCV
+    import chapter_detector
+
+    print(f"Scanning '{SCREENSHOTS_FOLDER}' for chapter openings...")
+    with metrics.timer('step3', 'detect'):
+        page_names, scores, starts = chapter_detector.detect_chapter_starts(SCREENSHOTS_FOLDER)
+    metrics.count('step3', 'pages', len(page_names))
+    print(f"Found {len(starts)} chapter starts in {len(page_names)} pages:")
+    for name in starts:
+        print(f"  - {name} (score {scores[page_names.index(name)]:.1f})")
+
+    if replace:
+        for filename in os.listdir(NEW_CHAPTERS_FOLDER):
+            file_path = os.path.join(NEW_CHAPTERS_FOLDER, filename)
+            if os.path.isfile(file_path) or os.path.islink(file_path):
+                os.unlink(file_path)
+
+    for name in starts:
+        destination = os.path.join(NEW_CHAPTERS_FOLDER, name)
+        if not os.path.exists(destination):
+            shutil.copy2(os.path.join(SCREENSHOTS_FOLDER, name), destination)
+    print(f"Markers written to '{NEW_CHAPTERS_FOLDER}'. Review them and remove or add pages if needed.")
+
+    if write_manifest:
+        import chapter_manifest
+        manifest, _ = chapter_manifest.build_manifest(SCREENSHOTS_FOLDER, page_names, starts)
+        chapter_manifest.save_manifest(manifest)
+        print(f"Chapter manifest written to '{chapter_manifest.MANIFEST_PATH}'.")
+
 
 def main():
     """
     Main function to check for new chapter screenshots and guide the user.
     """
-    print("--- Step 4: Manual Intervention for New Chapters ---")
-    print("\nThis script checks for screenshots of new chapter pages.")
-    print("You need to manually copy the first page of each new chapter into a specific folder.")
+    parser = argparse.ArgumentParser(description="Marks the first page of each chapter for STEP4.")
+    parser.add_argument('--detect', action='store_true',
+                        help="Detect the chapter starts automatically instead of copying them by hand.")
+    parser.add_argument('--replace', action='store_true',
+                        help="With --detect, remove the existing markers first.")
+    parser.add_argument('--manifest', action='store_true',
+                        help="With --detect, also write the chapter manifest directly (skipping STEP4).")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args, 'step3')
+
+    print("--- Step 3: New Chapter Markers ---")
 
     # Create the folder if it doesn't exist
     if not os.path.exists(NEW_CHAPTERS_FOLDER):
         os.makedirs(NEW_CHAPTERS_FOLDER)
         print(f"Created directory: '{NEW_CHAPTERS_FOLDER}'")
 
-    print(f"\nPlease perform the following steps:")
-    print(f"1. Open the 'STEP2_get_screenshots' folder.")
-    print(f"2. Identify the screenshot corresponding to the FIRST page of each NEW chapter.")
-    print(f"3. Copy these specific screenshots.")
-    print(f"4. Paste them into the '{NEW_CHAPTERS_FOLDER}' folder.")
-    
-    print("\nOnce you have copied all the necessary screenshots, you can proceed to the next step.")
-    print("Next step: Run 'STEP5_divide_screenshots_by_chapters.py' to organize the book.")
+    if args.detect:
+        with metrics.profile('step3'), metrics.timer('step3', 'total'):
+            detect_chapters(replace=args.replace, write_manifest=args.manifest)
+    else:
+        print_instructions()
+
+    print("Next step: Run 'STEP4_divide_screenshots_by_chapters.py' to organize the book.")
+
 
 if __name__ == "__main__":
     main()
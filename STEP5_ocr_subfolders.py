@@ -1,79 +1,433 @@
-import easyocr
 import os
 import sys
+import argparse
+from multiprocessing import Pool, cpu_count
+
+from PIL import Image
+
+import metrics
+import ocr_cache
+import ocr_daemon
+import ocr_layout
+import chapter_manifest
+
+# easyocr (and with it torch) and ocr_preprocess (OpenCV) are imported where they
+# are used, so --help, a run with nothing to OCR or a run attached to the OCR
+# daemon doesn't pay for loading them
 
 # Add the path to the script's directory to sys.path
 script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(script_dir)
 
-# Create an OCR reader instance
-# The model is downloaded to ~/.EasyOCR/
-reader = easyocr.Reader(['en'])  # Assuming the text is in English; change 'en' to the appropriate language code as needed
+# --- Configuration ---
+# Chapter manifest written by STEP4 (preferred over the chapter subdirectories)
+MANIFEST_PATH = chapter_manifest.MANIFEST_PATH
 
-# Base folder containing the chapter subdirectories
-base_folder = 'STEP4_screenshots_divided_by_chapters'
+# Base folder containing the chapter subdirectories, used when there is no manifest
+BASE_FOLDER = 'STEP4_screenshots_divided_by_chapters'
 
-# Output folder for the text files
-output_folder = 'STEP5_ocr'
-os.makedirs(output_folder, exist_ok=True)
+# Output folder for the text files (NN.txt) and the detections with their boxes and confidences (NN.jsonl)
+OUTPUT_FOLDER = 'STEP5_ocr'
 
-print(f"Processing subdirectories in: {base_folder}")
+# Assuming the text is in English; change 'en' to the appropriate language code as needed
+OCR_LANGUAGES = ['en']
 
-# Iterate over each item in the base folder
-for item_name in sorted(os.listdir(base_folder)):
-    item_path = os.path.join(base_folder, item_name)
+# Number of OCR worker processes. Each worker loads its own easyocr.Reader once.
+# Use 0 to run everything in this process (no pool).
+NUM_WORKERS = max(1, min(4, cpu_count() // 2))
 
-    # Check if the item is a directory
-    if os.path.isdir(item_path):
-        subfolder_path = item_path
-        print(f"--- Processing folder: {subfolder_path} ---")
+# Number of pages sent to a worker at a time (detection runs on the whole batch)
+BATCH_SIZE = 8
 
-        # Path for the output text file, named after the subfolder
-        output_file_path = os.path.join(output_folder, f"{item_name}.txt")
-        
-        # Initialize an empty string to hold all the extracted text for the current subfolder
-        extracted_text = ''
+# On-disk cache of raw detections, keyed by image content + OCR settings
+CACHE_PATH = ocr_cache.DEFAULT_CACHE_PATH
+CACHE_MAX_MB = 512
+
+# Crop, binarize and rescale each page before OCR (see ocr_preprocess.py). The
+# reader gets a much smaller image; check bench_ocr_preprocess.py on your book first.
+PREPROCESS = False
+
+# Use the OCR daemon (ocr_daemon.py) when one is running with the same settings,
+# instead of starting workers and loading the model again
+USE_DAEMON = True
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+# The reader owned by the current process (a pool worker or the main process)
+_reader = None
+_preprocess = False
+
+
+def init_reader(languages=None, gpu=True, num_threads=None, preprocess=False):
+    """Creates the easyocr.Reader for the current process. The model is downloaded to ~/.EasyOCR/"""
+    import easyocr
+
+    global _reader, _preprocess
+    _preprocess = preprocess
+    if num_threads:
+        # Avoid oversubscribing the CPU when several workers run torch at once
+        import torch
+        torch.set_num_threads(num_threads)
+    with metrics.timer('step5', 'model_load'):
+        _reader = easyocr.Reader(languages or OCR_LANGUAGES, gpu=gpu)
+    if metrics.enabled():
+        # readtext calls these two in turn; timing them splits detection from recognition
+        _reader.detect = metrics.timed('step5', 'detect', _reader.detect)
+        _reader.recognize = metrics.timed('step5', 'recognize', _reader.recognize)
+    return _reader
+
+
+def list_chapter_images(base_folder):
+    """Returns a sorted list of (chapter_name, [image paths]) for each subfolder of base_folder."""
+    chapters = []
+    for item_name in sorted(os.listdir(base_folder)):
+        item_path = os.path.join(base_folder, item_name)
+
+        # Only directories are chapters
+        if not os.path.isdir(item_path):
+            continue
 
-        # Get a sorted list of image files
         try:
-            image_files = sorted([f for f in os.listdir(subfolder_path) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))])
+            image_files = sorted([f for f in os.listdir(item_path) if f.lower().endswith(IMAGE_EXTENSIONS)])
         except FileNotFoundError:
-            print(f"Error: Subdirectory not found: {subfolder_path}")
+            print(f"Error: Subdirectory not found: {item_path}")
             continue
 
         if not image_files:
-            print(f"No image files found in {subfolder_path}")
+            print(f"No image files found in {item_path}")
             continue
 
-        # Iterate over each image file in the subfolder
-        for filename in image_files:
-            file_path = os.path.join(subfolder_path, filename)
-            print(f"  - Reading image: {filename}")
-            
-            try:
-                # Perform OCR on the image file
-                result = reader.readtext(file_path)
-                
-                # Extract text from the OCR result and append it to the extracted_text string
-                for detection in result:
-                    text = detection[1]  # The text content is at index 1
-                    extracted_text += text + ' '
-                
-                # Add a newline to separate text from different images
-                extracted_text += '\n'
+        chapters.append((item_name, [os.path.join(item_path, f) for f in image_files]))
+    return chapters
 
-            except Exception as e:
-                print(f"    Error processing file {filename}: {e}")
-        
-        # Save the extracted text to the output text file for the current subfolder
-        if extracted_text.strip():
-            print(f"  - Saving extracted text to: {output_file_path}")
+
+def _image_size(image):
+    """Size of an image file or array."""
+    if isinstance(image, str):
+        with Image.open(image) as opened:
+            return opened.size
+    return image.shape[1], image.shape[0]
+
+
+def _group_by_size(images):
+    """Groups indexes of images (files or arrays) by size, since readtext_batched needs same-sized images."""
+    groups = {}
+    for index, image in enumerate(images):
+        groups.setdefault(_image_size(image), []).append(index)
+    return groups.values()
+
+
+def _load_inputs(file_paths):
+    """
+    Returns (images, transforms) for readtext: the paths themselves, or with preprocessing
+    the cleaned arrays and the transforms that map their boxes back to the screenshots.
+    """
+    if not _preprocess:
+        return list(file_paths), [None] * len(file_paths)
+    import ocr_preprocess
+
+    prepared = [ocr_preprocess.load_and_preprocess(file_path) for file_path in file_paths]
+    return [image for image, _ in prepared], [transform for _, transform in prepared]
+
+
+def _read_one(file_path):
+    images, transforms = _load_inputs([file_path])
+    detections = _reader.readtext(images[0])
+    if transforms[0]:
+        import ocr_preprocess
+
+        detections = ocr_preprocess.to_original(detections, transforms[0])
+    return detections
+
+
+def ocr_batch(file_paths):
+    """
+    Runs OCR on a batch of image files with the reader of the current process.
+    Returns one result per file, in the same order: the raw readtext detections,
+    or None if the file could not be processed. Boxes are always in screenshot
+    coordinates, with or without preprocessing.
+    """
+    results = [None] * len(file_paths)
+    if metrics.enabled():
+        metrics.count('step5', 'pages_read', len(file_paths))
+        metrics.count('step5', 'bytes_read', sum(metrics.file_size(file_path) for file_path in file_paths))
+    try:
+        with metrics.timer('step5', 'load_images'):
+            images, transforms = _load_inputs(file_paths)
+        for indexes in _group_by_size(images):
+            group = [images[i] for i in indexes]
+            with metrics.timer('step5', 'readtext', item=f"{len(group)} images"):
+                if len(group) == 1:
+                    batch_result = [_reader.readtext(group[0])]
+                else:
+                    batch_result = _reader.readtext_batched(group)
+            for i, detections in zip(indexes, batch_result):
+                if transforms[i]:
+                    import ocr_preprocess
+
+                    detections = ocr_preprocess.to_original(detections, transforms[i])
+                results[i] = detections
+    except Exception as e:
+        # Fall back to one file at a time so a single bad image doesn't lose the whole batch
+        print(f"    Batch failed ({e}), retrying one image at a time...")
+        for i, file_path in enumerate(file_paths):
+            if results[i] is not None:
+                continue
             try:
-                with open(output_file_path, 'w', encoding='utf-8') as file:
-                    file.write(extracted_text.strip())
-            except IOError as e:
-                print(f"    Error writing to file {output_file_path}: {e}")
+                results[i] = _read_one(file_path)
+            except Exception as e:
+                print(f"    Error processing file {os.path.basename(file_path)}: {e}")
+    return results
+
+
+def _make_batches(items, batch_size):
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def start_pool(num_workers=NUM_WORKERS, languages=None, preprocess=PREPROCESS):
+    """Starts num_workers OCR processes, each holding a single easyocr.Reader until the pool is closed."""
+    # Share the CPU cores between the workers
+    threads_per_worker = max(1, cpu_count() // num_workers)
+    return Pool(processes=num_workers, initializer=init_reader,
+                initargs=(languages or OCR_LANGUAGES, True, threads_per_worker, preprocess))
+
+
+def _read_batches(pool, batches):
+    # imap keeps the batches in submission order
+    for batch, batch_result in zip(batches, pool.imap(ocr_batch, batches)):
+        print(f"  - Read images: {', '.join(os.path.basename(p) for p in batch)}")
+        yield from batch_result
+
+
+def iter_ocr_pages(file_paths, num_workers=NUM_WORKERS, batch_size=BATCH_SIZE, languages=None,
+                   preprocess=PREPROCESS, pool=None):
+    """
+    OCRs all file_paths and yields their detections in the same order, as soon as each batch is done.
+    Pages are sent in batches to a pool of num_workers processes, each one
+    holding a single easyocr.Reader for the whole run. An already running pool
+    (see start_pool, or anything with the same imap) can be given instead, so
+    its workers stay warm across calls; its languages and preprocessing apply.
+    """
+    languages = languages or OCR_LANGUAGES
+    batches = _make_batches(list(file_paths), max(1, batch_size))
+
+    if pool is not None:
+        yield from _read_batches(pool, batches)
+        return
+
+    if num_workers <= 0:
+        global _preprocess
+        _preprocess = preprocess
+        if _reader is None:
+            init_reader(languages, preprocess=preprocess)
+        for batch in batches:
+            print(f"  - Reading images: {', '.join(os.path.basename(p) for p in batch)}")
+            yield from ocr_batch(batch)
+        return
+
+    with start_pool(num_workers, languages, preprocess) as pool:
+        yield from _read_batches(pool, batches)
+
+
+def ocr_pages(file_paths, num_workers=NUM_WORKERS, batch_size=BATCH_SIZE, languages=None, preprocess=PREPROCESS):
+    """OCRs all file_paths and returns their detections in the same order."""
+    return list(iter_ocr_pages(file_paths, num_workers, batch_size, languages, preprocess))
+
+
+def easyocr_version():
+    # From the package metadata: importing easyocr just for its version would load torch
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version('easyocr')
+    except importlib.metadata.PackageNotFoundError:
+        import easyocr
+        return easyocr.__version__
+
+
+def ocr_settings(languages=None, preprocess=PREPROCESS):
+    """The settings that change the OCR output; they are part of the cache key."""
+    settings = {
+        'engine': 'easyocr',
+        'version': easyocr_version(),
+        'languages': list(languages or OCR_LANGUAGES),
+    }
+    if preprocess:
+        import ocr_preprocess
+
+        settings['preprocess'] = ocr_preprocess.settings()
+    return settings
+
+
+def iter_ocr_pages_cached(file_paths, cache, num_workers=NUM_WORKERS, batch_size=BATCH_SIZE, languages=None,
+                          preprocess=PREPROCESS, pool=None):
+    """
+    Same as iter_ocr_pages, but pages whose content was already OCR'd with the same
+    settings are served from the cache. Identical images (e.g. the same page
+    copied into two chapter folders) are only read once.
+    """
+    settings = ocr_settings(languages, preprocess)
+    keys = [ocr_cache.image_key(file_path, settings) for file_path in file_paths]
+
+    detections_by_key = {}
+    to_read = {}  # key -> path of the first page with that content
+    for file_path, key in zip(file_paths, keys):
+        if key in detections_by_key or key in to_read:
+            continue
+        detections = cache.get(key)
+        if detections is None:
+            to_read[key] = file_path
         else:
-            print(f"  - No text was extracted from the images in {subfolder_path}")
+            detections_by_key[key] = detections
+
+    print(f"OCR cache: {len(detections_by_key)} pages found, {len(to_read)} pages to read.")
+    metrics.count('step5', 'cache_hits', len(detections_by_key))
+    metrics.count('step5', 'cache_misses', len(to_read))
+    fresh = iter_ocr_pages(list(to_read.values()), num_workers=num_workers,
+                           batch_size=batch_size, languages=languages,
+                           preprocess=preprocess, pool=pool) if to_read else iter(())
+
+    # The pages to read come out in page order, so each one is ready by the time it is needed
+    for key in keys:
+        if key not in detections_by_key:
+            detections = next(fresh)
+            detections_by_key[key] = detections
+            if detections is not None:
+                cache.put(key, detections)
+        yield detections_by_key[key]
+
+
+def ocr_pages_cached(file_paths, cache, num_workers=NUM_WORKERS, batch_size=BATCH_SIZE, languages=None,
+                     preprocess=PREPROCESS):
+    return list(iter_ocr_pages_cached(file_paths, cache, num_workers, batch_size, languages, preprocess))
+
+
+def save_chapter_text(output_file_path, text, source_folder):
+    # Save the extracted text to the output text file for the current subfolder
+    if text.strip():
+        print(f"  - Saving extracted text to: {output_file_path}")
+        try:
+            with open(output_file_path, 'w', encoding='utf-8') as file:
+                file.write(text.strip())
+        except IOError as e:
+            print(f"    Error writing to file {output_file_path}: {e}")
+    else:
+        print(f"  - No text was extracted from the images in {source_folder}")
+
+
+def load_chapters(manifest_path=MANIFEST_PATH, base_folder=BASE_FOLDER):
+    """Returns (chapter_name, [image paths]) for each chapter, from the manifest or the chapter folders."""
+    manifest = chapter_manifest.load_manifest(manifest_path)
+    if manifest is not None:
+        print(f"Processing chapters listed in: {manifest_path}")
+        return chapter_manifest.chapter_page_paths(manifest, manifest_path)
+    if not os.path.isdir(base_folder):
+        print(f"No chapter manifest ('{manifest_path}') and no folder '{base_folder}'.")
+        return []
+    print(f"Processing subdirectories in: {base_folder}")
+    return list_chapter_images(base_folder)
+
+
+def ocr_chapters(chapters, output_folder=OUTPUT_FOLDER, num_workers=NUM_WORKERS, batch_size=BATCH_SIZE,
+                 cache=None, on_chapter_done=None, preprocess=PREPROCESS, pool=None):
+    """
+    OCRs the pages of all chapters in one run, so the workers stay busy across chapter
+    boundaries. The detections of each page are appended to the chapter's .jsonl as
+    soon as they are read; the chapter .txt is derived from them after its last page.
+    on_chapter_done(chapter_name, output_file_path) is called after each chapter is saved.
+    pool is an optional running pool to use instead of starting one (see iter_ocr_pages).
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    all_pages = [path for _, paths in chapters for path in paths]
+    print(f"Found {len(all_pages)} images in {len(chapters)} chapters "
+          f"({num_workers} workers, batches of {batch_size}).")
+    if cache is not None:
+        results = iter_ocr_pages_cached(all_pages, cache, num_workers=num_workers, batch_size=batch_size,
+                                        preprocess=preprocess, pool=pool)
+    else:
+        results = iter_ocr_pages(all_pages, num_workers=num_workers, batch_size=batch_size, preprocess=preprocess,
+                                 pool=pool)
+
+    # Split the results back into chapters, keeping the page order
+    for item_name, paths in chapters:
+        with ocr_layout.ChapterRecordWriter(os.path.join(output_folder, f"{item_name}.jsonl")) as writer:
+            for path in paths:
+                detections = next(results)
+                if detections is not None:
+                    writer.add_page(os.path.basename(path), detections)
+
+        print(f"--- Saving chapter: {item_name} ---")
+        output_file_path = os.path.join(output_folder, f"{item_name}.txt")
+        save_chapter_text(output_file_path, ocr_layout.records_to_text(writer.records), f"chapter {item_name}")
+        metrics.count('step5', 'bytes_written', metrics.file_size(writer.path) + metrics.file_size(output_file_path))
+        if on_chapter_done:
+            on_chapter_done(item_name, output_file_path)
+
+
+def rebuild_text(output_folder=OUTPUT_FOLDER):
+    """Derives every chapter .txt again from its .jsonl records, without any OCR."""
+    for file_name in sorted(os.listdir(output_folder)):
+        if file_name.endswith('.jsonl'):
+            name = file_name[:-len('.jsonl')]
+            records = ocr_layout.read_records(os.path.join(output_folder, file_name))
+            save_chapter_text(os.path.join(output_folder, f"{name}.txt"), ocr_layout.records_to_text(records),
+                              f"chapter {name}")
+
+
+def main(manifest_path=MANIFEST_PATH, base_folder=BASE_FOLDER, output_folder=OUTPUT_FOLDER,
+         num_workers=NUM_WORKERS, batch_size=BATCH_SIZE, use_cache=True, cache_path=CACHE_PATH,
+         cache_max_mb=CACHE_MAX_MB, preprocess=PREPROCESS, use_daemon=USE_DAEMON):
+    chapters = load_chapters(manifest_path, base_folder)
+    metrics.count('step5', 'chapters', len(chapters))
+    if not any(paths for _, paths in chapters):
+        print("Nothing to do: there are no chapter pages to OCR.")
+        return
+
+    pool = ocr_daemon.connect(ocr_settings(preprocess=preprocess)) if use_daemon else None
+    if pool is not None:
+        print(f"Using the OCR daemon ({pool.workers} workers).")
+    try:
+        if use_cache:
+            with ocr_cache.OCRCache(cache_path, max_bytes=cache_max_mb * 1024 * 1024) as cache:
+                ocr_chapters(chapters, output_folder, num_workers, batch_size, cache=cache, preprocess=preprocess,
+                             pool=pool)
+        else:
+            ocr_chapters(chapters, output_folder, num_workers, batch_size, preprocess=preprocess, pool=pool)
+    finally:
+        if pool is not None:
+            pool.close()
+
+    print("\nText extraction for all subfolders completed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extracts the text of each chapter folder with easyocr.")
+    parser.add_argument('--manifest', default=MANIFEST_PATH,
+                        help="Chapter manifest written by STEP4; falls back to the chapter folders if missing.")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS,
+                        help="Number of OCR worker processes (0 = run in this process).")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="Number of pages sent to a worker at a time.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="OCR every page again instead of reusing cached results.")
+    parser.add_argument('--cache-max-mb', type=int, default=CACHE_MAX_MB,
+                        help="Size cap of the OCR cache; least recently used pages are evicted first.")
+    parser.add_argument('--preprocess', action='store_true', default=PREPROCESS,
+                        help="Crop, binarize and rescale the pages before OCR (faster, check the accuracy first).")
+    parser.add_argument('--no-daemon', action='store_true',
+                        help="Start a worker pool even if the OCR daemon (ocr_daemon.py) is running.")
+    parser.add_argument('--rebuild-text', action='store_true',
+                        help="Only derive the .txt files again from the .jsonl records (no OCR).")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args, 'step5')
+
+    if args.rebuild_text:
+        rebuild_text()
+        sys.exit(0)
 
-print("\nText extraction for all subfolders completed.")
+    with metrics.profile('step5'), metrics.timer('step5', 'total'):
+        main(manifest_path=args.manifest, num_workers=args.workers, batch_size=args.batch_size,
+             use_cache=not args.no_cache, cache_max_mb=args.cache_max_mb, preprocess=args.preprocess,
+             use_daemon=USE_DAEMON and not args.no_daemon)
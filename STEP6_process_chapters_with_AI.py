@@ -1,96 +1,440 @@
 
 import os
 import glob
-import google.generativeai as genai
 import sys
+import time
+import asyncio
+import argparse
+from collections import namedtuple
 
-def main():
+import chapter_manifest
+import chunking
+import llm_client
+import metrics
+import ocr_layout
+import response_cache
+import selective_correction
+import text_normalizer
+
+# --- Configuration ---
+# Model backend: 'gemini', 'openai' (any OpenAI-compatible endpoint, e.g. a local
+# llama.cpp/vLLM server via OPENAI_BASE_URL) or 'stub' (local fake model, no network)
+BACKEND = 'gemini'
+BACKENDS = ('gemini', 'openai', 'stub')
+
+MODEL_NAME = "gemini-2.5-flash-lite"
+OPENAI_MODEL = "gpt-4o-mini"
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
+
+# Batch mode: all requests are submitted as one batch job (cheaper, but the results
+# may take hours). Only the 'openai' and 'stub' backends have one.
+BATCH = False
+
+# Number of chapters sent to the model at the same time
+CONCURRENCY = 4
+
+# Limits of the API plan (None = unlimited)
+REQUESTS_PER_MINUTE = 15
+TOKENS_PER_MINUTE = 250000
+
+# Token budget of each request; longer chapters are split into chunks processed in parallel
+# (0 = always send the whole chapter in one request)
+CHUNK_TOKENS = 2000
+
+# Retries for transient errors (429, 500, 503...), with exponential backoff and jitter
+MAX_RETRIES = 5
+
+# Local cache of the model answers: identical requests are never paid twice
+# (TTL in days, 0 = answers never expire)
+CACHE_PATH = response_cache.DEFAULT_CACHE_PATH
+CACHE_MAX_MB = 256
+CACHE_TTL_DAYS = 0
+
+# Rule-based clean-up of the OCR text before it is sent (see text_normalizer.py):
+# hyphenation, spacing, ligatures, running headers. Shrinks what the model has to fix.
+NORMALIZE = True
+
+# Selective mode: only the lines easyocr read with low confidence (from the STEP5 .jsonl)
+# are sent to the model; the rest of the chapter is kept as OCR'd
+SELECTIVE = False
+MIN_CONFIDENCE = selective_correction.CONFIDENCE_THRESHOLD
+
+# The requests of one chapter: their prompts, the original text of each one, and
+# assemble(answers) that builds the chapter. Selective chapters keep the OCR text
+# of a span when the model gives no answer.
+ChapterPlan = namedtuple('ChapterPlan', ['prompts', 'originals', 'assemble', 'selective'])
+
+
+def build_prompt(file_content):
+    """Constructs the correction prompt for the text of one chapter."""
+    return (
+        "Corrija a pontuação, a gramática e a ortografia deste texto extraído por OCR. "
+        "Organize-o em parágrafos coerentes e aplique formatação básica, como títulos (se houver) "
+        "e listas, para melhorar a leitura. "
+        "O output deve conter apenas o texto corrigido, sem nenhum comentário adicional. "
+        "Texto: \n\n"
+        f'"""{file_content}"""'
+    )
+
+
+def build_chunk_prompt(chunk):
+    """Constructs the prompt for one chunk of a chapter, with its neighbours as read-only context."""
+    if not chunk.context_before and not chunk.context_after:
+        return build_prompt(chunk.body)
+
+    context = ""
+    if chunk.context_before:
+        context += f"Trecho anterior (apenas contexto, não inclua no output):\n<<<{chunk.context_before}>>>\n\n"
+    if chunk.context_after:
+        context += f"Trecho seguinte (apenas contexto, não inclua no output):\n<<<{chunk.context_after}>>>\n\n"
+    return (
+        "Corrija a pontuação, a gramática e a ortografia deste trecho de um texto extraído por OCR. "
+        "Organize-o em parágrafos coerentes e aplique formatação básica, como títulos (se houver) "
+        "e listas, para melhorar a leitura. "
+        "O trecho é parte de um capítulo maior: corrija somente o texto entre aspas triplas, sem completar "
+        "frases cortadas no início ou no fim. "
+        "O output deve conter apenas o texto corrigido, sem nenhum comentário adicional. "
+        f"{context}"
+        "Texto: \n\n"
+        f'"""{chunk.body}"""'
+    )
+
+
+def build_spans_prompt(spans):
+    """Constructs the prompt for the numbered low-confidence spans of a chapter, with their neighbouring lines as context."""
+    context = "\n".join(
+        f"[[{number}]] antes: <<<{span.context_before}>>> depois: <<<{span.context_after}>>>"
+        for number, span in enumerate(spans, start=1)
+    )
+    return (
+        "Corrija os erros de OCR (ortografia, acentuação e pontuação) destes trechos numerados de um texto "
+        "extraído por OCR. Cada trecho é parte de um parágrafo maior: corrija somente o texto de cada trecho, "
+        "sem completar frases cortadas no início ou no fim e sem mudar a formatação. "
+        "O output deve conter apenas os trechos corrigidos, um por linha, cada um com o seu número no "
+        "formato [[N]], sem nenhum comentário adicional. "
+        "Linhas vizinhas de cada trecho (apenas contexto, não inclua no output):\n"
+        f"{context}\n\n"
+        "Texto: \n\n"
+        f'"""{selective_correction.numbered(span.text for span in spans)}"""'
+    )
+
+
+def plan_chapter(file_path, content, chunk_tokens=CHUNK_TOKENS, selective=SELECTIVE, min_confidence=MIN_CONFIDENCE,
+                 normalizer=None):
     """
-    Reads all .txt files from the pos_OCR directory, sends their content to the
-    Gemini API for correction, and saves the output to the pos_IA directory.
+    Returns the ChapterPlan of one chapter: its chunks in full mode, or in selective
+    mode its low-confidence spans packed into requests of at most chunk_tokens
+    (falling back to full mode without a STEP5 .jsonl). A normalizer removes the
+    running headers from the records first.
     """
-    try:
-        # Get the API key from the environment variable
-        api_key = os.environ.get("GOOGLE_API_KEY")
-        if not api_key:
-            print("Erro: A variável de ambiente GOOGLE_API_KEY não foi definida.")
-            print("Por favor, defina a chave da API antes de executar o script.")
-            sys.exit(1)
+    records_path = os.path.splitext(file_path)[0] + '.jsonl'
+    if selective and os.path.isfile(records_path):
+        records = list(ocr_layout.read_records(records_path))
+        if normalizer is not None:
+            records = normalizer.strip_headers(records)
+        paragraphs = selective_correction.paragraph_lines(records)
+        spans = selective_correction.find_spans(paragraphs, min_confidence)
+        groups = selective_correction.pack_spans(spans, chunk_tokens)
 
-        genai.configure(api_key=api_key)
+        def assemble(answers):
+            corrected = [None] * len(spans)
+            for group, answer in zip(groups, answers):
+                if answer is not None:
+                    for i, text in zip(group, selective_correction.parse_numbered(answer, len(group))):
+                        corrected[i] = text
+            return selective_correction.splice(paragraphs, spans, corrected)
 
-        # Define input and output directories relative to the script's location
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        input_dir = os.path.join(script_dir, "STEP5_ocr")
-        output_dir = os.path.join(script_dir, "STEP6_pos_IA")
+        return ChapterPlan([build_spans_prompt([spans[i] for i in group]) for group in groups],
+                           [selective_correction.numbered(spans[i].text for i in group) for group in groups],
+                           assemble, True)
+    if selective:
+        print(f"Aviso: '{records_path}' não existe; o capítulo será enviado inteiro.")
 
-        # Create the output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
+    if chunk_tokens:
+        chunks = chunking.make_chunks(content, chunk_tokens)
+    else:
+        chunks = [chunking.Chunk('', content, '')]
+    return ChapterPlan([build_chunk_prompt(chunk) for chunk in chunks], [chunk.body for chunk in chunks],
+                       chunking.stitch, False)
 
-        # Find all .txt files in the input directory and its subdirectories
-        file_paths = glob.glob(os.path.join(input_dir, '**', '*.txt'), recursive=True)
 
-        if not file_paths:
-            print(f"Nenhum arquivo .txt encontrado no diretório '{input_dir}'.")
+def find_input_files(script_dir, input_dir):
+    """Returns the chapter .txt files to process, in chapter order."""
+    # Process the chapters listed in the STEP4 manifest, in chapter order
+    manifest = chapter_manifest.load_manifest(os.path.join(script_dir, chapter_manifest.MANIFEST_PATH))
+    if manifest is None:
+        # Without a manifest, find all .txt files in the input directory and its subdirectories
+        return sorted(glob.glob(os.path.join(input_dir, '**', '*.txt'), recursive=True))
+
+    file_paths = []
+    for name in chapter_manifest.chapter_names(manifest):
+        file_path = os.path.join(input_dir, f"{name}.txt")
+        if os.path.isfile(file_path):
+            file_paths.append(file_path)
+        else:
+            print(f"Aviso: O capítulo {name} não tem texto de OCR em '{input_dir}'.")
+    return file_paths
+
+
+def write_output(file_path, input_dir, output_dir, text):
+    # Construct the output file path, preserving subdirectories
+    relative_path = os.path.relpath(file_path, input_dir)
+    output_file_path = os.path.join(output_dir, relative_path)
+
+    # Create subdirectory in output_dir if it doesn't exist
+    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+
+    # Write the corrected text to the output file
+    with open(output_file_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return output_file_path
+
+
+async def process_files(file_paths, input_dir, output_dir, generate, concurrency=CONCURRENCY,
+                        requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                        max_retries=MAX_RETRIES, chunk_tokens=CHUNK_TOKENS, on_chapter_done=None,
+                        selective=SELECTIVE, min_confidence=MIN_CONFIDENCE, cache=None, normalizer=None,
+                        limiter=None):
+    """
+    Sends every file to the model concurrently, split into chunks of at most chunk_tokens
+    (or, in selective mode, only its low-confidence spans). Each chapter is assembled and
+    written as soon as its last answer arrives, then on_chapter_done(file_path, output_file_path)
+    is called. A chapter with a part the model answered without text is still written (with an
+    error marker in that part) but counts as failed, without on_chapter_done, so it is retried.
+    Answers found in the cache (a response_cache.ResponseCache) are not requested again.
+    With a normalizer (a fitted text_normalizer.TextNormalizer), the text is cleaned up
+    before it is sent (selective mode: after the corrections are spliced in).
+    A limiter (llm_client.RateLimiter) shared between calls keeps their combined rate
+    within the limits; by default one is made from requests/tokens_per_minute.
+    Returns (number of failed chapters, {file_path: seconds until the chapter was written}).
+    """
+    contents = {}
+    plans = {}
+    original_size = 0
+    for file_path in file_paths:
+        # Read the content of the input file
+        with open(file_path, 'r', encoding='utf-8') as f:
+            contents[file_path] = f.read()
+        original_size += len(contents[file_path])
+        if normalizer is not None:
+            contents[file_path] = normalizer.normalize_chapter(contents[file_path],
+                                                               text_normalizer.chapter_records(file_path))
+        plans[file_path] = plan_chapter(file_path, contents[file_path], chunk_tokens, selective, min_confidence,
+                                        normalizer)
+    if normalizer is not None and not selective:
+        print(f"Normalização: {original_size} -> {sum(len(text) for text in contents.values())} caracteres.")
+
+    corrected = {file_path: [None] * len(plans[file_path].prompts) for file_path in file_paths}
+    pending = {file_path: len(plans[file_path].prompts) for file_path in file_paths}
+    failed = set()
+    # Chapters written with an error marker for a part the model didn't answer
+    incomplete = set()
+    latencies = {}
+    start = time.perf_counter()
+
+    def on_result(key, corrected_text, error):
+        file_path, index = key
+        plan = plans[file_path]
+        if isinstance(error, llm_client.EmptyResponseError):
+            # Handle cases where the response might be blocked or empty
+            print(f"Não foi possível obter o texto corrigido para {file_path}. {error}")
+            incomplete.add(file_path)
+            if plan.selective:
+                corrected_text = None
+            elif len(plan.prompts) == 1:
+                corrected_text = f"### ERRO AO PROCESSAR O ARQUIVO ###\n\n{contents[file_path]}"
+            else:
+                corrected_text = f"### ERRO AO PROCESSAR O TRECHO ###\n\n{plan.originals[index]}"
+        elif error is not None:
+            print(f"Ocorreu um erro ao processar o arquivo {file_path}: {error}")
+            failed.add(file_path)
+
+        corrected[file_path][index] = corrected_text
+        pending[file_path] -= 1
+        if not pending[file_path] and file_path not in failed:
+            finish(file_path)
+
+    def finish(file_path):
+        try:
+            text = plans[file_path].assemble(corrected[file_path])
+            if normalizer is not None and plans[file_path].selective:
+                text = normalizer.normalize(text)
+            output_file_path = write_output(file_path, input_dir, output_dir, text)
+            latencies[file_path] = time.perf_counter() - start
+            metrics.emit('step6', 'timer', 'chapter_latency', round(latencies[file_path], 6), file_path)
+            print(f"Processado e salvo com sucesso em: {output_file_path}")
+        except OSError as e:
+            print(f"Ocorreu um erro ao salvar o arquivo {file_path}: {e}")
+            failed.add(file_path)
+            return
+        if file_path in incomplete:
+            failed.add(file_path)
             return
+        if on_chapter_done:
+            on_chapter_done(file_path, output_file_path)
 
-        print(f"Encontrados {len(file_paths)} arquivos para processar.")
+    def on_retry(key, attempt, delay, error):
+        print(f"Tentativa {attempt} para {key[0]} (trecho {key[1] + 1}) em {delay:.1f}s ({error})")
 
-        # Set up the model
-        model = genai.GenerativeModel(model_name="gemini-2.5-flash-lite")
+    limiter = limiter or llm_client.RateLimiter(requests_per_minute, tokens_per_minute)
+    items = [((file_path, index), prompt)
+             for file_path in file_paths for index, prompt in enumerate(plans[file_path].prompts)]
+    if selective:
+        print(f"{len(items)} requisições com os trechos de confiança abaixo de {min_confidence} "
+              f"em {len(file_paths)} capítulos.")
+    elif len(items) > len(file_paths):
+        print(f"{len(file_paths)} capítulos divididos em {len(items)} trechos de até {chunk_tokens} tokens.")
+    print(f"Tokens enviados (estimativa): {sum(llm_client.estimate_tokens(prompt) for _, prompt in items)}")
+    repeated = len(items) - len({prompt for _, prompt in items})
+    if repeated:
+        print(f"{repeated} requisições idênticas serão feitas uma única vez.")
 
-        # Process each file
-        for file_path in file_paths:
-            try:
-                print(f"Processando arquivo: {file_path}")
+    # Chapters without anything to correct are written right away
+    for file_path in file_paths:
+        if not pending[file_path]:
+            finish(file_path)
+    if hasattr(generate, 'run'):
+        # Batch backend: one job for everything, results when it ends
+        await llm_client.process_batch(items, generate, on_result, cache=cache)
+    else:
+        await llm_client.process_all(items, generate, on_result, concurrency=concurrency, limiter=limiter,
+                                     max_retries=max_retries, on_retry=on_retry, cache=cache)
+    return len(failed), latencies
 
-                # Read the content of the input file
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    file_content = f.read()
 
-                # Construct the prompt
-                prompt = (
-                    "Corrija a pontuação, a gramática e a ortografia deste texto extraído por OCR. "
-                    "Organize-o em parágrafos coerentes e aplique formatação básica, como títulos (se houver) "
-                    "e listas, para melhorar a leitura. "
-                    "O output deve conter apenas o texto corrigido, sem nenhum comentário adicional. "
-                    "Texto: \n\n"
-                    f'"""{file_content}"""'
-                )
+def make_gemini_generator(model_name=MODEL_NAME):
+    import google.generativeai as genai
 
-                # Call the Gemini API
-                response = model.generate_content(prompt)
-                
-                # Check if the response has text
-                if hasattr(response, 'text'):
-                    corrected_text = response.text
-                else:
-                    # Handle cases where the response might be blocked or empty
-                    print(f"Não foi possível obter o texto corrigido para {file_path}. Resposta: {response.prompt_feedback}")
-                    # Optionally, write the original content or a placeholder
-                    corrected_text = f"### ERRO AO PROCESSAR O ARQUIVO ###\n\n{file_content}"
+    # Get the API key from the environment variable
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        print("Erro: A variável de ambiente GOOGLE_API_KEY não foi definida.")
+        print("Por favor, defina a chave da API antes de executar o script.")
+        sys.exit(1)
 
+    genai.configure(api_key=api_key)
 
-                # Construct the output file path, preserving subdirectories
-                relative_path = os.path.relpath(file_path, input_dir)
-                output_file_path = os.path.join(output_dir, relative_path)
+    # Set up the model
+    return llm_client.GeminiGenerator(genai.GenerativeModel(model_name=model_name))
 
-                # Create subdirectory in output_dir if it doesn't exist
-                os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
 
-                # Write the corrected text to the output file
-                with open(output_file_path, 'w', encoding='utf-8') as f:
-                    f.write(corrected_text)
+def make_generator(backend=BACKEND, model=None, base_url=None, batch=BATCH, stub_latency=0.5):
+    """Returns the model backend: an async generate(prompt), or a batch runner when batch is set."""
+    if backend == 'stub':
+        # Local fake model: no network calls, used to test the pipeline and measure throughput
+        return llm_client.StubBatchRunner(stub_latency) if batch else llm_client.StubGenerator(latency=stub_latency)
+    if backend == 'openai':
+        model = model or OPENAI_MODEL
+        base_url = base_url or OPENAI_BASE_URL
+        if batch:
+            return llm_client.OpenAIBatchRunner(model, base_url)
+        return llm_client.OpenAIGenerator(model, base_url)
+    if backend == 'gemini':
+        if batch:
+            print("Aviso: o google-generativeai não tem API de lotes; as requisições serão feitas uma a uma.")
+        return make_gemini_generator(model or MODEL_NAME)
+    raise ValueError(f"Backend desconhecido '{backend}', use um de {BACKENDS}")
 
-                print(f"Processado e salvo com sucesso em: {output_file_path}")
 
-            except Exception as e:
-                print(f"Ocorreu um erro ao processar o arquivo {file_path}: {e}")
+def open_cache(name, cache_path=CACHE_PATH, cache_max_mb=CACHE_MAX_MB, cache_ttl_days=CACHE_TTL_DAYS):
+    """The response cache of the model in use (name of the backend's model, e.g. generate.name)."""
+    return response_cache.ResponseCache(name, cache_path,
+                                        max_bytes=cache_max_mb * 1024 * 1024,
+                                        ttl=cache_ttl_days * 24 * 3600 if cache_ttl_days else None)
 
-        print("\nProcessamento concluído.")
+
+def main(concurrency=CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+         stub_latency=None, output_dir=None, chunk_tokens=CHUNK_TOKENS, selective=SELECTIVE,
+         min_confidence=MIN_CONFIDENCE, use_cache=True, cache_ttl_days=CACHE_TTL_DAYS, backend=BACKEND,
+         model=None, base_url=None, batch=BATCH, normalize=NORMALIZE):
+    """
+    Reads all .txt files from the pos_OCR directory, sends their content to the
+    model backend for correction, and saves the output to the pos_IA directory.
+    """
+    try:
+        # Define input and output directories relative to the script's location
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        input_dir = os.path.join(script_dir, "STEP5_ocr")
+        output_dir = output_dir or os.path.join(script_dir, "STEP6_pos_IA")
+
+        # Create the output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+
+        file_paths = find_input_files(script_dir, input_dir)
+
+        if not file_paths:
+            print(f"Nenhum arquivo .txt encontrado no diretório '{input_dir}'.")
+            return
+
+        print(f"Encontrados {len(file_paths)} arquivos para processar.")
+
+        if stub_latency is not None:
+            backend = 'stub'
+        generate = make_generator(backend, model, base_url, batch,
+                                  stub_latency=stub_latency if stub_latency is not None else 0.5)
+
+        with metrics.timer('step6', 'normalizer_fit'):
+            normalizer = text_normalizer.fit_book(file_paths)[0] if normalize else None
+        cache = open_cache(generate.name, os.path.join(script_dir, CACHE_PATH),
+                           cache_ttl_days=cache_ttl_days) if use_cache else None
+        start = time.perf_counter()
+        try:
+            failures, latencies = asyncio.run(process_files(file_paths, input_dir, output_dir, generate, concurrency,
+                                                            requests_per_minute, tokens_per_minute,
+                                                            chunk_tokens=chunk_tokens, selective=selective,
+                                                            min_confidence=min_confidence, cache=cache,
+                                                            normalizer=normalizer))
+        finally:
+            if cache is not None:
+                cache.close()
+        elapsed = time.perf_counter() - start
+
+        print(f"\nProcessamento concluído em {elapsed:.1f}s ({len(file_paths) - failures} ok, {failures} com erro).")
+        if cache is not None:
+            print(f"Cache de respostas: {cache.hits} acertos, {cache.misses} faltas.")
+        for file_path, latency in sorted(latencies.items()):
+            print(f"  {os.path.relpath(file_path, input_dir)}: {latency:.1f}s")
 
     except Exception as e:
         print(f"Ocorreu um erro inesperado: {e}")
 
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Corrige o texto de cada capítulo com um modelo de linguagem.")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help="Número de capítulos enviados ao modelo ao mesmo tempo.")
+    parser.add_argument('--rpm', type=int, default=REQUESTS_PER_MINUTE,
+                        help="Limite de requisições por minuto (0 = sem limite).")
+    parser.add_argument('--tpm', type=int, default=TOKENS_PER_MINUTE,
+                        help="Limite de tokens por minuto (0 = sem limite).")
+    parser.add_argument('--chunk-tokens', type=int, default=CHUNK_TOKENS,
+                        help="Tamanho máximo de cada requisição em tokens (0 = capítulo inteiro).")
+    parser.add_argument('--backend', choices=BACKENDS, default=BACKEND,
+                        help="Gemini, um servidor compatível com a API da OpenAI ou o modelo falso local.")
+    parser.add_argument('--model', help=f"Modelo (padrão: {MODEL_NAME} no Gemini, {OPENAI_MODEL} na OpenAI).")
+    parser.add_argument('--base-url', help="URL do servidor compatível com a OpenAI (ex.: http://localhost:8080/v1).")
+    parser.add_argument('--batch', action='store_true', default=BATCH,
+                        help="Envia todas as requisições num único lote (API de lotes, mais barata e mais lenta).")
+    parser.add_argument('--stub', type=float, metavar='LATENCIA',
+                        help="Usa um modelo falso local com a latência indicada (em segundos), sem chamar a API.")
+    parser.add_argument('--output', help="Diretório de saída (padrão: STEP6_pos_IA).")
+    parser.add_argument('--selective', action='store_true', default=SELECTIVE,
+                        help="Envia ao modelo apenas as linhas com baixa confiança do OCR (requer os .jsonl do STEP5).")
+    parser.add_argument('--min-confidence', type=float, default=MIN_CONFIDENCE,
+                        help="Linhas com alguma palavra abaixo desta confiança são corrigidas no modo seletivo.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Chama o modelo mesmo para requisições já respondidas antes.")
+    parser.add_argument('--cache-ttl-days', type=int, default=CACHE_TTL_DAYS,
+                        help="Respostas no cache mais antigas que isto são pedidas de novo (0 = nunca expiram).")
+    parser.add_argument('--no-normalize', action='store_true',
+                        help="Envia o texto do OCR sem a limpeza automática (hifenização, espaços, cabeçalhos).")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    if args.chunk_tokens and args.chunk_tokens < chunking.MIN_CHUNK_TOKENS:
+        parser.error(f"--chunk-tokens deve ser 0 ou pelo menos {chunking.MIN_CHUNK_TOKENS}.")
+    metrics.setup(args, 'step6')
+
+    with metrics.profile('step6'), metrics.timer('step6', 'total'):
+        main(args.concurrency, args.rpm, args.tpm, args.stub, args.output, args.chunk_tokens, args.selective,
+             args.min_confidence, not args.no_cache, args.cache_ttl_days, args.backend, args.model, args.base_url,
+             args.batch, not args.no_normalize)
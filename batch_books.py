@@ -0,0 +1,224 @@
+import os
+import sys
+import asyncio
+import argparse
+import threading
+
+import metrics
+import pipeline
+import STEP4_divide_screenshots_by_chapters as step4
+from job_queue import FairJobQueue
+
+# Runs STEP4 -> STEP5 -> STEP6 on every book of a directory in one run:
+#   books/<name>/STEP2_get_screenshots/           the screenshots, as STEP2 saves them
+#   books/<name>/STEP3_new_chapters_screenshots/  the chapter markers (or an existing STEP4_chapters.json)
+# Each book folder (or <output>/<name> with --output) is the book's workspace,
+# with its own STEP4_chapters.json, STEP5_ocr/, STEP6_pos_IA/ and pipeline state,
+# and goes through the same stage functions as pipeline.py, so a re-run only
+# redoes what changed.
+# One pool of OCR workers serves the whole run (the model is loaded once per
+# worker, not once per book), and the page batches of all books take turns on it
+# through a fair job queue (job_queue.py). STEP6 uses one model client, response
+# cache and rate limiter for all books, and starts on each book as soon as its
+# OCR is done, while the other books are still being read.
+
+STAGES = pipeline.STAGES
+
+# Page batches handed to the pool at once, per worker: enough to keep the
+# workers busy, few enough that a book starting late gets its turn quickly
+JOBS_PER_WORKER = 2
+
+
+def find_books(books_dir, output_dir=None):
+    """The workspace (pipeline.Workspace) of every subfolder of books_dir with a screenshots folder, in name order."""
+    books_dir = os.path.abspath(books_dir)
+    books = []
+    for name in sorted(os.listdir(books_dir)):
+        folder = os.path.join(books_dir, name)
+        if os.path.isdir(os.path.join(folder, step4.PASTA_SCREENSHOTS)):
+            workspace = os.path.join(os.path.abspath(output_dir), name) if output_dir else folder
+            books.append(pipeline.Workspace(workspace, name,
+                                            screenshots=os.path.join(folder, step4.PASTA_SCREENSHOTS),
+                                            markers=os.path.join(folder, step4.PASTA_MARCADORES_CAPITULOS)))
+    return books
+
+
+def read_books(work, num_workers, batch_size, preprocess, on_book_done):
+    """
+    OCRs the (book, pending chapters, inputs) of work with one pool and one OCR
+    cache, a thread per book feeding the fair job queue. on_book_done(book) is
+    called from the book's thread when its chapters are saved. Returns the books
+    whose OCR failed.
+    """
+    import ocr_cache
+    import ocr_daemon
+    import STEP5_ocr_subfolders as step5
+
+    failed = []
+
+    def read_book(book, pending, inputs_by_chapter):
+        try:
+            with metrics.timer('batch', 'book_ocr', item=book.name):
+                if daemon is None:
+                    pipeline.ocr_chapters(book, pending, inputs_by_chapter, jobs, num_workers, batch_size, cache,
+                                          preprocess)
+                else:
+                    # A daemon connection serves one thread at a time: one per book
+                    client = ocr_daemon.connect(settings)
+                    if client is None:
+                        raise RuntimeError("the OCR daemon is no longer running")
+                    with client:
+                        pipeline.ocr_chapters(book, pending, inputs_by_chapter, client, client.workers, batch_size,
+                                              cache, preprocess)
+        except Exception as e:
+            print(f"[{book.name}] STEP5 failed: {e}")
+            failed.append(book)
+            return
+        on_book_done(book)
+
+    def read_all():
+        threads = [threading.Thread(target=read_book, args=item) for item in work]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # One cache for all books: the book threads share its connection
+    cache_path = os.path.join(pipeline.script_dir, step5.CACHE_PATH)
+    with ocr_cache.OCRCache(cache_path, max_bytes=step5.CACHE_MAX_MB * 1024 * 1024) as cache:
+        # A running OCR daemon (ocr_daemon.py) already has the workers and the model loaded
+        settings = step5.ocr_settings(preprocess=preprocess)
+        daemon = ocr_daemon.connect(settings)
+        if daemon is not None:
+            daemon.close()
+            print(f"Using the OCR daemon ({daemon.workers} workers) for {len(work)} books...")
+            read_all()
+        else:
+            print(f"Starting {num_workers} OCR workers for {len(work)} books...")
+            with step5.start_pool(num_workers, preprocess=preprocess) as pool:
+                jobs = FairJobQueue(pool, JOBS_PER_WORKER * num_workers)
+                read_all()
+    return failed
+
+
+async def run_books(books, last_stage='step6', force=False, num_workers=None, batch_size=None, preprocess=False,
+                    stub_latency=None, concurrency=None):
+    """Runs STEP5 (and STEP6) on the books; returns (failed STEP6 chapters, books whose OCR failed)."""
+    import llm_client
+    import STEP5_ocr_subfolders as step5
+    import STEP6_process_chapters_with_AI as step6
+
+    num_workers = max(1, step5.NUM_WORKERS if num_workers is None else num_workers)
+    batch_size = batch_size or step5.BATCH_SIZE
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Queue()
+
+    work = []
+    for book in books:
+        pending, inputs_by_chapter = pipeline.plan_step5(book, force, preprocess)
+        if pending:
+            work.append((book, pending, inputs_by_chapter))
+        else:
+            ready.put_nowait(book)
+
+    failed_books = []
+
+    def read_all():
+        try:
+            if work:
+                failed_books.extend(read_books(work, num_workers, batch_size, preprocess,
+                                               lambda book: loop.call_soon_threadsafe(ready.put_nowait, book)))
+        except Exception as e:
+            print(f"STEP5 failed: {e}")
+            failed_books.extend(book for book, _, _ in work)
+        finally:
+            loop.call_soon_threadsafe(ready.put_nowait, None)
+
+    # The model client (and its SDK) is only set up once a book is ready for STEP6
+    generate = cache = limiter = None
+
+    async def correct(book):
+        with metrics.timer('batch', 'book_correction', item=book.name):
+            return await pipeline.correct_chapters(book, generate, cache, limiter, force, concurrency)
+
+    reader = threading.Thread(target=read_all, daemon=True)
+    reader.start()
+    corrections = []
+    failures = 0
+    try:
+        # Books come out of OCR in the order they finish; each one is corrected
+        # alongside the others, sharing the rate limiter
+        while True:
+            book = await ready.get()
+            if book is None:
+                break
+            if last_stage != 'step6':
+                continue
+            if generate is None:
+                generate = pipeline.make_generator(stub_latency)
+                cache = step6.open_cache(generate.name, os.path.join(pipeline.script_dir, step6.CACHE_PATH))
+                limiter = llm_client.RateLimiter(step6.REQUESTS_PER_MINUTE, step6.TOKENS_PER_MINUTE)
+            corrections.append((book, asyncio.create_task(correct(book))))
+    finally:
+        # The cache stays open until every book's correction is over
+        results = await asyncio.gather(*(task for _, task in corrections), return_exceptions=True)
+        for (book, _), result in zip(corrections, results):
+            if isinstance(result, BaseException):
+                print(f"[{book.name}] STEP6 failed: {result}")
+                failures += 1
+            else:
+                failures += result
+        if cache is not None:
+            print(f"STEP6: response cache {cache.hits} hits, {cache.misses} misses.")
+            cache.close()
+    await loop.run_in_executor(None, reader.join)
+    return failures, failed_books
+
+
+def main(books_dir, output_dir=None, last_stage='step6', force=False, dedup=False, num_workers=None,
+         batch_size=None, preprocess=False, stub_latency=None, concurrency=None):
+    """Returns False if the OCR of a book or the correction of a chapter failed."""
+    books = find_books(books_dir, output_dir)
+    if not books:
+        print(f"No books found in '{books_dir}' (each book is a folder with a '{step4.PASTA_SCREENSHOTS}' folder).")
+        return True
+    print(f"Found {len(books)} books: {', '.join(book.name for book in books)}")
+    metrics.count('batch', 'books', len(books))
+
+    books = [book for book in books if pipeline.run_step4(book, force, dedup)]
+    if last_stage == 'step4' or not books:
+        return True
+    failures, failed_books = asyncio.run(run_books(books, last_stage, force, num_workers, batch_size, preprocess,
+                                                   stub_latency, concurrency))
+    problems = []
+    if failed_books:
+        problems.append(f"STEP5 failed for {len(failed_books)} books ({', '.join(book.name for book in failed_books)})")
+    if failures:
+        problems.append(f"{failures} chapters failed in STEP6")
+    print(f"\nBatch finished: {len(books)} books" + (f"; {'; '.join(problems)}." if problems else "."))
+    return not problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs STEP4-STEP6 on every book of a directory, with one warm "
+                                                 "OCR worker pool and one model client for the whole run.")
+    parser.add_argument('books_dir', help="Folder with one subfolder per book.")
+    parser.add_argument('--output', help="Write each book's workspace to OUTPUT/<book> instead of the book folder.")
+    parser.add_argument('--to', dest='last_stage', choices=STAGES, default=STAGES[-1], help="Last stage to run.")
+    parser.add_argument('--force', action='store_true', help="Redo every item of every book.")
+    parser.add_argument('--dedup', action='store_true', help="Leave repeated screenshots out of the chapters.")
+    parser.add_argument('--workers', type=int, help="OCR worker processes shared by all books.")
+    parser.add_argument('--batch-size', type=int, help="Pages per OCR batch.")
+    parser.add_argument('--preprocess', action='store_true', help="Crop, binarize and rescale the pages before OCR.")
+    parser.add_argument('--concurrency', type=int, help="STEP6 requests in flight at once.")
+    parser.add_argument('--stub', type=float, metavar='LATENCY',
+                        help="Use the local fake model in STEP6 instead of calling the API.")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args, 'batch')
+
+    with metrics.profile('batch'), metrics.timer('batch', 'total'):
+        ok = main(args.books_dir, args.output, args.last_stage, args.force, args.dedup, args.workers,
+                  args.batch_size, args.preprocess, args.stub, args.concurrency)
+    if not ok:
+        sys.exit(1)
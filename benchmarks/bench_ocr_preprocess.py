@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import argparse
+
+import cv2
+
+# Make the repo modules importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import chapter_manifest
+import ocr_layout
+import ocr_preprocess
+from text_metrics import cer, wer
+
+
+def preprocessing_stats(pages):
+    """Pixels kept by the preprocessing and its own cost, without running any OCR."""
+    original_pixels = kept_pixels = 0
+    start = time.perf_counter()
+    for path in pages:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        image, _ = ocr_preprocess.preprocess(gray)
+        original_pixels += gray.size
+        kept_pixels += image.size
+    return kept_pixels / original_pixels, (time.perf_counter() - start) / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the OCR speedup and accuracy change of the page preprocessing.")
+    parser.add_argument('--manifest', default=os.path.join(repo_dir, chapter_manifest.MANIFEST_PATH))
+    parser.add_argument('--reference', default=os.path.join(repo_dir, 'STEP6_pos_IA'),
+                        help="Folder with the reference text of each chapter (NN.txt). The AI-corrected "
+                             "sample output is close enough to compare raw and preprocessed OCR.")
+    parser.add_argument('--stats-only', action='store_true', help="Only measure the preprocessing, no OCR.")
+    args = parser.parse_args()
+
+    manifest = chapter_manifest.load_manifest(args.manifest)
+    chapters = chapter_manifest.chapter_page_paths(manifest, args.manifest)
+    pages = [path for _, paths in chapters for path in paths]
+
+    kept, seconds_per_page = preprocessing_stats(pages)
+    print(f"{len(pages)} pages: preprocessing keeps {kept:.0%} of the pixels, "
+          f"{seconds_per_page * 1000:.1f} ms per page")
+    if args.stats_only:
+        return
+
+    import STEP5_ocr_subfolders as step5
+
+    # Load the model before timing, so both runs measure the reading alone
+    step5.init_reader()
+
+    print(f"\n{'mode':<14} {'seconds':>8} {'pages/s':>8} {'CER':>7} {'WER':>7}")
+    for label, preprocess in (('original', False), ('preprocessed', True)):
+        start = time.perf_counter()
+        results = step5.ocr_pages(pages, num_workers=0, preprocess=preprocess)
+        elapsed = time.perf_counter() - start
+
+        hypothesis, reference = [], []
+        for name, paths in chapters:
+            chapter_results, results = results[:len(paths)], results[len(paths):]
+            reference_path = os.path.join(args.reference, f"{name}.txt")
+            if os.path.isfile(reference_path):
+                records = ocr_layout.layout_pages(zip((os.path.basename(path) for path in paths), chapter_results))
+                hypothesis.append(ocr_layout.records_to_text(records))
+                with open(reference_path, 'r', encoding='utf-8') as f:
+                    reference.append(f.read())
+        hypothesis, reference = '\n'.join(hypothesis), '\n'.join(reference)
+        print(f"{label:<14} {elapsed:>8.2f} {len(pages) / elapsed:>8.2f} "
+              f"{cer(hypothesis, reference):>7.3f} {wer(hypothesis, reference):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
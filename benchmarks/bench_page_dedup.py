@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Make the repo modules importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import page_dedup
+
+
+def synthetic_book(thumbnails, pages, duplicate_rate, rng):
+    """Shifted, noisy variants of the sample pages, with some pages captured twice. Returns (book, true dups)."""
+    book = []
+    duplicates = set()
+    while len(book) < pages:
+        base = thumbnails[rng.integers(len(thumbnails))].astype(np.int16)
+        # A different page: move the text around so no two pages are alike
+        page = np.roll(base, rng.integers(-32, 32, size=2), axis=(0, 1))
+        book.append(np.clip(page + rng.integers(-6, 6, page.shape), 0, 255).astype(np.uint8))
+        if rng.random() < duplicate_rate:
+            # Same page again, with capture noise
+            duplicates.add(len(book))
+            book.append(np.clip(page + rng.integers(-6, 6, page.shape), 0, 255).astype(np.uint8))
+    return np.stack(book[:pages]), {i for i in duplicates if i < pages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times perceptual-hash deduplication on already decoded pages.")
+    parser.add_argument('--screenshots', default=os.path.join(repo_dir, 'STEP2_get_screenshots'))
+    parser.add_argument('--pages', type=int, default=5000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.02)
+    args = parser.parse_args()
+
+    names = sorted(os.listdir(args.screenshots))
+    start = time.perf_counter()
+    samples = page_dedup.load_thumbnails([os.path.join(args.screenshots, name) for name in names])
+    decode = time.perf_counter() - start
+    print(f"Decoded {len(names)} sample pages in {decode * 1000:.0f} ms "
+          f"(decoding is {decode / len(names) * 1000:.1f} ms/page and is not part of the timings below)")
+
+    book, expected = synthetic_book(samples, args.pages, args.duplicate_rate, np.random.default_rng(1))
+    for method, hash_function in page_dedup.HASHES.items():
+        start = time.perf_counter()
+        hashes = hash_function(book)
+        hashed = time.perf_counter()
+        found = set(page_dedup.find_duplicates(hashes))
+        matched = time.perf_counter()
+        print(f"{method}: {len(book)} pages hashed in {(hashed - start) * 1000:.0f} ms, "
+              f"matched in {(matched - hashed) * 1000:.0f} ms; "
+              f"found {len(found & expected)}/{len(expected)} duplicates, {len(found - expected)} false positives")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+# Make the STEP scripts importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import STEP2_get_screeningshots as step2
+from screen_capture import SimulatedReaderScreen
+
+
+def capture(screen, coordinates, pages, adaptive, fixed_delay):
+    """Captures `pages` pages; returns (seconds, pages captured, duplicated pages, skipped pages)."""
+    shown = []
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            step2.take_screenshots_two_columns(coordinates, pages, folder, screen=screen,
+                                               on_capture=lambda path: shown.append(screen.visible_page()),
+                                               page_turn_delay=fixed_delay, adaptive=adaptive)
+        elapsed = time.perf_counter() - start
+    # Two captures (left and right column) per page
+    page_sequence = shown[::2]
+    duplicates = sum(1 for a, b in zip(page_sequence, page_sequence[1:]) if a == b)
+    skipped = sum(b - a - 1 for a, b in zip(page_sequence, page_sequence[1:]) if b > a + 1)
+    return elapsed, len(page_sequence), duplicates, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed page-turn sleep vs. page-settle detection on a simulated reader.")
+    parser.add_argument('--screenshots', default=os.path.join(repo_dir, 'STEP2_get_screenshots'))
+    parser.add_argument('--latency', type=float, nargs='+', default=[0.1, 0.4, 1.0, 2.0],
+                        help="Simulated render latencies (seconds).")
+    parser.add_argument('--fixed-delay', type=float, default=step2.PAGE_TURN_DELAY)
+    parser.add_argument('--miss-rate', type=float, default=0.0, help="Fraction of clicks the reader ignores.")
+    args = parser.parse_args()
+
+    coordinates = step2.read_coordinates(os.path.join(repo_dir, step2.COORDS_FILENAME))
+    left_region = step2.get_bounding_box(coordinates[0:4])
+
+    print(f"\n{'latency':>8} {'mode':<10} {'seconds':>8} {'pages/min':>10} {'duplicates':>11} {'skipped':>8}")
+    for latency in args.latency:
+        for label, adaptive in (("fixed", False), ("adaptive", True)):
+            screen = SimulatedReaderScreen(args.screenshots, left_region=left_region, render_latency=latency,
+                                           miss_rate=args.miss_rate, seed=1)
+            elapsed, pages, duplicates, skipped = capture(screen, coordinates, screen.num_pages, adaptive,
+                                                          args.fixed_delay)
+            print(f"{latency:>7.1f}s {label:<10} {elapsed:>8.2f} {60 * pages / elapsed:>10.1f} "
+                  f"{duplicates:>11} {skipped:>8}")
+
+
+if __name__ == "__main__":
+    main()
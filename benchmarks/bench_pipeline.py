@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import platform
+import contextlib
+import subprocess
+from statistics import median
+
+# Make the STEP scripts importable when running from the benchmarks folder
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(bench_dir)
+sys.path.insert(0, repo_dir)
+
+import llm_client
+import metrics
+import text_metrics
+import synthetic_book
+
+# End-to-end benchmark on a synthetic book (see synthetic_book.py): STEP4 splits the
+# screenshots into chapters, STEP5 reads them (with easyocr, or with the book's known
+# text standing in for the model) and STEP6 corrects them against a local fake model
+# server. Reports throughput, latency percentiles, peak RSS and the CER/WER against
+# the ground truth, and appends the results to results/pipeline.jsonl with the
+# current commit, so that a run can be compared with the last run of the same
+# settings on an earlier commit.
+
+RESULTS_PATH = os.path.join(bench_dir, 'results', 'pipeline.jsonl')
+
+# A change larger than this fraction (throughput, RSS) or this many points of
+# error rate is reported as a regression
+TOLERANCE = 0.10
+ERROR_RATE_TOLERANCE = 0.002
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished children (the OCR workers), in MB."""
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, KB elsewhere
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(max(own, children), 1)
+
+
+def git_revision():
+    """(short commit hash, whether tracked files have changes), or (None, None) outside a git checkout."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(changes)
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    return {'p50_ms': round(1000 * median(values), 1),
+            'p95_ms': round(1000 * values[min(len(values) - 1, int(0.95 * len(values)))], 1),
+            'max_ms': round(1000 * values[-1], 1)}
+
+
+def timer_values(events, stage, name):
+    return [event['value'] for event in events
+            if event['stage'] == stage and event['kind'] == 'timer' and event['name'] == name]
+
+
+def read_chapters(folder, names):
+    texts = {}
+    for name in names:
+        with open(os.path.join(folder, f"{name}.txt"), 'r', encoding='utf-8') as f:
+            texts[name] = f.read()
+    return texts
+
+
+def accuracy(texts, truth):
+    hypothesis = '\n\n'.join(texts.get(name, '') for name in truth)
+    reference = '\n\n'.join(truth.values())
+    return {'cer': round(text_metrics.cer(hypothesis, reference), 4),
+            'wer': round(text_metrics.wer(hypothesis, reference), 4)}
+
+
+def run_step4(book, workspace, dedup):
+    import STEP4_divide_screenshots_by_chapters as step4
+
+    manifest_path = os.path.join(workspace, 'STEP4_chapters.json')
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        manifest = step4.organizar_screenshots_por_capitulos(
+            os.path.join(book, synthetic_book.SCREENSHOTS_FOLDER),
+            os.path.join(book, synthetic_book.MARKERS_FOLDER),
+            caminho_manifesto=manifest_path, deduplicar=dedup)
+    elapsed = time.perf_counter() - start
+    pages = sum(len(chapter['pages']) for chapter in manifest['chapters'])
+    return manifest_path, {'seconds': round(elapsed, 3), 'pages_per_s': round(pages / elapsed, 1),
+                           'peak_rss_mb': peak_rss_mb()}
+
+
+def run_step5(book, workspace, manifest_path, args):
+    """Returns (output folder, results), or (None, reason) if STEP5 can't run here."""
+    try:
+        import chapter_manifest
+        import STEP5_ocr_subfolders as step5
+    except ImportError as e:
+        return None, f"skipped ({e})"
+
+    chapters = chapter_manifest.chapter_page_paths(chapter_manifest.load_manifest(manifest_path), manifest_path)
+    output_folder = os.path.join(workspace, 'STEP5_ocr')
+    num_workers = args.workers
+    if args.ocr == 'ground-truth':
+        # The stand-in reader lives in this process
+        step5._reader = synthetic_book.GroundTruthReader(book, noise=args.noise, seed=args.seed)
+        num_workers = 0
+
+    pages = sum(len(paths) for _, paths in chapters)
+    since = time.time()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        step5.ocr_chapters(chapters, output_folder, num_workers, args.batch_size, preprocess=args.preprocess)
+    elapsed = time.perf_counter() - start
+    events = metrics.read_events(since=since)
+    return output_folder, {'seconds': round(elapsed, 3), 'pages_per_s': round(pages / elapsed, 1),
+                           'batch_latency': percentiles(timer_values(events, 'step5', 'readtext')),
+                           'peak_rss_mb': peak_rss_mb()}
+
+
+def make_generator(args):
+    """Returns (STEP6 backend, server): the openai client against fake_llm_server.py, or the in-process stub."""
+    if args.llm == 'fake-server':
+        import STEP6_process_chapters_with_AI as step6
+        import fake_llm_server
+
+        server, base_url = fake_llm_server.start(latency=args.llm_latency)
+        return step6.make_generator('openai', 'fake', base_url, False), server
+    return llm_client.StubGenerator(latency=args.llm_latency), None
+
+
+def run_step6(input_folder, workspace, names, args):
+    import text_normalizer
+    import STEP6_process_chapters_with_AI as step6
+
+    file_paths = [os.path.join(input_folder, f"{name}.txt") for name in names]
+    output_folder = os.path.join(workspace, 'STEP6_pos_IA')
+    generate, server = make_generator(args)
+    since = time.time()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            normalizer = text_normalizer.fit_book(file_paths)[0]
+            failures, latencies = asyncio.run(step6.process_files(
+                file_paths, input_folder, output_folder, generate, args.concurrency, 0, 0,
+                chunk_tokens=args.chunk_tokens, normalizer=normalizer))
+    finally:
+        if server is not None:
+            server.shutdown()
+    elapsed = time.perf_counter() - start
+    events = metrics.read_events(since=since)
+    tokens = sum(event['value'] for event in events
+                 if event['stage'] == 'step6' and event['kind'] == 'counter' and event['name'] == 'tokens_out')
+    return output_folder, {
+        'seconds': round(elapsed, 3), 'chapters_per_s': round(len(file_paths) / elapsed, 2),
+        'tokens_per_s': round(tokens / elapsed, 1), 'failures': failures,
+        'request_latency': percentiles(timer_values(events, 'step6', 'request')),
+        'chapter_latency': percentiles(list(latencies.values())), 'peak_rss_mb': peak_rss_mb()}
+
+
+def run_benchmark(args):
+    workspace = tempfile.mkdtemp(prefix='kindle_bench_')
+    book = os.path.join(workspace, 'book')
+    metrics.enable(os.path.join(workspace, 'metrics.jsonl'))
+    try:
+        start = time.perf_counter()
+        truth = synthetic_book.make_book(book, args.pages, args.chapters, args.seed)
+        print(f"Rendered {args.pages} pages in {len(truth)} chapters in {time.perf_counter() - start:.1f}s.")
+
+        stages, quality = {}, {}
+
+        def keep_fastest(stage, result):
+            if stage not in stages or result['seconds'] < stages[stage]['seconds']:
+                stages[stage] = result
+
+        for _ in range(max(1, args.repeat)):
+            manifest_path, result = run_step4(book, workspace, args.dedup)
+            keep_fastest('step4', result)
+
+            ocr_folder, result = run_step5(book, workspace, manifest_path, args)
+            if ocr_folder is None:
+                stages['step5'] = {'skipped': result}
+                ocr_folder = os.path.join(book, synthetic_book.GROUND_TRUTH_FOLDER)
+            else:
+                keep_fastest('step5', result)
+                quality['step5'] = accuracy(read_chapters(ocr_folder, truth), truth)
+
+            output_folder, result = run_step6(ocr_folder, workspace, list(truth), args)
+            keep_fastest('step6', result)
+            quality['step6'] = accuracy(read_chapters(output_folder, truth), truth)
+        if 'skipped' in stages['step5']:
+            print(f"STEP5 {stages['step5']['skipped']}; STEP6 got the ground truth instead.")
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return stages, quality
+
+
+def settings(args):
+    """The parameters that make two runs comparable."""
+    return {'pages': args.pages, 'chapters': args.chapters, 'seed': args.seed, 'dedup': args.dedup,
+            'ocr': args.ocr, 'noise': args.noise, 'preprocess': args.preprocess, 'workers': args.workers,
+            'batch_size': args.batch_size, 'llm': args.llm, 'llm_latency': args.llm_latency,
+            'concurrency': args.concurrency, 'chunk_tokens': args.chunk_tokens}
+
+
+def load_results(path):
+    if not os.path.isfile(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def flatten(record):
+    """The comparable numbers of a result: {'step5 pages_per_s': 12.3, 'step6 cer': 0.01, ...}."""
+    values = {}
+    for stage, result in record['stages'].items():
+        for name in ('pages_per_s', 'chapters_per_s', 'tokens_per_s', 'peak_rss_mb'):
+            if result.get(name) is not None:
+                values[f"{stage} {name}"] = result[name]
+    for stage, result in record['accuracy'].items():
+        for name, value in result.items():
+            values[f"{stage} {name}"] = value
+    return values
+
+
+def compare(previous, current):
+    """Prints the change since the previous run; returns the names of the regressed numbers."""
+    before, after = flatten(previous), flatten(current)
+    regressions = []
+    print(f"\nCompared with {previous.get('commit') or '?'} ({previous['date']}):")
+    print(f"{'metric':<24} {'before':>10} {'after':>10} {'change':>9}")
+    for name in sorted(after):
+        if name not in before:
+            continue
+        old, new = before[name], after[name]
+        if name.endswith(('cer', 'wer')):
+            worse = new - old > ERROR_RATE_TOLERANCE
+            change = f"{100 * (new - old):+.2f}pt"
+        else:
+            relative = (new - old) / old if old else 0.0
+            # Throughput should not drop, memory should not grow
+            worse = relative > TOLERANCE if name.endswith('rss_mb') else relative < -TOLERANCE
+            change = f"{relative:+.0%}"
+        if worse:
+            regressions.append(name)
+        print(f"{name:<24} {old:>10} {new:>10} {change:>9}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def print_report(record):
+    print(f"\n{'stage':<7} {'seconds':>8} {'throughput':>16} {'p50 ms':>8} {'p95 ms':>8} {'peak RSS MB':>12}")
+    for stage, result in record['stages'].items():
+        if 'skipped' in result:
+            print(f"{stage:<7} {result['skipped']}")
+            continue
+        if 'pages_per_s' in result:
+            throughput = f"{result['pages_per_s']} pages/s"
+        else:
+            throughput = f"{result['chapters_per_s']} chapters/s"
+        latency = result.get('batch_latency') or result.get('request_latency') or {}
+        print(f"{stage:<7} {result['seconds']:>8} {throughput:>16} {latency.get('p50_ms', '-'):>8} "
+              f"{latency.get('p95_ms', '-'):>8} {result['peak_rss_mb'] or '-':>12}")
+    for stage, result in record['accuracy'].items():
+        print(f"{stage} accuracy: CER {result['cer']:.2%}, WER {result['wer']:.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end STEP4-STEP6 benchmark on a synthetic book.")
+    parser.add_argument('--pages', type=int, default=20, help="Two-column pages in the book.")
+    parser.add_argument('--chapters', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dedup', action='store_true', help="Run STEP4 with the repeated-page detection.")
+    parser.add_argument('--ocr', choices=('ground-truth', 'easyocr'), default='ground-truth',
+                        help="Read the pages with easyocr, or answer with the book's known text (no model).")
+    parser.add_argument('--noise', type=float, default=0.03,
+                        help="With --ocr ground-truth, fraction of the words given an OCR-like error.")
+    parser.add_argument('--preprocess', action='store_true', help="STEP5 page preprocessing (easyocr only).")
+    parser.add_argument('--workers', type=int, default=2, help="STEP5 OCR worker processes (easyocr only).")
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--llm', choices=('fake-server', 'stub'), default='fake-server',
+                        help="STEP6 against fake_llm_server.py over HTTP, or the in-process stub model.")
+    parser.add_argument('--llm-latency', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--chunk-tokens', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Run the stages this many times on the same book and keep the fastest run of each.")
+    parser.add_argument('--results', default=RESULTS_PATH, help="JSON lines file the results are appended to.")
+    parser.add_argument('--no-save', action='store_true', help="Only print the results.")
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help="Exit with status 1 if a number got worse than the last comparable run.")
+    args = parser.parse_args()
+
+    if args.llm == 'fake-server':
+        try:
+            import openai
+        except ImportError as e:
+            print(f"The fake server needs the openai package ({e}); using the in-process stub model.")
+            args.llm = 'stub'
+
+    stages, quality = run_benchmark(args)
+    commit, dirty = git_revision()
+    record = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': commit, 'dirty': dirty,
+              'host': platform.node(), 'python': platform.python_version(),
+              'settings': settings(args), 'stages': stages, 'accuracy': quality}
+    print_report(record)
+
+    # Timings are only comparable on the same machine
+    comparable = [previous for previous in load_results(args.results)
+                  if previous['settings'] == record['settings'] and previous.get('host') == record['host']]
+    regressions = compare(comparable[-1], record) if comparable else []
+    if not comparable:
+        print("\nNo earlier run with the same settings to compare with.")
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"Results appended to '{args.results}'.")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import argparse
+
+# Make the STEP scripts importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import ocr_layout
+import STEP5_ocr_subfolders as step5
+
+
+def chapter_text(pages, results):
+    """The text STEP5 would save for these pages read as one chapter."""
+    return ocr_layout.records_to_text(ocr_layout.layout_pages(zip(map(os.path.basename, pages), results)))
+
+
+def serial_loop(file_paths):
+    """The original STEP5 loop: one Reader, one readtext call per image."""
+    reader = step5.init_reader()
+    results = []
+    for file_path in file_paths:
+        results.append(reader.readtext(file_path))
+    return results
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    results = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    return label, elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the serial STEP5 OCR loop with the batched worker pool.")
+    parser.add_argument('--folder', default=os.path.join(repo_dir, step5.BASE_FOLDER))
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    chapters = step5.list_chapter_images(args.folder)
+    pages = [path for _, paths in chapters for path in paths]
+    print(f"Benchmarking {len(pages)} pages from '{args.folder}'")
+
+    # The model load is part of every run: it is what a real STEP5 invocation pays too
+    runs = [timed("serial loop (original)", serial_loop, pages)]
+    baseline = runs[0][2]
+    for workers in args.workers:
+        for batch_size in args.batch_size:
+            runs.append(timed(f"pool workers={workers} batch={batch_size}", step5.ocr_pages,
+                              pages, num_workers=workers, batch_size=batch_size))
+
+    print(f"\n{'run':<34} {'seconds':>9} {'pages/s':>9} {'same text':>10}")
+    for label, elapsed, results in runs:
+        same = chapter_text(pages, results) == chapter_text(pages, baseline)
+        print(f"{label:<34} {elapsed:>9.2f} {len(pages) / elapsed:>9.2f} {str(same):>10}")
+
+
+if __name__ == "__main__":
+    main()
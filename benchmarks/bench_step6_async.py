@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import statistics
+
+# Make the STEP scripts importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import llm_client
+import STEP6_process_chapters_with_AI as step6
+
+
+def make_book(folder, chapters, length):
+    """Writes `chapters` chapter files, each one `length` sample STEP5 chapters long."""
+    sample_dir = os.path.join(repo_dir, 'STEP5_ocr')
+    samples = []
+    for name in sorted(os.listdir(sample_dir)):
+        if not name.endswith('.txt'):
+            continue
+        with open(os.path.join(sample_dir, name), encoding='utf-8') as f:
+            samples.append(f.read())
+    for i in range(chapters):
+        with open(os.path.join(folder, f"{i + 1:02d}.txt"), 'w', encoding='utf-8') as f:
+            # The heading keeps every chapter distinct, so identical requests are not merged
+            f.write(f"Capítulo {i + 1}\n" + '\n'.join(samples[(i + j) % len(samples)] for j in range(length)))
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder))
+
+
+def make_generate(args):
+    """A fresh backend for one run; the stub can also simulate failures."""
+    if args.backend == 'stub' and not args.batch:
+        return llm_client.StubGenerator(latency=args.latency, failure_rate=args.failure_rate, seed=1,
+                                        seconds_per_token=args.seconds_per_token)
+    return step6.make_generator(args.backend, args.model, args.base_url, args.batch, stub_latency=args.latency)
+
+
+def run(label, file_paths, input_dir, args, concurrency, chunk_tokens):
+    output_dir = tempfile.mkdtemp()
+    generate = make_generate(args)
+    start = time.perf_counter()
+    # The per-file progress messages would drown the results
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        failures, latencies = asyncio.run(step6.process_files(
+            file_paths, input_dir, output_dir, generate, concurrency, args.rpm, args.tpm,
+            chunk_tokens=chunk_tokens))
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(output_dir)
+    calls = getattr(generate, 'calls', getattr(generate, 'batches', None))
+    return label, elapsed, '-' if calls is None else calls, failures, sorted(latencies.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures STEP6 throughput and latency for a model backend "
+                                                 "(by default the local stub model).")
+    parser.add_argument('--backend', choices=step6.BACKENDS, default='stub')
+    parser.add_argument('--model', help="Model name for the gemini/openai backends.")
+    parser.add_argument('--base-url', help="OpenAI-compatible endpoint; 'fake' starts fake_llm_server.py locally.")
+    parser.add_argument('--batch', action='store_true', help="Use the backend's batch mode.")
+    parser.add_argument('--chapters', type=int, default=40)
+    parser.add_argument('--length', type=int, default=1, help="Length of each chapter, in sample chapters.")
+    parser.add_argument('--latency', type=float, default=0.5, help="Stub model latency per call (seconds).")
+    parser.add_argument('--seconds-per-token', type=float, default=0.0,
+                        help="Stub generation time per output token, to model long answers.")
+    parser.add_argument('--failure-rate', type=float, default=0.1, help="Fraction of calls failing with a 503.")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--chunk-tokens', type=int, nargs='+', default=[0],
+                        help="Chunk budgets to compare (0 = whole-chapter requests).")
+    parser.add_argument('--rpm', type=int, default=0, help="Requests-per-minute limit (0 = unlimited).")
+    parser.add_argument('--tpm', type=int, default=0, help="Tokens-per-minute limit (0 = unlimited).")
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url == 'fake':
+        import fake_llm_server
+        server, args.base_url = fake_llm_server.start(latency=args.latency, seconds_per_token=args.seconds_per_token)
+
+    input_dir = tempfile.mkdtemp()
+    file_paths = make_book(input_dir, args.chapters, args.length)
+
+    runs = [run(f"conc={c} chunk={t or 'whole'}", file_paths, input_dir, args, c, t)
+            for c in args.concurrency for t in args.chunk_tokens]
+    shutil.rmtree(input_dir)
+    if server is not None:
+        server.shutdown()
+
+    print(f"\n{args.chapters} chapters x {args.length}, backend {args.backend}{' (batch)' if args.batch else ''}, "
+          f"stub latency {args.latency}s + {args.seconds_per_token}s/token, failure rate {args.failure_rate:.0%}")
+    print(f"{'run':<24} {'seconds':>8} {'chapters/s':>11} {'calls':>6} {'failed':>7} "
+          f"{'chapter p50':>12} {'chapter max':>12}")
+    for label, elapsed, calls, failures, latencies in runs:
+        p50 = statistics.median(latencies) if latencies else 0.0
+        slowest = latencies[-1] if latencies else 0.0
+        print(f"{label:<24} {elapsed:>8.2f} {args.chapters / elapsed:>11.2f} {calls:>6} {failures:>7} "
+              f"{p50:>11.2f}s {slowest:>11.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import asyncio
+import argparse
+import difflib
+import tempfile
+import contextlib
+
+# Make the STEP scripts importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import llm_client
+import STEP6_process_chapters_with_AI as step6
+from text_metrics import normalize
+
+# Words per synthetic OCR line
+LINE_WORDS = 10
+
+
+def make_records(ocr_text, reference_text, rng):
+    """
+    STEP5-style records for a sample chapter. The sample book has no easyocr confidences,
+    so they are simulated: words the AI-corrected text changed get a low confidence.
+    """
+    paragraphs = [line.split() for line in ocr_text.splitlines() if line.strip()]
+    words = [word for paragraph in paragraphs for word in paragraph]
+    matcher = difflib.SequenceMatcher(None, [normalize(w) for w in words], normalize(reference_text).split(),
+                                      autojunk=False)
+    correct = [False] * len(words)
+    for block in matcher.get_matching_blocks():
+        for i in range(block.a, block.a + block.size):
+            correct[i] = True
+
+    records = []
+    index = line = 0
+    for number, paragraph in enumerate(paragraphs):
+        for start in range(0, len(paragraph), LINE_WORDS):
+            for word in paragraph[start:start + LINE_WORDS]:
+                confidence = rng.uniform(0.6, 1.0) if correct[index] else rng.uniform(0.05, 0.45)
+                records.append({'page': f"page_{number:04d}.png", 'paragraph': number, 'line': line,
+                                'text': word, 'confidence': round(confidence, 4), 'box': [[0, 0]] * 4})
+                index += 1
+            line += 1
+    return records
+
+
+def make_book(folder, copies, seed=1):
+    """Writes the sample chapters `copies` times, each with its .txt and simulated .jsonl."""
+    rng = random.Random(seed)
+    file_paths = []
+    for name in sorted(os.listdir(os.path.join(repo_dir, 'STEP5_ocr'))):
+        if not name.endswith('.txt'):
+            continue
+        with open(os.path.join(repo_dir, 'STEP5_ocr', name), encoding='utf-8') as f:
+            ocr_text = f.read()
+        with open(os.path.join(repo_dir, 'STEP6_pos_IA', name), encoding='utf-8') as f:
+            reference_text = f.read()
+        for copy in range(copies):
+            base = os.path.join(folder, f"{copy:03d}_{os.path.splitext(name)[0]}")
+            with open(base + '.txt', 'w', encoding='utf-8') as f:
+                f.write(ocr_text)
+            with open(base + '.jsonl', 'w', encoding='utf-8') as f:
+                for record in make_records(ocr_text, reference_text, rng):
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            file_paths.append(base + '.txt')
+    return file_paths
+
+
+def run(file_paths, input_dir, args, selective):
+    tokens_in = tokens_out = requests = 0
+    for file_path in file_paths:
+        with open(file_path, encoding='utf-8') as f:
+            plan = step6.plan_chapter(file_path, f.read(), args.chunk_tokens, selective, args.min_confidence)
+        requests += len(plan.prompts)
+        tokens_in += sum(llm_client.estimate_tokens(prompt) for prompt in plan.prompts)
+        tokens_out += sum(llm_client.estimate_tokens(text) for text in plan.originals)
+
+    output_dir = tempfile.mkdtemp()
+    generate = llm_client.StubGenerator(latency=args.latency, seconds_per_token=args.seconds_per_token)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        asyncio.run(step6.process_files(file_paths, input_dir, output_dir, generate, args.concurrency, 0, 0,
+                                        chunk_tokens=args.chunk_tokens, selective=selective,
+                                        min_confidence=args.min_confidence))
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(output_dir)
+    return requests, tokens_in, tokens_out, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares full-chapter and selective STEP6 correction "
+                                                 "(tokens and wall time) against a local stub model.")
+    parser.add_argument('--copies', type=int, default=10, help="Copies of the sample chapters in the book.")
+    parser.add_argument('--latency', type=float, default=0.3, help="Stub model latency per call (seconds).")
+    parser.add_argument('--seconds-per-token', type=float, default=0.002,
+                        help="Stub generation time per output token.")
+    parser.add_argument('--concurrency', type=int, default=step6.CONCURRENCY)
+    parser.add_argument('--chunk-tokens', type=int, default=step6.CHUNK_TOKENS)
+    parser.add_argument('--min-confidence', type=float, default=step6.MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    input_dir = tempfile.mkdtemp()
+    file_paths = make_book(input_dir, args.copies)
+    runs = [('full', run(file_paths, input_dir, args, False)), ('selective', run(file_paths, input_dir, args, True))]
+    shutil.rmtree(input_dir)
+
+    print(f"{len(file_paths)} chapters, stub latency {args.latency}s + {args.seconds_per_token}s/token, "
+          f"concurrency {args.concurrency}")
+    print(f"{'mode':<10} {'requests':>9} {'tokens in':>10} {'tokens out':>11} {'seconds':>8}")
+    for label, (requests, tokens_in, tokens_out, elapsed) in runs:
+        print(f"{label:<10} {requests:>9} {tokens_in:>10} {tokens_out:>11} {elapsed:>8.2f}")
+    full, selective = runs[0][1], runs[1][1]
+    print(f"\nselective mode sends {selective[1] / full[1]:.0%} of the input tokens "
+          f"in {selective[3] / full[3]:.0%} of the time")
+
+
+if __name__ == "__main__":
+    main()
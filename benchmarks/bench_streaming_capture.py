@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+# Make the STEP scripts importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import STEP2_get_screeningshots as step2
+from screen_capture import ReplayScreen
+from streaming_ocr import StreamingOCR
+
+
+def stub_reader(seconds_per_page):
+    """Fake OCR that takes seconds_per_page per image, like a warm easyocr worker would."""
+    def read_batch(paths):
+        time.sleep(seconds_per_page * len(paths))
+        return [[([[0, 0], [1, 0], [1, 1], [0, 1]], os.path.basename(path), 1.0)] for path in paths]
+    return read_batch
+
+
+def capture_then_ocr(coordinates, screen, folder, args):
+    """The current flow: capture the whole book, then OCR it."""
+    captured = []
+    step2.take_screenshots_two_columns(coordinates, screen.num_pages, folder, screen=screen,
+                                       on_capture=captured.append, page_turn_delay=args.page_turn,
+                                       adaptive=False)
+    stream = StreamingOCR(stub_reader(args.ocr_seconds), num_consumers=args.workers, batch_size=args.batch_size)
+    for path in captured:
+        stream.submit(path)
+    return stream.close()
+
+
+def streaming(coordinates, screen, folder, args):
+    return step2.take_screenshots_streaming(coordinates, screen.num_pages, folder, screen=screen,
+                                            num_workers=args.workers, batch_size=args.batch_size,
+                                            page_turn_delay=args.page_turn, adaptive=False,
+                                            read_batch=stub_reader(args.ocr_seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares capture-then-OCR with streaming OCR on a replayed book.")
+    parser.add_argument('--screenshots', default=os.path.join(repo_dir, 'STEP2_get_screenshots'))
+    parser.add_argument('--page-turn', type=float, default=0.5, help="Wait after each page turn (seconds).")
+    parser.add_argument('--ocr-seconds', type=float, default=0.4, help="Stub OCR time per image (seconds).")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=2)
+    args = parser.parse_args()
+
+    coordinates = step2.read_coordinates(os.path.join(repo_dir, step2.COORDS_FILENAME))
+    left_region = step2.get_bounding_box(coordinates[0:4])
+
+    timings = []
+    for label, run in (("capture, then OCR", capture_then_ocr), ("streaming", streaming)):
+        screen = ReplayScreen(args.screenshots, left_region=left_region)
+        with tempfile.TemporaryDirectory() as folder:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                results = run(coordinates, screen, folder, args)
+            timings.append((label, time.perf_counter() - start, len(results)))
+
+    print(f"{'mode':<20} {'seconds':>8} {'images':>7}")
+    for label, elapsed, images in timings:
+        print(f"{label:<20} {elapsed:>8.2f} {images:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+# Make the repo modules importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import llm_client
+import text_normalizer
+from text_metrics import cer
+
+HEADER = "O MUNDO DE SOFIA"
+LINE_WORDS = 10
+PAGE_LINES = 12
+
+
+def sample_words():
+    words = []
+    for name in sorted(os.listdir(os.path.join(repo_dir, 'STEP5_ocr'))):
+        if name.endswith('.txt'):
+            with open(os.path.join(repo_dir, 'STEP5_ocr', name), encoding='utf-8') as f:
+                words.extend(f.read().split())
+    return words
+
+
+def make_noisy_book(pages, chapters, seed=1):
+    """
+    Book text with the mechanical noise of a real OCR run: a running header and a page
+    number on every page, words hyphenated at line ends, spaces before punctuation.
+    Returns (chapter texts, page edges).
+    """
+    rng = random.Random(seed)
+    words = sample_words()
+    page_texts, page_edges = [], []
+    position = 0
+    for page in range(1, pages + 1):
+        lines = []
+        for _ in range(PAGE_LINES):
+            line = words[position % len(words):position % len(words) + LINE_WORDS] or words[:LINE_WORDS]
+            position += LINE_WORDS
+            line = [f"{w[:-1]} {w[-1]}" if w[-1] in ',.;:?!' and rng.random() < 0.2 else w for w in line]
+            last = line[-1]
+            if len(last) > 6 and last.isalpha() and rng.random() < 0.3:
+                cut = len(last) // 2
+                line[-1] = f"{last[:cut]}-"
+                words_next = last[cut:]
+                lines.append(' '.join(line))
+                lines.append(words_next)
+                continue
+            lines.append(' '.join(line))
+        header, footer = f"{HEADER} {page}" if page % 2 else HEADER, str(page)
+        page_edges.append([header, footer])
+        # STEP5 joins the lines of a paragraph with spaces
+        page_texts.append(f"{header}\n{' '.join(lines)}\n{footer}")
+    per_chapter = max(1, pages // chapters)
+    texts = ['\n'.join(page_texts[i:i + per_chapter]) for i in range(0, pages, per_chapter)]
+    return texts, page_edges
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the speed of the text normalizer and how much it "
+                                                 "shrinks and corrects the text sent to STEP6.")
+    parser.add_argument('--pages', type=int, default=400)
+    parser.add_argument('--chapters', type=int, default=20)
+    parser.add_argument('--dictionary', help="Word list for the dictionary-assisted fixes.")
+    args = parser.parse_args()
+
+    dictionary = text_normalizer.load_dictionary(args.dictionary) if args.dictionary else ()
+    texts, page_edges = make_noisy_book(args.pages, args.chapters)
+    start = time.perf_counter()
+    normalizer = text_normalizer.TextNormalizer().fit(texts, page_edges, dictionary)
+    # Without records, only lines that are a header as a whole are removed
+    normalized = [normalizer.normalize_chapter(text) for text in texts]
+    elapsed = time.perf_counter() - start
+
+    before = sum(llm_client.estimate_tokens(text) for text in texts)
+    after = sum(llm_client.estimate_tokens(text) for text in normalized)
+    print(f"Synthetic book: {args.pages} pages in {len(texts)} chapters, normalized in {elapsed * 1000:.0f} ms")
+    print(f"  tokens {before} -> {after} ({1 - after / before:.1%} smaller), "
+          f"headers found: {sorted(normalizer.headers)}")
+
+    # On the real sample text: closer to, or further from, the AI-corrected version?
+    print("\nSample chapters against the AI-corrected text (STEP6_pos_IA):")
+    file_paths = sorted(os.path.join(repo_dir, 'STEP5_ocr', name)
+                        for name in os.listdir(os.path.join(repo_dir, 'STEP5_ocr')) if name.endswith('.txt'))
+    normalizer, sample_texts = text_normalizer.fit_book(file_paths, args.dictionary)
+    for file_path, text in sample_texts.items():
+        with open(os.path.join(repo_dir, 'STEP6_pos_IA', os.path.basename(file_path)), encoding='utf-8') as f:
+            reference = f.read()
+        print(f"  {os.path.basename(file_path)}: CER {cer(text, reference):.4f} -> "
+              f"{cer(normalizer.normalize_chapter(text, text_normalizer.chapter_records(file_path)), reference):.4f}")
+
+
+if __name__ == "__main__":
+    main()
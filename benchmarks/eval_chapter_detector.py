@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+# Make the repo modules importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import chapter_detector
+import synthetic_book
+
+# Evaluates the chapter detector on the hand-made marker set of the repo and on a
+# synthetic book (see synthetic_book.py), whose pages have a running header and a
+# page number like most real books.
+
+
+def evaluate_folder(title, screenshots, markers, threshold, repeat):
+    expected = chapter_detector.list_pages(markers)
+
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        page_names, scores, predicted = chapter_detector.detect_chapter_starts(screenshots, threshold)
+        elapsed.append(time.perf_counter() - start)
+
+    print(f"\n== {title} ==")
+    print(f"{'page':<16} {'score':>6} {'expected':>9} {'predicted':>10}")
+    for name, score in zip(page_names, scores):
+        print(f"{name:<16} {score:>6.1f} {str(name in expected):>9} {str(name in predicted):>10}")
+
+    result = chapter_detector.evaluate(predicted, expected)
+    best = min(elapsed)
+    print(f"\nprecision {result['precision']:.2f}  recall {result['recall']:.2f}  f1 {result['f1']:.2f}")
+    print(f"false positives: {result['false_positives'] or '-'}  missed: {result['missed'] or '-'}")
+    print(f"{len(page_names)} pages in {best * 1000:.1f} ms ({len(page_names) / best:.0f} pages/s, best of {repeat})")
+
+    # PNG decoding dominates the time above; measure the feature pass alone on already decoded pages
+    layouts = [chapter_detector.page_layout(chapter_detector.load_page(os.path.join(screenshots, name)))
+               for name in page_names]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        running = chapter_detector.running_lines(layouts)
+        for layout in layouts:
+            chapter_detector.layout_features(layout, running)
+    features_elapsed = (time.perf_counter() - start) / repeat
+    print(f"feature pass only: {len(page_names) / features_elapsed:.0f} pages/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluates the chapter detector against a hand-made marker set "
+                                                 "and a synthetic book.")
+    parser.add_argument('--screenshots', default=os.path.join(repo_dir, 'STEP2_get_screenshots'))
+    parser.add_argument('--markers', default=os.path.join(repo_dir, 'STEP3_new_chapters_screenshots'))
+    parser.add_argument('--threshold', type=float, default=chapter_detector.SCORE_THRESHOLD)
+    parser.add_argument('--repeat', type=int, default=5, help="Runs used to measure the throughput.")
+    parser.add_argument('--synthetic-pages', type=int, default=30,
+                        help="Pages of the synthetic book (0 = only the marker set).")
+    parser.add_argument('--synthetic-chapters', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = {'marker set': evaluate_folder('marker set', args.screenshots, args.markers, args.threshold,
+                                             args.repeat)}
+    if args.synthetic_pages:
+        with tempfile.TemporaryDirectory(prefix='kindle_chapters_') as book:
+            synthetic_book.make_book(book, args.synthetic_pages, args.synthetic_chapters, args.seed)
+            title = f"synthetic book ({args.synthetic_pages} pages, {args.synthetic_chapters} chapters)"
+            results[title] = evaluate_folder(title, os.path.join(book, synthetic_book.SCREENSHOTS_FOLDER),
+                                             os.path.join(book, synthetic_book.MARKERS_FOLDER), args.threshold,
+                                             args.repeat)
+
+    print()
+    for title, result in results.items():
+        print(f"{title:<40} precision {result['precision']:.2f}  recall {result['recall']:.2f}  "
+              f"f1 {result['f1']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
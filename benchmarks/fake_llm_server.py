@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Make the repo modules importable when running from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import llm_client
+
+# A local OpenAI-compatible server (POST /v1/chat/completions) that answers like
+# the stub model, so the 'openai' backend can be benchmarked without a network
+# or a GPU: STEP6 --backend openai --base-url http://127.0.0.1:PORT/v1
+
+
+def make_handler(latency, seconds_per_token):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self.send_error(404)
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            prompt = request['messages'][-1]['content']
+            answer = llm_client.stub_answer(prompt)
+            time.sleep(latency + seconds_per_token * llm_client.estimate_tokens(answer))
+            body = json.dumps({
+                'id': 'fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': request['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': answer}}],
+                'usage': {'prompt_tokens': llm_client.estimate_tokens(prompt),
+                          'completion_tokens': llm_client.estimate_tokens(answer),
+                          'total_tokens': llm_client.estimate_tokens(prompt) + llm_client.estimate_tokens(answer)},
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start(port=0, latency=0.5, seconds_per_token=0.0):
+    """Starts the server in a background thread; returns (server, base_url). Stop it with server.shutdown()."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(latency, seconds_per_token))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake OpenAI-compatible model server.")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--seconds-per-token', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, base_url = start(args.port, args.latency, args.seconds_per_token)
+    print(f"Fake model server on {base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
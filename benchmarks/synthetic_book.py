@@ -0,0 +1,247 @@
+import os
+import json
+import random
+import shutil
+import argparse
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Synthetic books for the benchmarks: renders an N-page, two-column book the way
+# STEP2 saves it (one image per column, page_0001.png, page_0002.png, ...), with
+# a running header and a page number on every column, a heading on the first
+# column of each chapter, and the chapter markers STEP3 expects. Because the
+# text is generated, the exact ground truth is known:
+#   book/STEP2_get_screenshots/page_NNNN.png   the column images
+#   book/STEP3_new_chapters_screenshots/       the first column of each chapter
+#   book/ground_truth/NN.txt                   the text of each chapter (paragraphs separated by blank lines)
+#   book/ground_truth/detections.json          {page name: [[box, text, confidence], ...]} one per rendered line
+# GroundTruthReader stands in for easyocr.Reader and answers with those
+# detections (optionally with OCR-like errors), so the rest of STEP5 and STEP6
+# can be benchmarked without the model.
+
+SCREENSHOTS_FOLDER = 'STEP2_get_screenshots'
+MARKERS_FOLDER = 'STEP3_new_chapters_screenshots'
+GROUND_TRUTH_FOLDER = 'ground_truth'
+DETECTIONS_FILE = 'detections.json'
+
+TITLE = "O Livro Sintético"
+
+COLUMN_WIDTH = 760
+COLUMN_HEIGHT = 1000
+MARGIN = 48
+FONT_SIZE = 22
+LINE_SPACING = 1.5
+PARAGRAPH_INDENT = 3  # in font sizes
+
+WORDS = (
+    "a o de que e do da em um para com não uma os no se na por mais as dos como mas foi ao ele das tem à seu "
+    "sua ou ser quando muito há nos já está eu também só pelo pela até isso ela entre era depois sem mesmo aos "
+    "ter seus quem nas me esse eles estão você tinha foram essa num nem suas meu às minha têm numa pelos elas "
+    "havia seja qual será nós tenho lhe deles essas esses pelas este fosse dele casa tempo cidade noite janela "
+    "caminho rio mar porta carta livro memória silêncio coração manhã tarde palavra história mão olhos rosto "
+    "voz sombra luz chuva vento estrada jardim mesa cadeira sonho verdade medo saudade caminhava olhava dizia "
+    "pensava sabia esperava lembrava abriu fechou voltou chegou partiu escreveu respondeu perguntou sorriu "
+    "antigo pequeno grande velho novo escuro claro longo breve frio quente triste alegre sereno inquieto"
+).split()
+
+# Character confusions typical of OCR, used by GroundTruthReader(noise=...)
+CONFUSIONS = {
+    'e': 'c', 'c': 'e', 'l': '1', 'i': 'l', 'o': '0', 'a': 'o', 'n': 'h', 'h': 'n', 'u': 'v', 's': '5',
+    'm': 'rn', 'ã': 'a', 'é': 'e', 'ç': 'c', 'í': 'i', 'á': 'a',
+}
+
+
+def load_font(size):
+    for name in ('DejaVuSans.ttf', 'Arial.ttf', 'arial.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def make_sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(5, 16))]
+    words[0] = words[0].capitalize()
+    sentence = ' '.join(words)
+    if len(words) > 8 and rng.random() < 0.5:
+        cut = sentence.rfind(' ', 0, len(sentence) // 2)
+        sentence = sentence[:cut] + ',' + sentence[cut:]
+    return sentence + rng.choice('...!?')
+
+
+def make_paragraph(rng):
+    return ' '.join(make_sentence(rng) for _ in range(rng.randint(1, 6)))
+
+
+def wrap(words, font, width):
+    """Splits words into lines no wider than width; returns (line, remaining words)."""
+    line = []
+    while words:
+        candidate = ' '.join(line + [words[0]])
+        if line and font.getlength(candidate) > width:
+            break
+        line.append(words.pop(0))
+    return ' '.join(line), words
+
+
+class ColumnWriter:
+    """Renders lines into column images, starting a new column when one is full."""
+
+    def __init__(self, folder, column_width, column_height, font_size):
+        self.folder = folder
+        self.width = column_width
+        self.height = column_height
+        self.font = load_font(font_size)
+        self.small_font = load_font(max(10, font_size * 2 // 3))
+        self.heading_font = load_font(font_size * 2)
+        self.line_height = int(font_size * LINE_SPACING)
+        self.indent = PARAGRAPH_INDENT * font_size
+        self.pages = []
+        self.detections = {}
+        self.image = None
+
+    def new_column(self):
+        self.save()
+        number = len(self.pages) + 1
+        self.name = f"page_{number:04d}.png"
+        self.pages.append(self.name)
+        self.image = Image.new('RGB', (self.width, self.height), 'white')
+        self.draw = ImageDraw.Draw(self.image)
+        self.detections[self.name] = []
+        # Running header and page number: the OCR reads them, the ground truth leaves them out
+        self.text(MARGIN, MARGIN // 2, TITLE, self.small_font)
+        self.text(self.width // 2, self.height - MARGIN, str(number), self.small_font)
+        self.y = MARGIN + self.line_height
+
+    def text(self, x, y, text, font):
+        self.draw.text((x, y), text, fill='black', font=font)
+        left, top, right, bottom = self.draw.textbbox((x, y), text, font=font)
+        box = [[left, top], [right, top], [right, bottom], [left, bottom]]
+        self.detections[self.name].append([box, text, 0.99])
+
+    def fits(self, height):
+        return self.y + height <= self.height - 2 * MARGIN
+
+    def heading(self, text):
+        self.text(MARGIN, self.y + self.line_height, text, self.heading_font)
+        self.y += 4 * self.line_height
+
+    def paragraph(self, text, last_column):
+        """Writes a paragraph; returns the lines written (it stops early once last_column is full)."""
+        words = text.split()
+        written = []
+        first = True
+        while words:
+            if not self.fits(self.line_height):
+                if len(self.pages) >= last_column:
+                    break
+                self.new_column()
+            x = MARGIN + (self.indent if first else 0)
+            line, words = wrap(words, self.font, self.width - MARGIN - x)
+            self.text(x, self.y, line, self.font)
+            written.append(line)
+            self.y += self.line_height
+            first = False
+        return written
+
+    def save(self):
+        if self.image is not None:
+            self.image.save(os.path.join(self.folder, self.name))
+
+
+def make_book(folder, pages=20, chapters=4, seed=0, column_width=COLUMN_WIDTH, column_height=COLUMN_HEIGHT,
+              font_size=FONT_SIZE):
+    """
+    Renders a book of `pages` two-column pages (2 * pages column images) split into
+    `chapters` chapters of about the same length. Returns the book's ground truth as
+    {chapter name: text}.
+    """
+    rng = random.Random(seed)
+    screenshots = os.path.join(folder, SCREENSHOTS_FOLDER)
+    markers = os.path.join(folder, MARKERS_FOLDER)
+    truth_folder = os.path.join(folder, GROUND_TRUTH_FOLDER)
+    for path in (screenshots, markers, truth_folder):
+        os.makedirs(path, exist_ok=True)
+
+    columns = 2 * pages
+    chapters = max(1, min(chapters, columns))
+    writer = ColumnWriter(screenshots, column_width, column_height, font_size)
+    truth = {}
+    first_columns = []
+    for number in range(1, chapters + 1):
+        last_column = round(number * columns / chapters)
+        writer.new_column()
+        first_columns.append(writer.name)
+        heading = f"Capítulo {number}"
+        writer.heading(heading)
+        paragraphs = [heading]
+        while writer.fits(writer.line_height) or len(writer.pages) < last_column:
+            lines = writer.paragraph(make_paragraph(rng), last_column)
+            if not lines:
+                break
+            paragraphs.append(' '.join(lines))
+        truth[f"{number:02d}"] = '\n\n'.join(paragraphs)
+    writer.save()
+    for name in first_columns:
+        shutil.copy2(os.path.join(screenshots, name), os.path.join(markers, name))
+
+    for name, text in truth.items():
+        with open(os.path.join(truth_folder, f"{name}.txt"), 'w', encoding='utf-8') as f:
+            f.write(text)
+    with open(os.path.join(truth_folder, DETECTIONS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(writer.detections, f, ensure_ascii=False)
+    return truth
+
+
+def add_noise(text, rng, rate):
+    """Replaces characters by typical OCR confusions; about `rate` of the words get one error."""
+    words = text.split(' ')
+    for i, word in enumerate(words):
+        candidates = [j for j, c in enumerate(word) if c in CONFUSIONS]
+        if candidates and rng.random() < rate:
+            j = rng.choice(candidates)
+            words[i] = word[:j] + CONFUSIONS[word[j]] + word[j + 1:]
+    return ' '.join(words)
+
+
+class GroundTruthReader:
+    """
+    Stand-in for easyocr.Reader on a synthetic book: readtext(path) returns the
+    rendered lines of that column. With noise > 0, that fraction of the words get an
+    OCR-like error and their line a low confidence (deterministic for a given seed).
+    """
+
+    def __init__(self, book_folder, noise=0.0, seed=0):
+        with open(os.path.join(book_folder, GROUND_TRUTH_FOLDER, DETECTIONS_FILE), 'r', encoding='utf-8') as f:
+            self.detections = json.load(f)
+        self.noise = noise
+        self.seed = seed
+
+    def readtext(self, image):
+        name = os.path.basename(image)
+        rng = random.Random(f"{self.seed}:{name}")
+        result = []
+        for box, text, confidence in self.detections[name]:
+            noisy = add_noise(text, rng, self.noise) if self.noise else text
+            result.append((box, noisy, confidence if noisy == text else round(rng.uniform(0.1, 0.45), 2)))
+        return result
+
+    def readtext_batched(self, images):
+        return [self.readtext(image) for image in images]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders a synthetic two-column book with its ground truth.")
+    parser.add_argument('folder')
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--chapters', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    truth = make_book(args.folder, args.pages, args.chapters, args.seed)
+    print(f"Wrote {args.pages} pages ({2 * args.pages} column images) in {len(truth)} chapters to '{args.folder}'.")
+
+
+if __name__ == "__main__":
+    main()
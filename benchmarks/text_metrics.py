@@ -0,0 +1,66 @@
+import re
+import difflib
+import unicodedata
+
+# Character and word error rates for comparing OCR output with a reference text.
+# Both texts are normalized first (case, accents, punctuation, whitespace), so the
+# rates measure what the OCR read, not its formatting.
+
+# Texts with more words than this (whole chapters or books) are first aligned on
+# their matching words, and only the differing stretches are compared character
+# by character; the full edit distance would take minutes
+ALIGN_WORDS = 1000
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two sequences (strings or lists of words)."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, item_a in enumerate(a, start=1):
+        current = [i]
+        for j, item_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (item_a != item_b)))
+        previous = current
+    return previous[-1]
+
+
+def aligned_distances(a_words, b_words):
+    """
+    (character, word) edit distances between two word lists, computed only over the
+    stretches between matching words. Equal to the full distances except for rare
+    alignments where it can be slightly higher.
+    """
+    chars = words = 0
+    matcher = difflib.SequenceMatcher(None, a_words, b_words, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        a, b = ' '.join(a_words[i1:i2]), ' '.join(b_words[j1:j2])
+        # An inserted or deleted stretch also adds or removes the space next to it
+        chars += edit_distance(a, b) + (tag != 'replace')
+        words += max(i2 - i1, j2 - j1)
+    return chars, words
+
+
+def cer(hypothesis, reference):
+    """Character error rate of hypothesis against reference, after normalizing both."""
+    hypothesis, reference = normalize(hypothesis), normalize(reference)
+    if max(hypothesis.count(' '), reference.count(' ')) >= ALIGN_WORDS:
+        return aligned_distances(hypothesis.split(), reference.split())[0] / max(1, len(reference))
+    return edit_distance(hypothesis, reference) / max(1, len(reference))
+
+
+def wer(hypothesis, reference):
+    """Word error rate of hypothesis against reference, after normalizing both."""
+    hypothesis, reference = normalize(hypothesis).split(), normalize(reference).split()
+    if max(len(hypothesis), len(reference)) >= ALIGN_WORDS:
+        return aligned_distances(hypothesis, reference)[1] / max(1, len(reference))
+    return edit_distance(hypothesis, reference) / max(1, len(reference))
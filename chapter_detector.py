@@ -0,0 +1,233 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Proposes chapter starts from the page screenshots alone, using cheap layout
+# features of each column image: a chapter opening in a Kindle two-column capture
+# starts lower on the page, has a heading taller than the body lines, a large
+# blank band between the heading and the text, and usually follows a page that
+# is blank or ends early. Running headers and page numbers, which sit at the
+# same rows on most pages, are left out before measuring.
+
+# Width the pages are reduced to before measuring anything
+ANALYSIS_WIDTH = 256
+
+# Pixels darker than this (0-255) count as ink
+INK_THRESHOLD = 160
+
+# A row is a text row if more than this fraction of its pixels is ink
+ROW_INK_FRACTION = 0.005
+
+# Text rows separated by at most this many blank rows belong to the same line (accents, descenders)
+LINE_MERGE_GAP = 2
+
+# A line near the top or bottom of the page, set apart from the text by a wide gap,
+# is a running header or page number if it sits at the same rows on this fraction
+# of the pages
+RUNNING_BAND = 0.12          # fraction of the page height at the top and at the bottom
+RUNNING_GAP_RATIO = 2.0      # gap to the text / median gap between lines
+RUNNING_FRACTION = 0.5
+RUNNING_TOLERANCE = 1        # rows
+
+# Feature thresholds and their weights in the score
+TOP_MARGIN_MIN = 0.04        # fraction of the page height above the first line
+HEADING_RATIO_MIN = 1.35     # first line height / median line height
+GAP_MIN = 0.12               # largest blank band between lines / page height
+DENSITY_MAX = 0.075          # fraction of ink pixels
+PREVIOUS_BOTTOM_MIN = 0.30   # blank band at the bottom of the previous page / page height
+
+WEIGHTS = {
+    'top_margin': 1.0,
+    'heading': 1.5,
+    'gap': 1.0,
+    'low_density': 0.5,
+    'previous_ends': 1.0,
+}
+SCORE_THRESHOLD = 2.5
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def load_page(file_path, width=ANALYSIS_WIDTH):
+    """Decodes a screenshot as grayscale and shrinks it to the analysis width."""
+    gray = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError(f"Could not read image '{file_path}'")
+    height, original_width = gray.shape
+    if original_width > width:
+        gray = cv2.resize(gray, (width, max(1, height * width // original_width)), interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def page_layout(gray):
+    """The text lines of one page: a dict with their start and end rows, the ink of each row and the page size."""
+    ink = gray < INK_THRESHOLD
+    height, width = ink.shape
+    row_ink = ink.sum(axis=1)
+    text_rows = row_ink > ROW_INK_FRACTION * width
+
+    # Start/end of each run of text rows
+    edges = np.diff(np.concatenate(([0], text_rows.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts):
+        # Merge runs split by accents or descenders into whole lines
+        keep = np.concatenate(([True], (starts[1:] - ends[:-1]) > LINE_MERGE_GAP))
+        ends = np.concatenate((ends[np.flatnonzero(keep)[1:] - 1], ends[-1:]))
+        starts = starts[keep]
+    return {'starts': starts, 'ends': ends, 'row_ink': row_ink, 'height': height, 'width': width}
+
+
+def _margin_lines(layout):
+    """Indexes of the lines that could be a running header or page number: set apart at the top or bottom."""
+    starts, ends, height = layout['starts'], layout['ends'], layout['height']
+    if len(starts) < 2:
+        return []
+    gaps = starts[1:] - ends[:-1]
+    wide = RUNNING_GAP_RATIO * max(1.0, float(np.median(gaps)))
+    candidates = []
+    for i in range(len(starts) - 1):
+        if ends[i] > RUNNING_BAND * height or gaps[i] < wide:
+            break
+        candidates.append(i)
+    for i in range(len(starts) - 1, 0, -1):
+        if starts[i] < (1 - RUNNING_BAND) * height or gaps[i - 1] < wide:
+            break
+        candidates.append(i)
+    return candidates
+
+
+def running_lines(layouts):
+    """
+    The (start, end) rows of the running headers and page numbers of a book: margin
+    lines found at the same rows on at least RUNNING_FRACTION of its pages.
+    """
+    counts = Counter()
+    pages = 0
+    for layout in layouts:
+        if len(layout['starts']):
+            pages += 1
+        for i in _margin_lines(layout):
+            counts[(int(layout['starts'][i]), int(layout['ends'][i]))] += 1
+    if pages < 2:
+        return set()
+
+    def nearby(start, end):
+        return sum(counts.get((start + ds, end + de), 0)
+                   for ds in range(-RUNNING_TOLERANCE, RUNNING_TOLERANCE + 1)
+                   for de in range(-RUNNING_TOLERANCE, RUNNING_TOLERANCE + 1))
+
+    minimum = max(2, RUNNING_FRACTION * pages)
+    return {rows for rows in counts if nearby(*rows) >= minimum}
+
+
+def _is_running(start, end, running):
+    return any((start + ds, end + de) in running
+               for ds in range(-RUNNING_TOLERANCE, RUNNING_TOLERANCE + 1)
+               for de in range(-RUNNING_TOLERANCE, RUNNING_TOLERANCE + 1))
+
+
+def layout_features(layout, running=()):
+    """
+    Measures the layout of one page, leaving out its running lines (see running_lines).
+    Returns a dict of floats (blank pages have 'blank': True).
+    """
+    starts, ends, row_ink = layout['starts'], layout['ends'], layout['row_ink']
+    ignored = {i for i in _margin_lines(layout) if _is_running(int(starts[i]), int(ends[i]), running)}
+    if ignored:
+        row_ink = row_ink.copy()
+        for i in ignored:
+            row_ink[starts[i]:ends[i]] = 0
+    lines = [i for i in range(len(starts)) if i not in ignored]
+    if not lines:
+        return {'blank': True, 'top_margin': 1.0, 'bottom_margin': 1.0,
+                'heading_ratio': 0.0, 'max_gap': 0.0, 'density': 0.0}
+
+    height = layout['height']
+    line_starts = starts[lines]
+    line_ends = ends[lines]
+    line_heights = line_ends - line_starts
+    gaps = line_starts[1:] - line_ends[:-1]
+
+    return {
+        'blank': False,
+        'top_margin': line_starts[0] / height,
+        'bottom_margin': (height - line_ends[-1]) / height,
+        'heading_ratio': line_heights[0] / max(1.0, float(np.median(line_heights))),
+        'max_gap': (gaps.max() / height) if len(gaps) else 0.0,
+        'density': float(row_ink.sum()) / (height * layout['width']),
+    }
+
+
+def page_features(gray, running=()):
+    """Measures the layout of one page (see layout_features)."""
+    return layout_features(page_layout(gray), running)
+
+
+def score_page(features, previous_features=None):
+    """Combines the features of a page (and of the page before it) into a chapter-start score."""
+    if features['blank']:
+        return 0.0
+    score = 0.0
+    if features['top_margin'] >= TOP_MARGIN_MIN:
+        score += WEIGHTS['top_margin']
+    if features['heading_ratio'] >= HEADING_RATIO_MIN:
+        score += WEIGHTS['heading']
+    if features['max_gap'] >= GAP_MIN:
+        score += WEIGHTS['gap']
+    if features['density'] <= DENSITY_MAX:
+        score += WEIGHTS['low_density']
+    if previous_features is not None and previous_features['bottom_margin'] >= PREVIOUS_BOTTOM_MIN:
+        score += WEIGHTS['previous_ends']
+    return score
+
+
+def list_pages(folder):
+    return sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def compute_features(folder, page_names, workers=None):
+    """Features of every page, without the book's running lines. Decoding runs in threads (OpenCV releases the GIL)."""
+    def layout_of(name):
+        return page_layout(load_page(os.path.join(folder, name)))
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        layouts = list(executor.map(layout_of, page_names))
+    running = running_lines(layouts)
+    return [layout_features(layout, running) for layout in layouts]
+
+
+def detect_chapter_starts(folder, threshold=SCORE_THRESHOLD, workers=None):
+    """
+    Returns (page_names, scores, starts): the sorted pages of the folder, the score of
+    each one, and the names of the pages proposed as chapter starts.
+    The first non-blank page always starts the first chapter.
+    """
+    page_names = list_pages(folder)
+    features = compute_features(folder, page_names, workers)
+
+    scores = []
+    starts = []
+    for index, page in enumerate(features):
+        previous = features[index - 1] if index > 0 else None
+        score = score_page(page, previous)
+        scores.append(score)
+        if page['blank']:
+            continue
+        if not starts or score >= threshold:
+            starts.append(page_names[index])
+    return page_names, scores, starts
+
+
+def evaluate(predicted, expected):
+    """Precision, recall and F1 of the predicted chapter starts against the expected ones."""
+    predicted, expected = set(predicted), set(expected)
+    true_positives = len(predicted & expected)
+    precision = true_positives / len(predicted) if predicted else 0.0
+    recall = true_positives / len(expected) if expected else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': precision, 'recall': recall, 'f1': f1,
+            'false_positives': sorted(predicted - expected), 'missed': sorted(expected - predicted)}
@@ -0,0 +1,114 @@
+import os
+import json
+import shutil
+
+# The chapter manifest maps each chapter to its pages in the screenshots folder.
+# STEP4 writes it and STEP5/STEP6 read it, so the screenshots never need to be
+# copied into per-chapter folders (see materialize() for people who still want them).
+
+MANIFEST_PATH = 'STEP4_chapters.json'
+MANIFEST_VERSION = 1
+
+MATERIALIZE_MODES = ('hardlink', 'symlink', 'copy')
+
+
+def build_manifest(screenshots_folder, page_names, marker_names, manifest_path=MANIFEST_PATH, duplicates=None):
+    """
+    Splits the sorted page_names into chapters starting at each marker, in one pass.
+    Returns (manifest, missing_markers); markers that are not among the pages are skipped.
+    duplicates ({page: page it repeats}) are left out of the chapters, except for markers;
+    start/end are then positions in the deduplicated page list.
+    """
+    markers = set(marker_names)
+    duplicates = {page: original for page, original in (duplicates or {}).items() if page not in markers}
+    pages = sorted(page for page in page_names if page not in duplicates)
+    position = {name: index for index, name in enumerate(pages)}
+
+    starts = sorted(position[name] for name in markers if name in position)
+    missing = sorted(name for name in markers if name not in position)
+
+    chapters = []
+    for number, start in enumerate(starts, start=1):
+        end = starts[number] if number < len(starts) else len(pages)
+        chapters.append({
+            'number': number,
+            'name': f"{number:02d}",
+            'start': start,
+            'end': end,
+            'pages': pages[start:end],
+        })
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    manifest = {
+        'version': MANIFEST_VERSION,
+        # Stored relative to the manifest so the book folder can be moved around
+        'screenshots_folder': os.path.relpath(os.path.abspath(screenshots_folder), manifest_dir),
+        'chapters': chapters,
+    }
+    if duplicates:
+        manifest['duplicates'] = dict(sorted(duplicates.items()))
+    return manifest, missing
+
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    os.replace(temp_path, manifest_path)
+
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """Returns the manifest, or None if there isn't one."""
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported chapter manifest version in '{manifest_path}': {manifest.get('version')}")
+    return manifest
+
+
+def screenshots_folder(manifest, manifest_path=MANIFEST_PATH):
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    return os.path.normpath(os.path.join(manifest_dir, manifest['screenshots_folder']))
+
+
+def chapter_page_paths(manifest, manifest_path=MANIFEST_PATH):
+    """Returns a list of (chapter_name, [image paths]) in chapter order."""
+    folder = screenshots_folder(manifest, manifest_path)
+    return [
+        (chapter['name'], [os.path.join(folder, page) for page in chapter['pages']])
+        for chapter in manifest['chapters']
+    ]
+
+
+def chapter_names(manifest):
+    return [chapter['name'] for chapter in manifest['chapters']]
+
+
+def _place(source, destination, mode):
+    if os.path.lexists(destination):
+        os.unlink(destination)
+    if mode == 'hardlink':
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            # e.g. destination on another filesystem: fall back to a real copy
+            pass
+    elif mode == 'symlink':
+        os.symlink(os.path.relpath(source, os.path.dirname(destination)), destination)
+        return
+    shutil.copy2(source, destination)
+
+
+def materialize(manifest, destination_folder, mode='hardlink', manifest_path=MANIFEST_PATH):
+    """Creates the old NN/ chapter folders from the manifest, using hardlinks, symlinks or copies."""
+    if mode not in MATERIALIZE_MODES:
+        raise ValueError(f"Unknown materialize mode '{mode}', expected one of {MATERIALIZE_MODES}")
+    for name, paths in chapter_page_paths(manifest, manifest_path):
+        chapter_folder = os.path.join(destination_folder, name)
+        os.makedirs(chapter_folder, exist_ok=True)
+        for source in paths:
+            _place(source, os.path.join(chapter_folder, os.path.basename(source)), mode)
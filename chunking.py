@@ -0,0 +1,130 @@
+import re
+from collections import namedtuple
+
+from llm_client import estimate_tokens
+
+# Splits a STEP5 chapter (one paragraph per line block) into pieces under a token
+# budget so long chapters can be corrected in parallel and stitched back.
+# Each chunk carries a little read-only context from its neighbours: the model
+# sees where the text comes from and goes to, but only rewrites the body, so
+# nothing is duplicated or lost at the seams.
+
+Chunk = namedtuple('Chunk', ['context_before', 'body', 'context_after'])
+
+# Characters of neighbouring text given as context on each side of a chunk; small
+# budgets get less, so the context never takes more than half of a chunk
+CONTEXT_CHARS = 300
+# Smallest budget that still leaves room for a few sentences of body
+MIN_CHUNK_TOKENS = 64
+
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+TERMINAL_PUNCTUATION = ('.', '!', '?', '…', ':', '"', '”', '»')
+
+
+def _split_long_unit(unit, max_tokens):
+    """Splits a single paragraph that is over the budget at sentence ends, then at spaces (never inside a word)."""
+    pieces = []
+    current = ''
+    for sentence in SENTENCE_END.split(unit):
+        candidate = f"{current} {sentence}".strip()
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            candidate = sentence
+        current = candidate
+    if current:
+        pieces.append(current)
+
+    # Sentences that are still too long are cut between words
+    result = []
+    max_chars = max_tokens * 4
+    for piece in pieces:
+        while len(piece) > max_chars:
+            cut = piece.rfind(' ', 0, max_chars + 1)
+            if cut <= 0:
+                # A word longer than the budget is kept whole
+                cut = piece.find(' ')
+                if cut < 0:
+                    break
+            result.append(piece[:cut])
+            piece = piece[cut:].lstrip()
+        result.append(piece)
+    return result
+
+
+def split_units(text, max_tokens):
+    """The paragraphs of the chapter, with over-budget paragraphs split further."""
+    units = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if estimate_tokens(line) > max_tokens:
+            units.extend(_split_long_unit(line, max_tokens))
+        else:
+            units.append(line)
+    return units
+
+
+def _tail(text, chars):
+    if len(text) <= chars:
+        return text
+    cut = text.find(' ', len(text) - chars)
+    return text[cut + 1:] if cut >= 0 else text[-chars:]
+
+
+def _head(text, chars):
+    if len(text) <= chars:
+        return text
+    cut = text.rfind(' ', 0, chars)
+    return text[:cut] if cut > 0 else text[:chars]
+
+
+def make_chunks(text, max_tokens, context_chars=CONTEXT_CHARS):
+    """
+    Packs the paragraphs of text into chunks whose body stays under max_tokens (the
+    context is budgeted too). Paragraphs are never reordered; a chapter that fits
+    returns one chunk. Raises ValueError if max_tokens is below MIN_CHUNK_TOKENS.
+    """
+    if max_tokens < MIN_CHUNK_TOKENS:
+        raise ValueError(f"max_tokens must be at least {MIN_CHUNK_TOKENS}, got {max_tokens}")
+    # About max_tokens / 4 tokens of context on each side at most
+    context_chars = min(context_chars, max_tokens)
+    body_budget = max_tokens - 2 * estimate_tokens('x' * context_chars)
+    bodies = []
+    current = []
+    for unit in split_units(text, body_budget):
+        if current and estimate_tokens('\n'.join(current + [unit])) > body_budget:
+            bodies.append('\n'.join(current))
+            current = []
+        current.append(unit)
+    if current:
+        bodies.append('\n'.join(current))
+
+    if len(bodies) <= 1:
+        return [Chunk('', text.strip(), '')]
+
+    return [
+        Chunk(_tail(bodies[i - 1], context_chars) if i > 0 else '',
+              body,
+              _head(bodies[i + 1], context_chars) if i + 1 < len(bodies) else '')
+        for i, body in enumerate(bodies)
+    ]
+
+
+def stitch(corrected_bodies):
+    """
+    Joins the corrected chunks. A chunk that stops mid-sentence (the split fell inside
+    a paragraph) is continued on the same paragraph; otherwise a paragraph break is kept.
+    """
+    text = ''
+    for body in corrected_bodies:
+        body = body.strip()
+        if not body:
+            continue
+        if not text:
+            text = body
+        elif text.endswith(TERMINAL_PUNCTUATION):
+            text += '\n\n' + body
+        else:
+            text += ' ' + body
+    return text
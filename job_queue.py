@@ -0,0 +1,56 @@
+import queue
+import threading
+from collections import deque
+
+# A job queue in front of one multiprocessing pool, shared by several producers
+# (the books of a batch run). Each producer submits its jobs with imap(), like on
+# the pool itself, but jobs are handed to the pool one producer at a time, in
+# turn, and only a few at a time: a book with 500 pages gets the same share of
+# the workers as a book with 20, and a producer that starts late does not wait
+# behind every job already submitted.
+
+
+class FairJobQueue:
+
+    def __init__(self, pool, max_in_flight):
+        """pool: a running multiprocessing pool; max_in_flight: jobs handed to it at once (about 2 per worker)."""
+        self.pool = pool
+        self.max_in_flight = max(1, max_in_flight)
+        self.lock = threading.Lock()
+        self.producers = deque()  # deques of (func, arg, result slot), in turn order
+        self.in_flight = 0
+
+    def imap(self, func, iterable):
+        """Same as Pool.imap: yields func(arg) for each arg, in order, as each one is done."""
+        jobs = deque((func, arg, queue.Queue(maxsize=1)) for arg in iterable)
+        slots = [slot for _, _, slot in jobs]
+        if jobs:
+            with self.lock:
+                self.producers.append(jobs)
+            self._dispatch()
+        for slot in slots:
+            ok, value = slot.get()
+            if not ok:
+                raise value
+            yield value
+
+    def _dispatch(self):
+        while True:
+            with self.lock:
+                if self.in_flight >= self.max_in_flight or not self.producers:
+                    return
+                jobs = self.producers.popleft()
+                func, arg, slot = jobs.popleft()
+                if jobs:
+                    # Back of the line until every other producer had a turn
+                    self.producers.append(jobs)
+                self.in_flight += 1
+            self.pool.apply_async(func, (arg,), callback=lambda value, slot=slot: self._done(slot, True, value),
+                                  error_callback=lambda error, slot=slot: self._done(slot, False, error))
+
+    def _done(self, slot, ok, value):
+        # Runs in the pool's result thread
+        with self.lock:
+            self.in_flight -= 1
+        slot.put((ok, value))
+        self._dispatch()
@@ -0,0 +1,366 @@
+import os
+import json
+import time
+import random
+import asyncio
+
+import metrics
+
+# Async helpers for the STEP6 model calls: bounded concurrency, a token-bucket
+# rate limiter (requests and tokens per minute) and exponential backoff with
+# jitter for transient API errors.
+#
+# Backends are async callables `await generate(prompt) -> text` with a `name`
+# (used in the response cache key): Gemini, any OpenAI-compatible endpoint
+# (including a local llama.cpp/vLLM server) and a deterministic stub. Batch
+# backends instead have `await run(prompts) -> [text or exception]` and are
+# driven by process_batch.
+
+# HTTP status codes worth retrying (rate limit and server-side errors)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Exception class names used by google.api_core (and others) for the same errors
+RETRYABLE_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'InternalServerError', 'ServiceUnavailable',
+    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'RateLimitError', 'APITimeoutError',
+    'APIConnectionError', 'TimeoutError', 'ConnectionError',
+}
+
+
+class EmptyResponseError(Exception):
+    """The model answered without text (e.g. the prompt was blocked). Not retried."""
+
+
+class BatchRequestError(Exception):
+    """A request of a batch job failed; code is its HTTP status (a 429 or 5xx is retryable)."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token), good enough for rate limiting."""
+    return len(text) // 4 + 1
+
+
+def is_retryable(error):
+    if isinstance(error, EmptyResponseError):
+        return False
+    for value in (getattr(error, 'code', None), getattr(error, 'status_code', None)):
+        if isinstance(value, int) and value in RETRYABLE_STATUS:
+            return True
+    return any(cls.__name__ in RETRYABLE_NAMES for cls in type(error).__mro__)
+
+
+class TokenBucket:
+    """Allows up to `rate_per_minute` units per minute, with bursts up to the same amount."""
+
+    def __init__(self, rate_per_minute, clock=time.monotonic):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.refill_per_second = rate_per_minute / 60.0
+        self.clock = clock
+        self.updated = clock()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        # A single request larger than the bucket would wait forever otherwise
+        amount = min(float(amount), self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.refill_per_second)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits; either may be None (unlimited)."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, tokens):
+        if self.requests:
+            await self.requests.acquire(1)
+        if self.tokens:
+            await self.tokens.acquire(tokens)
+
+
+async def call_with_backoff(func, *args, max_retries=5, base_delay=1.0, max_delay=60.0, on_retry=None):
+    """Awaits func(*args), retrying transient errors with exponential backoff and full jitter."""
+    attempt = 0
+    while True:
+        try:
+            return await func(*args)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            attempt += 1
+            if on_retry:
+                on_retry(attempt, delay, e)
+            await asyncio.sleep(delay)
+
+
+async def process_all(items, generate, on_result, concurrency=4, limiter=None, max_retries=5,
+                      base_delay=1.0, on_retry=None, cache=None):
+    """
+    Calls `await generate(prompt)` for every (key, prompt) in items, with at most
+    `concurrency` calls in flight. `on_result(key, text, error)` runs as soon as each
+    call completes (error is None on success). Items with the same prompt share a
+    single call. With a cache (see response_cache.py), cached prompts are answered
+    without a call or a wait for the rate limiter, and new answers are stored.
+    Returns the number of failed items.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = limiter or RateLimiter()
+
+    keys_by_prompt = {}
+    for key, prompt in items:
+        keys_by_prompt.setdefault(prompt, []).append(key)
+    metrics.count('step6', 'coalesced_requests', sum(len(keys) - 1 for keys in keys_by_prompt.values()))
+    in_flight = 0
+
+    def deliver(prompt, text, error):
+        for key in keys_by_prompt[prompt]:
+            on_result(key, text, error)
+
+    def retried(key, attempt, delay, e):
+        metrics.count('step6', 'retries', item=str(key))
+        if on_retry:
+            on_retry(key, attempt, delay, e)
+
+    async def run_one(prompt):
+        nonlocal in_flight
+        key = keys_by_prompt[prompt][0]
+        if cache is not None:
+            text = cache.get(prompt)
+            if text is not None:
+                metrics.count('step6', 'cache_hits')
+                deliver(prompt, text, None)
+                return True
+        async with semaphore:
+            # The expected answer is about as long as the prompt
+            with metrics.timer('step6', 'rate_limit_wait'):
+                await limiter.acquire(2 * estimate_tokens(prompt))
+            in_flight += 1
+            metrics.gauge('step6', 'in_flight', in_flight)
+            try:
+                with metrics.timer('step6', 'request', item=str(key)):
+                    text = await call_with_backoff(
+                        generate, prompt, max_retries=max_retries, base_delay=base_delay,
+                        on_retry=lambda attempt, delay, e: retried(key, attempt, delay, e))
+            except Exception as e:
+                metrics.count('step6', 'failed_requests')
+                deliver(prompt, None, e)
+                return False
+            finally:
+                in_flight -= 1
+            metrics.count('step6', 'tokens_in', estimate_tokens(prompt))
+            metrics.count('step6', 'tokens_out', estimate_tokens(text))
+            if cache is not None:
+                cache.put(prompt, text)
+            deliver(prompt, text, None)
+            return True
+
+    prompts = list(keys_by_prompt)
+    results = await asyncio.gather(*(run_one(prompt) for prompt in prompts))
+    return sum(len(keys_by_prompt[prompt]) for prompt, ok in zip(prompts, results) if not ok)
+
+
+async def process_batch(items, runner, on_result, cache=None):
+    """
+    Same contract as process_all, for batch backends: every uncached prompt is
+    submitted in a single batch job and the results are delivered when it ends.
+    Returns the number of failed items.
+    """
+    keys_by_prompt = {}
+    for key, prompt in items:
+        keys_by_prompt.setdefault(prompt, []).append(key)
+
+    failed = 0
+    to_send = []
+    for prompt, keys in keys_by_prompt.items():
+        text = cache.get(prompt) if cache is not None else None
+        if text is None:
+            to_send.append(prompt)
+        else:
+            for key in keys:
+                on_result(key, text, None)
+
+    metrics.count('step6', 'cache_hits', len(keys_by_prompt) - len(to_send))
+    metrics.count('step6', 'tokens_in', sum(estimate_tokens(prompt) for prompt in to_send))
+    with metrics.timer('step6', 'batch_job', item=f"{len(to_send)} prompts"):
+        results = await runner.run(to_send) if to_send else []
+    for prompt, result in zip(to_send, results):
+        if isinstance(result, Exception):
+            text, error = None, result
+            failed += len(keys_by_prompt[prompt])
+            metrics.count('step6', 'failed_requests')
+        else:
+            text, error = result, None
+            metrics.count('step6', 'tokens_out', estimate_tokens(text))
+            if cache is not None:
+                cache.put(prompt, text)
+        for key in keys_by_prompt[prompt]:
+            on_result(key, text, error)
+    return failed
+
+
+class GeminiGenerator:
+    """
+    Async text generation with a google.generativeai GenerativeModel.
+    (google-generativeai 0.8.5 has no batch API, so there is no Gemini batch backend.)
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.name = model.model_name.split('/')[-1]
+
+    async def __call__(self, prompt):
+        response = await self.model.generate_content_async(prompt)
+        try:
+            return response.text
+        except ValueError:
+            # Blocked or empty responses raise on .text
+            raise EmptyResponseError(f"Resposta sem texto: {response.prompt_feedback}")
+
+
+def _openai_client(base_url=None, api_key=None):
+    from openai import AsyncOpenAI
+
+    # Local servers usually accept any key, but the client insists on having one
+    return AsyncOpenAI(base_url=base_url, api_key=api_key or os.environ.get('OPENAI_API_KEY') or 'local')
+
+
+def _openai_name(model, base_url):
+    return f"{model}@{base_url}" if base_url else model
+
+
+class OpenAIGenerator:
+    """Async chat completions on any OpenAI-compatible endpoint (OpenAI itself, or a local server via base_url)."""
+
+    def __init__(self, model, base_url=None, api_key=None):
+        self.model = model
+        self.name = _openai_name(model, base_url)
+        self.client = _openai_client(base_url, api_key)
+
+    async def __call__(self, prompt):
+        response = await self.client.chat.completions.create(
+            model=self.model, messages=[{'role': 'user', 'content': prompt}])
+        if not response.choices or not response.choices[0].message.content:
+            reason = response.choices[0].finish_reason if response.choices else '-'
+            raise EmptyResponseError(f"Resposta sem texto: {reason}")
+        return response.choices[0].message.content
+
+
+class OpenAIBatchRunner:
+    """
+    OpenAI Batch API: all requests go in one JSONL file, processed by the provider within
+    completion_window at a lower price. run() polls until the batch ends.
+    """
+
+    def __init__(self, model, base_url=None, api_key=None, poll_interval=30.0, completion_window='24h'):
+        self.model = model
+        self.name = _openai_name(model, base_url)
+        self.client = _openai_client(base_url, api_key)
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    async def run(self, prompts):
+        lines = [
+            json.dumps({'custom_id': str(i), 'method': 'POST', 'url': '/v1/chat/completions',
+                        'body': {'model': self.model, 'messages': [{'role': 'user', 'content': prompt}]}})
+            for i, prompt in enumerate(prompts)
+        ]
+        input_file = await self.client.files.create(file=('batch.jsonl', '\n'.join(lines).encode('utf-8')),
+                                                    purpose='batch')
+        batch = await self.client.batches.create(input_file_id=input_file.id, endpoint='/v1/chat/completions',
+                                                 completion_window=self.completion_window)
+        while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+
+        results = [RuntimeError(f"Lote {batch.id} terminou com status '{batch.status}'")] * len(prompts)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.client.files.content(file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                index = int(entry['custom_id'])
+                response = entry.get('response') or {}
+                status = response.get('status_code')
+                body = response.get('body') or {}
+                if entry.get('error') or (status is not None and status != 200):
+                    # A failed request (rate limit, server error...), not an empty answer: the
+                    # chapter stays pending and is sent again on the next run
+                    error = entry.get('error') or body.get('error') or {}
+                    message = error.get('message') if isinstance(error, dict) else error
+                    results[index] = BatchRequestError(f"Requisição do lote falhou ({status}): {message}", status)
+                    continue
+                choices = body.get('choices') or []
+                text = choices[0]['message']['content'] if choices else None
+                results[index] = text if text else EmptyResponseError(
+                    f"Resposta sem texto: {choices[0].get('finish_reason') if choices else body}")
+        return results
+
+
+def stub_answer(prompt):
+    """What the stub models answer: the text between the triple quotes of the prompt."""
+    start = prompt.find('"""')
+    end = prompt.rfind('"""')
+    return prompt[start + 3:end] if 0 <= start < end else prompt
+
+
+class StubGenerator:
+    """
+    Fake model for tests and benchmarks: answers with the text between the triple
+    quotes of the prompt after `latency` seconds plus `seconds_per_token` for each
+    token of the answer (like a real model's generation time), failing a fraction
+    of the calls with a retryable error.
+    """
+
+    class TransientError(Exception):
+        code = 503
+
+    def __init__(self, latency=0.5, failure_rate=0.0, seed=None, seconds_per_token=0.0):
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.name = 'stub'
+
+    async def __call__(self, prompt):
+        self.calls += 1
+        answer = stub_answer(prompt)
+        await asyncio.sleep(self.latency + self.seconds_per_token * estimate_tokens(answer))
+        if self.random.random() < self.failure_rate:
+            raise self.TransientError("503 Service Unavailable (stub)")
+        return answer
+
+
+class StubBatchRunner:
+    """Fake batch backend: answers every prompt like StubGenerator after a single `latency` wait."""
+
+    def __init__(self, latency=1.0):
+        self.latency = latency
+        self.name = 'stub'
+        self.batches = 0
+
+    async def run(self, prompts):
+        self.batches += 1
+        await asyncio.sleep(self.latency)
+        return [stub_answer(prompt) for prompt in prompts]
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import atexit
+import contextlib
+from statistics import median
+
+# Per-stage instrumentation for the STEP scripts. When enabled (--metrics FILE on
+# any script, or the KINDLE_METRICS environment variable), every measurement is
+# appended to FILE as a JSON line:
+#   {"t": 1718000000.1, "pid": 1234, "stage": "step5", "kind": "timer", "name": "readtext", "value": 0.84, "item": "page_0001.png"}
+# Kinds: "timer" (seconds), "counter" (summed) and "gauge" (the maximum is kept).
+# The environment variable is inherited by the OCR worker processes, so they write
+# to the same file. summary() aggregates the file into an end-of-run table.
+# When disabled, every call returns right away.
+
+METRICS_ENV = 'KINDLE_METRICS'
+
+# Stage to run under a profiler (--profile STAGE), and which profiler to use
+PROFILE_ENV = 'KINDLE_PROFILE'
+PROFILER_ENV = 'KINDLE_PROFILER'
+PROFILERS = ('cprofile', 'pyinstrument')
+
+_file = None
+_file_path = None
+_run_start = time.time()
+
+
+def path():
+    return os.environ.get(METRICS_ENV) or None
+
+
+def enabled():
+    return path() is not None
+
+
+def enable(file_path):
+    """Starts recording to file_path, for this process and the processes it starts."""
+    global _run_start
+    os.environ[METRICS_ENV] = os.path.abspath(file_path)
+    _run_start = time.time()
+
+
+def _write(event):
+    global _file, _file_path
+    current = path()
+    if _file is None or _file_path != current:
+        if _file is not None:
+            _file.close()
+        directory = os.path.dirname(current)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Line-buffered appends: the worker processes share the file
+        _file = open(current, 'a', encoding='utf-8', buffering=1)
+        _file_path = current
+    _file.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+
+def emit(stage, kind, name, value, item=None):
+    if not enabled():
+        return
+    event = {'t': round(time.time(), 4), 'pid': os.getpid(), 'stage': stage, 'kind': kind, 'name': name,
+             'value': value}
+    if item is not None:
+        event['item'] = item
+    _write(event)
+
+
+def count(stage, name, value=1, item=None):
+    emit(stage, 'counter', name, value, item)
+
+
+def gauge(stage, name, value, item=None):
+    emit(stage, 'gauge', name, value, item)
+
+
+@contextlib.contextmanager
+def timer(stage, name, item=None):
+    """Records how long the block took."""
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        emit(stage, 'timer', name, round(time.perf_counter() - start, 6), item)
+
+
+def timed(stage, name, func):
+    """Wraps func so that each call is recorded as a timer."""
+    def wrapper(*args, **kwargs):
+        with timer(stage, name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def read_events(file_path=None, since=None):
+    """The events recorded in file_path (default: the current file) since the given time."""
+    file_path = file_path or path()
+    if not file_path or not os.path.isfile(file_path):
+        return []
+    if _file is not None:
+        _file.flush()
+    events = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # A worker killed mid-write can leave a partial line
+                continue
+            if since is None or event['t'] >= since:
+                events.append(event)
+    return events
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summary(file_path=None, since=None):
+    """Returns the end-of-run table of the events recorded since the start of this run."""
+    events = read_events(file_path, _run_start if since is None else since)
+    if not events:
+        return "No metrics recorded."
+
+    timers, counters, gauges = {}, {}, {}
+    for event in events:
+        key = (event['stage'], event['name'])
+        if event['kind'] == 'timer':
+            timers.setdefault(key, []).append(event['value'])
+        elif event['kind'] == 'counter':
+            counters[key] = counters.get(key, 0) + event['value']
+        else:
+            gauges[key] = max(gauges.get(key, event['value']), event['value'])
+
+    lines = [f"{'stage':<8} {'timer':<24} {'count':>7} {'total s':>9} {'mean ms':>9} {'p50 ms':>9} "
+             f"{'p95 ms':>9} {'max ms':>9}"]
+    for (stage, name), values in sorted(timers.items()):
+        lines.append(f"{stage:<8} {name:<24} {len(values):>7} {sum(values):>9.2f} "
+                     f"{1000 * sum(values) / len(values):>9.1f} {1000 * median(values):>9.1f} "
+                     f"{1000 * _percentile(values, 0.95):>9.1f} {1000 * max(values):>9.1f}")
+    if counters or gauges:
+        lines.append('')
+        lines.append(f"{'stage':<8} {'counter / gauge (max)':<24} {'value':>12}")
+        for (stage, name), value in sorted(counters.items()):
+            lines.append(f"{stage:<8} {name:<24} {value:>12,}")
+        for (stage, name), value in sorted(gauges.items()):
+            lines.append(f"{stage:<8} {name + ' (max)':<24} {value:>12,}")
+    return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def profile(stage):
+    """Runs the block under a profiler if --profile asked for this stage; writes profile_<stage>.* next to the script."""
+    if os.environ.get(PROFILE_ENV) != stage:
+        yield
+        return
+    profiler_name = os.environ.get(PROFILER_ENV, 'cprofile')
+    if profiler_name == 'pyinstrument':
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            output_path = f"profile_{stage}.html"
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            print(profiler.output_text(unicode=True, color=False))
+            print(f"Profile of {stage} saved to '{output_path}'.")
+        return
+
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        output_path = f"profile_{stage}.prof"
+        profiler.dump_stats(output_path)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        print(f"Profile of {stage} saved to '{output_path}' (open it with snakeviz or pstats).")
+
+
+def add_arguments(parser):
+    """Adds --metrics and --profile to a script's argument parser."""
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Record per-stage timings and counters as JSON lines in FILE and print a summary.")
+    parser.add_argument('--profile', metavar='STAGE', nargs='?', const='*',
+                        help="Run a stage (step2...step6; all of this script if omitted) under a profiler.")
+    parser.add_argument('--profiler', choices=PROFILERS, default='cprofile')
+
+
+def setup(args, stage):
+    """Applies --metrics/--profile; returns the stage name to pass to profile()."""
+    if args.metrics:
+        enable(args.metrics)
+        atexit.register(lambda: print(f"\n--- Metrics ({args.metrics}) ---\n{summary()}"))
+    if args.profile:
+        os.environ[PROFILE_ENV] = stage if args.profile == '*' else args.profile
+        os.environ[PROFILER_ENV] = args.profiler
+    return stage
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# This module keeps the raw easyocr detections of every page already OCR'd,
+# keyed by the image content and the OCR settings, so re-runs of STEP5 only
+# pay model inference for pages they have never seen.
+
+DEFAULT_CACHE_PATH = 'STEP5_ocr_cache/ocr_cache.sqlite3'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Last-access updates of cache hits are written in batches of this many
+TOUCH_BATCH = 64
+# The size cap is enforced every this many new entries (and on close)
+EVICT_EVERY = 200
+# Seconds to wait for another process (STEP2, the OCR daemon...) writing to the cache
+BUSY_TIMEOUT = 60
+
+
+def settings_fingerprint(settings):
+    """Returns a stable string for a dict of OCR settings (languages, model, preprocessing...)."""
+    return json.dumps(settings, sort_keys=True, separators=(',', ':'))
+
+
+def image_key(file_path, settings):
+    """Hashes the bytes of an image together with the OCR settings used to read it."""
+    digest = hashlib.sha256(settings_fingerprint(settings).encode('utf-8'))
+    digest.update(b'\0')
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def detections_to_json(detections):
+    """Converts readtext detections (which may hold numpy numbers) to plain JSON."""
+    return json.dumps([
+        [[[float(x), float(y)] for x, y in box], str(text), float(confidence)]
+        for box, text, confidence in detections
+    ], separators=(',', ':'))
+
+
+def detections_from_json(data):
+    """Rebuilds readtext-shaped detections: a list of (box, text, confidence)."""
+    return [(box, text, confidence) for box, text, confidence in json.loads(data)]
+
+
+class OCRCache:
+    """
+    On-disk cache of readtext detections, stored in SQLite.
+    The total size is capped at max_bytes; the least recently used entries are evicted first.
+    Every new entry is committed right away, so an interrupted run keeps the pages
+    it read and other processes can write to the cache meanwhile. One instance can
+    be shared by several threads.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.touched = []
+        self.puts = 0
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS detections ("
+            " key TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS detections_lru ON detections (last_access)")
+        self.connection.commit()
+
+    def get(self, key):
+        """Returns the cached detections for key, or None."""
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM detections WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.touched.append((time.time(), key))
+            if len(self.touched) >= TOUCH_BATCH:
+                self._write_touched()
+                self.connection.commit()
+        return detections_from_json(row[0])
+
+    def put(self, key, detections):
+        data = detections_to_json(detections)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO detections (key, data, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._write_touched()
+            self.puts += 1
+            if self.puts % EVICT_EVERY == 0:
+                self._evict()
+            # Pages cost seconds of inference each; don't lose them if the run is interrupted
+            self.connection.commit()
+
+    def _write_touched(self):
+        if self.touched:
+            self.connection.executemany("UPDATE detections SET last_access = ? WHERE key = ?", self.touched)
+            self.touched = []
+
+    def total_bytes(self):
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM detections").fetchone()[0]
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits in max_bytes."""
+        with self.lock:
+            removed = self._evict()
+            self.connection.commit()
+        return removed
+
+    def _evict(self):
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+        removed = 0
+        rows = self.connection.execute("SELECT key, size FROM detections ORDER BY last_access")
+        stale_keys = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            stale_keys.append((key,))
+            excess -= size
+            removed += 1
+        self.connection.executemany("DELETE FROM detections WHERE key = ?", stale_keys)
+        return removed
+
+    def close(self):
+        with self.lock:
+            self._write_touched()
+            self._evict()
+            self.connection.commit()
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,211 @@
+import os
+import json
+import secrets
+import argparse
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import metrics
+import ocr_cache
+from job_queue import FairJobQueue
+
+# A long-running pool of STEP5 OCR workers that later runs attach to over a local
+# socket, instead of starting workers and loading the model every time:
+#   python ocr_daemon.py --workers 4       keeps running until Ctrl+C or --stop
+#   python STEP5_ocr_subfolders.py         uses it if it runs with the same OCR settings
+# The daemon writes its address and a random key to STATE_PATH (readable by this
+# user only); connecting requires the key. Requests from several runs at once
+# share the workers through a fair job queue (job_queue.py).
+
+STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'STEP5_ocr_daemon.json')
+
+# Page batches handed to the workers at once, per worker
+JOBS_PER_WORKER = 2
+
+
+def read_state(state_path=STATE_PATH):
+    """The running daemon's address, key, settings..., or None."""
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(state, state_path):
+    temp_path = state_path + '.tmp'
+    # Only this user may read the key
+    with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, state_path)
+
+
+def _open_connection(state):
+    return Client(tuple(state['address']), authkey=bytes.fromhex(state['key']))
+
+
+class DaemonClient:
+    """
+    A connection to the daemon. It can be given to STEP5 as the pool of
+    iter_ocr_pages / ocr_chapters: imap() runs the batches on the daemon's workers.
+    A client must only be used by one thread at a time.
+    """
+
+    def __init__(self, connection, state):
+        self.connection = connection
+        self.settings = state['settings']
+        self.workers = state['workers']
+
+    def imap(self, func, batches):
+        """Yields the detections of each batch of page paths, in order. func is STEP5's ocr_batch,
+        which is what the daemon's workers run."""
+        batches = [[os.path.abspath(path) for path in batch] for batch in batches]
+        self.connection.send(('ocr', batches))
+        for _ in batches:
+            try:
+                ok, result = self.connection.recv()
+            except EOFError:
+                raise RuntimeError("Lost the connection to the OCR daemon.")
+            if not ok:
+                raise RuntimeError(f"OCR daemon error: {result}")
+            yield result
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def connect(settings=None, state_path=STATE_PATH):
+    """
+    Returns a DaemonClient if a daemon is running (with these OCR settings, if
+    given; see STEP5 ocr_settings), or None.
+    """
+    state = read_state(state_path)
+    if state is None:
+        return None
+    if settings is not None and (ocr_cache.settings_fingerprint(settings)
+                                 != ocr_cache.settings_fingerprint(state['settings'])):
+        print("The OCR daemon runs with other OCR settings; not using it.")
+        return None
+    try:
+        return DaemonClient(_open_connection(state), state)
+    except (OSError, AuthenticationError):
+        # Left behind by a daemon that didn't shut down cleanly
+        return None
+
+
+def _handle(connection, jobs, on_stop):
+    import STEP5_ocr_subfolders as step5
+
+    with connection:
+        while True:
+            try:
+                command, *arguments = connection.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if command == 'ocr':
+                    batches = arguments[0]
+                    metrics.count('daemon', 'pages', sum(len(batch) for batch in batches))
+                    with metrics.timer('daemon', 'request', item=f"{len(batches)} batches"):
+                        for result in jobs.imap(step5.ocr_batch, batches):
+                            connection.send((True, result))
+                elif command == 'stop':
+                    connection.send((True, None))
+                    on_stop()
+                    return
+                else:
+                    connection.send((False, f"unknown command '{command}'"))
+            except (EOFError, OSError):
+                # The client went away
+                return
+            except Exception as e:
+                connection.send((False, str(e)))
+
+
+def serve(num_workers, languages=None, preprocess=False, state_path=STATE_PATH):
+    """Starts the workers and serves requests until stopped (Ctrl+C or stop())."""
+    import STEP5_ocr_subfolders as step5
+
+    if read_state(state_path) is not None and stop(state_path):
+        print("Stopped the OCR daemon that was already running.")
+    key = secrets.token_bytes(32)
+    state = {'pid': os.getpid(), 'key': key.hex(), 'workers': num_workers,
+             'settings': step5.ocr_settings(languages, preprocess)}
+    stopping = threading.Event()
+
+    with step5.start_pool(num_workers, languages, preprocess) as pool, \
+            Listener(('127.0.0.1', 0), authkey=key) as listener:
+        jobs = FairJobQueue(pool, JOBS_PER_WORKER * num_workers)
+        state['address'] = list(listener.address)
+
+        def on_stop():
+            stopping.set()
+            # Wake up the accept() below
+            _open_connection(state).close()
+
+        _write_state(state, state_path)
+        print(f"OCR daemon with {num_workers} workers listening on {listener.address[0]}:{listener.address[1]}.")
+        try:
+            while not stopping.is_set():
+                try:
+                    connection = listener.accept()
+                except (OSError, AuthenticationError):
+                    continue
+                threading.Thread(target=_handle, args=(connection, jobs, on_stop), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if (read_state(state_path) or {}).get('pid') == os.getpid():
+                os.unlink(state_path)
+    print("OCR daemon stopped.")
+
+
+def stop(state_path=STATE_PATH):
+    """Asks the running daemon to stop; returns False if none is running."""
+    state = read_state(state_path)
+    if state is None:
+        return False
+    try:
+        with _open_connection(state) as connection:
+            connection.send(('stop',))
+            connection.recv()
+    except (OSError, EOFError, AuthenticationError):
+        os.unlink(state_path)
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keeps STEP5's OCR workers and model loaded for later runs.")
+    parser.add_argument('--workers', type=int, help="Number of OCR worker processes.")
+    parser.add_argument('--languages', nargs='+', help="OCR languages (default: STEP5's OCR_LANGUAGES).")
+    parser.add_argument('--preprocess', action='store_true', help="Preprocess the pages (see ocr_preprocess.py).")
+    parser.add_argument('--stop', action='store_true', help="Stop the running daemon.")
+    parser.add_argument('--status', action='store_true', help="Show whether a daemon is running.")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args, 'daemon')
+
+    if args.stop:
+        print("OCR daemon stopped." if stop() else "No OCR daemon is running.")
+    elif args.status:
+        client = connect()
+        if client is None:
+            print("No OCR daemon is running.")
+        else:
+            client.close()
+            state = read_state()
+            print(f"OCR daemon running (pid {state['pid']}, {state['workers']} workers, "
+                  f"settings {json.dumps(state['settings'])}).")
+    else:
+        import STEP5_ocr_subfolders as step5
+
+        with metrics.profile('daemon'):
+            serve(args.workers or step5.NUM_WORKERS, args.languages, args.preprocess)
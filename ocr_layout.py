@@ -0,0 +1,163 @@
+import os
+import json
+from statistics import median
+
+# Structured OCR output. Each chapter gets a JSON lines file with one record per
+# easyocr detection, in reading order:
+#   {"page": "page_0001.png", "paragraph": 0, "line": 0, "text": "...", "confidence": 0.97, "box": [[x, y], ...]}
+# Line and paragraph numbers run through the whole chapter, so a paragraph that
+# continues on the next screenshot keeps its number. The chapter .txt is derived
+# from these records (see records_to_text).
+
+# Two detections are on the same line if their vertical centers are closer than
+# this fraction of the line height
+LINE_TOLERANCE = 0.5
+
+# A vertical gap larger than this many line heights starts a new paragraph
+PARAGRAPH_GAP = 1.0
+
+# A line indented (or a previous line ending short) by more than this many line
+# heights starts a new paragraph
+INDENT = 1.5
+
+
+def _bounds(box):
+    xs = [point[0] for point in box]
+    ys = [point[1] for point in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def group_lines(detections):
+    """
+    Groups the detections of one page into lines, top to bottom, each line left to right.
+    Returns a list of (left, top, right, bottom, [detections]).
+    """
+    items = sorted(((_bounds(d[0]), d) for d in detections), key=lambda item: (item[0][1] + item[0][3]) / 2)
+    lines = []
+    for (left, top, right, bottom), detection in items:
+        center = (top + bottom) / 2
+        if lines:
+            line = lines[-1]
+            line_center = (line[1] + line[3]) / 2
+            if abs(center - line_center) < LINE_TOLERANCE * (line[3] - line[1]):
+                line[0], line[1] = min(line[0], left), min(line[1], top)
+                line[2], line[3] = max(line[2], right), max(line[3], bottom)
+                line[4].append(detection)
+                continue
+        lines.append([left, top, right, bottom, [detection]])
+    for line in lines:
+        line[4].sort(key=lambda d: _bounds(d[0])[0])
+    return [tuple(line) for line in lines]
+
+
+def paragraph_starts(lines):
+    """
+    Returns one flag per line: True where a new paragraph starts. The first line
+    only starts one if it is indented, since the paragraph may come from the previous page.
+    """
+    if not lines:
+        return []
+    height = median(bottom - top for _, top, _, bottom, _ in lines)
+    margin_left = min(line[0] for line in lines)
+    margin_right = max(line[2] for line in lines)
+
+    starts = []
+    for i, (left, top, right, bottom, _) in enumerate(lines):
+        indented = left - margin_left > INDENT * height
+        if i == 0:
+            starts.append(indented)
+            continue
+        previous = lines[i - 1]
+        gap = top - previous[3]
+        ended_short = margin_right - previous[2] > INDENT * height
+        starts.append(indented or gap > PARAGRAPH_GAP * height or ended_short)
+    return starts
+
+
+def _round_box(box):
+    return [[round(float(x), 1), round(float(y), 1)] for x, y in box]
+
+
+class ChapterLayout:
+    """Lays out the detections of a chapter into records, one page at a time, in reading order."""
+
+    def __init__(self):
+        self.line = -1
+        self.paragraph = -1
+        self.records = []
+
+    def add_page(self, page, detections):
+        """Lays out the detections of one page; returns its records."""
+        lines = group_lines(detections)
+        page_records = []
+        for (_, _, _, _, line_detections), starts in zip(lines, paragraph_starts(lines)):
+            self.line += 1
+            if starts or self.paragraph < 0:
+                self.paragraph += 1
+            for box, text, confidence in line_detections:
+                page_records.append({'page': page, 'paragraph': self.paragraph, 'line': self.line, 'text': text,
+                                     'confidence': round(float(confidence), 4), 'box': _round_box(box)})
+        self.records.extend(page_records)
+        return page_records
+
+
+class ChapterRecordWriter(ChapterLayout):
+    """Writes the detections of a chapter as JSON lines, one page at a time, in reading order."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.temp_path = path + '.tmp'
+        self.file = open(self.temp_path, 'w', encoding='utf-8')
+
+    def add_page(self, page, detections):
+        """Lays out and writes the detections of one page; returns its records."""
+        page_records = super().add_page(page, detections)
+        for record in page_records:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+        return page_records
+
+    def close(self):
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't leave a half-written chapter behind as if it were complete
+            self.file.close()
+            os.unlink(self.temp_path)
+
+
+def layout_pages(pages):
+    """The records of a chapter from (page name, detections) pairs, without writing them. None pages are skipped."""
+    layout = ChapterLayout()
+    for page, detections in pages:
+        if detections is not None:
+            layout.add_page(page, detections)
+    return layout.records
+
+
+def read_records(path):
+    """Yields the records of a chapter JSON lines file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def records_to_text(records):
+    """The plain text view of a chapter: one paragraph per line block, separated by blank lines."""
+    paragraphs = []
+    current = None
+    for record in records:
+        if record['paragraph'] != current:
+            current = record['paragraph']
+            paragraphs.append([])
+        paragraphs[-1].append(record['text'])
+    return '\n\n'.join(' '.join(words) for words in paragraphs)
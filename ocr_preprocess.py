@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+
+# Prepares a column screenshot for easyocr: grayscale, binarized, trimmed to the
+# text bounding box and rescaled so the text lines have a fixed height. easyocr's
+# detection time grows with the pixel count and most of a screenshot is margin,
+# so the reader gets much less to chew on. The arrays go to readtext directly,
+# without temporary files.
+
+# Height (pixels) of a text line after rescaling
+TARGET_LINE_HEIGHT = 32
+
+# Never scale by more/less than this
+MIN_SCALE = 0.25
+MAX_SCALE = 2.0
+
+# White border (pixels, after rescaling) kept around the text
+PADDING = 8
+
+# Pages whose darkest and lightest pixels differ by less than this are blank
+# (Otsu would otherwise split the compression noise of a white page into "ink")
+MIN_CONTRAST = 64
+
+# A row is a text row if more than this fraction of its pixels is ink
+ROW_INK_FRACTION = 0.005
+
+
+def settings():
+    """The parameters that change the preprocessed image; part of the OCR cache key."""
+    return {'target_line_height': TARGET_LINE_HEIGHT, 'min_scale': MIN_SCALE, 'max_scale': MAX_SCALE,
+            'padding': PADDING, 'min_contrast': MIN_CONTRAST, 'row_ink_fraction': ROW_INK_FRACTION}
+
+
+def median_line_height(ink):
+    """Median height of the runs of text rows in a boolean ink mask, or None without text."""
+    text_rows = ink.mean(axis=1) > ROW_INK_FRACTION
+    edges = np.diff(np.concatenate(([0], text_rows.astype(np.int8), [0])))
+    heights = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    # Accent marks and dots make very short runs; they are not lines
+    heights = heights[heights > 2]
+    return float(np.median(heights)) if len(heights) else None
+
+
+def preprocess(image):
+    """
+    Returns (array, transform) for an image (BGR or grayscale array): the cleaned
+    grayscale array for readtext, and the (x0, y0, scale) that maps its coordinates
+    back to the original image (see to_original).
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if int(gray.max()) - int(gray.min()) < MIN_CONTRAST:
+        # Blank page: a small white image, nothing for the reader to find
+        return np.full((2 * PADDING, 2 * PADDING), 255, dtype=np.uint8), (0, 0, 1.0)
+
+    # Otsu picks the ink/paper threshold of each page
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    ink = binary == 0
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    y0, y1 = rows[0], rows[-1] + 1
+    x0, x1 = cols[0], cols[-1] + 1
+    binary = binary[y0:y1, x0:x1]
+
+    line_height = median_line_height(ink[y0:y1, x0:x1])
+    scale = 1.0 if line_height is None else min(MAX_SCALE, max(MIN_SCALE, TARGET_LINE_HEIGHT / line_height))
+    if scale != 1.0:
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+        binary = cv2.resize(binary, (max(1, round(binary.shape[1] * scale)), max(1, round(binary.shape[0] * scale))),
+                            interpolation=interpolation)
+
+    binary = cv2.copyMakeBorder(binary, PADDING, PADDING, PADDING, PADDING, cv2.BORDER_CONSTANT, value=255)
+    return binary, (int(x0) - PADDING / scale, int(y0) - PADDING / scale, scale)
+
+
+def to_original(detections, transform):
+    """Maps the boxes of readtext detections on a preprocessed image back to the original image."""
+    x0, y0, scale = transform
+    return [
+        ([[x0 + float(x) / scale, y0 + float(y) / scale] for x, y in box], text, confidence)
+        for box, text, confidence in detections
+    ]
+
+
+def load_and_preprocess(file_path):
+    image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f"Could not read image '{file_path}'")
+    return preprocess(image)
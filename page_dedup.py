@@ -0,0 +1,95 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Finds screenshots that show the same page twice (the reader lagged or a click
+# was missed), using 64-bit perceptual hashes compared by Hamming distance.
+# Everything after decoding is vectorized over the whole book.
+
+# pHash is the default: at 8x9, dHash sees a page of body text as an almost flat gray
+# block, so different text pages can hash alike. dHash is kept as the cheaper option.
+HASH_METHOD = 'phash'
+
+# Near-duplicates: at most this many of the 64 hash bits may differ
+MAX_DISTANCE = 4
+
+# How many previous screenshots each one is compared with. A page captured twice
+# shows up two files later (left, right, left again, right again), so look back a little.
+WINDOW = 4
+
+# Brightness steps smaller than this (0-255) count as flat, so the white margins of a
+# page hash to stable zeros instead of capture noise
+DHASH_MARGIN = 2
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def load_gray(file_path, size=(64, 64)):
+    """Decodes an image as a small grayscale thumbnail (all hashes start from this)."""
+    gray = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError(f"Could not read image '{file_path}'")
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def load_thumbnails(file_paths, workers=None):
+    """Decodes all images in threads (OpenCV releases the GIL) into an (N, 64, 64) array."""
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        return np.stack(list(executor.map(load_gray, file_paths)))
+
+
+def _pack(bits):
+    """(N, 64) booleans -> (N,) uint64."""
+    return np.packbits(bits.astype(np.uint8), axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def dhash(thumbnails):
+    """Difference hash of each (H, W) thumbnail: is each pixel brighter than its right neighbour (8x9 grid)."""
+    small = np.stack([cv2.resize(t, (9, 8), interpolation=cv2.INTER_AREA) for t in thumbnails]).astype(np.float32)
+    return _pack((small[:, :, 1:] - small[:, :, :-1] > DHASH_MARGIN).reshape(len(small), 64))
+
+
+def phash(thumbnails):
+    """DCT hash of each thumbnail: low frequencies (8x8 of a 32x32 DCT) above their median."""
+    small = np.stack([cv2.resize(t, (32, 32), interpolation=cv2.INTER_AREA) for t in thumbnails]).astype(np.float32)
+    low = np.stack([cv2.dct(s)[:8, :8] for s in small]).reshape(len(small), 64)
+    # The DC term says nothing about the layout; leave it out of the median
+    return _pack(low > np.median(low[:, 1:], axis=1, keepdims=True))
+
+
+HASHES = {'dhash': dhash, 'phash': phash}
+
+
+def hamming(a, b):
+    """Bitwise Hamming distance between two uint64 arrays."""
+    return np.unpackbits((a ^ b).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def find_duplicates(hashes, max_distance=MAX_DISTANCE, window=WINDOW):
+    """
+    Returns {index: index of the earlier screenshot it duplicates}. Each screenshot is
+    compared with the `window` screenshots before it; the closest match wins.
+    """
+    n = len(hashes)
+    best_distance = np.full(n, 65)
+    best_match = np.full(n, -1)
+    for offset in range(1, min(window, n - 1) + 1):
+        distance = hamming(hashes[offset:], hashes[:-offset])
+        closer = distance < best_distance[offset:]
+        best_distance[offset:][closer] = distance[closer]
+        best_match[offset:][closer] = np.arange(n - offset)[closer]
+    duplicates = np.flatnonzero(best_distance <= max_distance)
+    return {int(i): int(best_match[i]) for i in duplicates}
+
+
+def find_duplicate_pages(folder, page_names=None, method=HASH_METHOD, max_distance=MAX_DISTANCE, window=WINDOW):
+    """Returns {duplicate page name: name of the page it repeats} for the screenshots of folder."""
+    if page_names is None:
+        page_names = sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if len(page_names) < 2:
+        return {}
+    thumbnails = load_thumbnails([os.path.join(folder, name) for name in page_names])
+    hashes = HASHES[method](thumbnails)
+    return {page_names[i]: page_names[j] for i, j in find_duplicates(hashes, max_distance, window).items()}
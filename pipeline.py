@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import argparse
+
+import metrics
+
+# Runs STEP4 -> STEP5 -> STEP6 incrementally. A fingerprint of the inputs and
+# outputs of every stage item (the manifest, each chapter's OCR, each chapter's
+# correction) is kept in a state file; on a re-run only the items whose inputs
+# changed, or whose outputs went missing or changed, are processed again. The
+# state is saved after every item, so a crash resumes where it stopped.
+# STEP1/STEP2 (mouse setup and capture) are interactive and stay manual.
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+STATE_PATH = 'pipeline_state.json'
+STATE_VERSION = 1
+STAGES = ('step4', 'step5', 'step6')
+
+OCR_FOLDER = 'STEP5_ocr'
+OUTPUT_FOLDER = 'STEP6_pos_IA'
+
+
+class PipelineState:
+    """The fingerprints of every stage item, plus a stat-keyed memo of file hashes."""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.data = {'version': STATE_VERSION, 'files': {}, 'stages': {stage: {} for stage in STAGES}}
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == STATE_VERSION:
+                self.data = data
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(temp_path, self.path)
+
+    def file_hash(self, path):
+        """sha256 of a file; unchanged files (same size and mtime) are not read again."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        memo = self.data['files'].get(path)
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        self.data['files'][path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def is_current(self, stage, item, inputs_fingerprint, output_paths):
+        """True if the item was done with these inputs and its outputs are still the ones it wrote."""
+        record = self.data['stages'][stage].get(item)
+        if not record or record['inputs'] != inputs_fingerprint:
+            return False
+        return all(self.file_hash(path) == record['outputs'].get(path) for path in output_paths)
+
+    def record(self, stage, item, inputs_fingerprint, output_paths):
+        self.data['stages'][stage][item] = {
+            'inputs': inputs_fingerprint,
+            'outputs': {path: self.file_hash(path) for path in output_paths},
+        }
+        self.save()
+
+
+def fingerprint(*parts):
+    """Hashes a sequence of JSON-serializable parts into one hex string."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Workspace:
+    """
+    The input folders, outputs and state of one book. The defaults are the
+    repository's own folders, relative to the working directory, as the STEP
+    scripts use them; batch_books.py gives each book its own folder.
+    """
+
+    def __init__(self, folder='', name=None, screenshots=None, markers=None, state_path=None):
+        import STEP4_divide_screenshots_by_chapters as step4
+
+        self.folder = folder
+        self.name = name
+        # Messages of a book in a batch are tagged with its name
+        self.prefix = f"[{name}] " if name else ''
+        self.screenshots = screenshots or os.path.join(folder, step4.PASTA_SCREENSHOTS)
+        self.markers = markers or os.path.join(folder, step4.PASTA_MARCADORES_CAPITULOS)
+        self.manifest_path = os.path.join(folder, step4.CAMINHO_MANIFESTO)
+        self.chapters_folder = os.path.join(folder, step4.PASTA_DESTINO)
+        self.ocr_folder = os.path.join(folder, OCR_FOLDER)
+        self.output_folder = os.path.join(folder, OUTPUT_FOLDER)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.state = PipelineState(state_path or os.path.join(folder, STATE_PATH))
+
+
+def run_step4(workspace, force=False, dedup=False):
+    """Builds the chapter manifest if its inputs changed; returns False if there are no chapters."""
+    import STEP4_divide_screenshots_by_chapters as step4
+
+    state = workspace.state
+    if not os.path.isdir(workspace.markers):
+        if os.path.isfile(workspace.manifest_path):
+            return True
+        print(f"{workspace.prefix}STEP4: no chapter markers in '{workspace.markers}'.")
+        return False
+
+    screenshots = step4.listar_arquivos(workspace.screenshots)
+    markers = step4.listar_arquivos(workspace.markers)
+    # Without deduplication the manifest only depends on which files exist, not on their pixels
+    if dedup:
+        inputs = fingerprint(screenshots, markers, 'dedup',
+                             [state.file_hash(os.path.join(workspace.screenshots, name)) for name in screenshots])
+    else:
+        inputs = fingerprint(screenshots, markers)
+    if not force and state.is_current('step4', 'manifest', inputs, [workspace.manifest_path]):
+        print(f"{workspace.prefix}STEP4: manifest is up to date.")
+        return True
+    print(f"{workspace.prefix}STEP4: building the chapter manifest...")
+    if step4.organizar_screenshots_por_capitulos(workspace.screenshots, workspace.markers, workspace.manifest_path,
+                                                 deduplicar=dedup) is None:
+        return False
+    state.record('step4', 'manifest', inputs, [workspace.manifest_path])
+    return True
+
+
+def plan_step5(workspace, force=False, preprocess=None):
+    """Returns (chapters to OCR, {chapter name: inputs fingerprint})."""
+    import STEP5_ocr_subfolders as step5
+
+    state = workspace.state
+    chapters = step5.load_chapters(workspace.manifest_path, workspace.chapters_folder)
+    settings = step5.ocr_settings(preprocess=step5.PREPROCESS if preprocess is None else preprocess)
+    pending = []
+    inputs_by_chapter = {}
+    for name, paths in chapters:
+        output_paths = [os.path.join(workspace.ocr_folder, f"{name}{extension}") for extension in ('.txt', '.jsonl')]
+        inputs = fingerprint(settings, [state.file_hash(path) for path in paths])
+        inputs_by_chapter[name] = inputs
+        if force or not state.is_current('step5', name, inputs, output_paths):
+            pending.append((name, paths))
+
+    print(f"{workspace.prefix}STEP5: {len(chapters) - len(pending)} chapters up to date, {len(pending)} to OCR.")
+    return pending, inputs_by_chapter
+
+
+def ocr_chapters(workspace, pending, inputs_by_chapter, pool, num_workers, batch_size, cache, preprocess=None):
+    """OCRs the pending chapters with a worker pool (or OCR daemon connection) and cache, recording each one."""
+    import STEP5_ocr_subfolders as step5
+
+    def on_chapter_done(name, output_path):
+        records_path = os.path.splitext(output_path)[0] + '.jsonl'
+        if os.path.isfile(output_path):
+            workspace.state.record('step5', name, inputs_by_chapter[name], [output_path, records_path])
+
+    step5.ocr_chapters(pending, workspace.ocr_folder, num_workers, batch_size, cache=cache,
+                       on_chapter_done=on_chapter_done,
+                       preprocess=step5.PREPROCESS if preprocess is None else preprocess, pool=pool)
+
+
+def run_step5(workspace, force=False, num_workers=None, batch_size=None, preprocess=None):
+    import ocr_cache
+    import ocr_daemon
+    import STEP5_ocr_subfolders as step5
+
+    pending, inputs_by_chapter = plan_step5(workspace, force, preprocess)
+    if not pending:
+        return
+
+    # Attach to a running OCR daemon (ocr_daemon.py) instead of starting workers
+    pool = ocr_daemon.connect(step5.ocr_settings(preprocess=step5.PREPROCESS if preprocess is None else preprocess))
+    if pool is not None:
+        print(f"STEP5: using the OCR daemon ({pool.workers} workers).")
+        num_workers = pool.workers
+    try:
+        cache_path = os.path.join(script_dir, step5.CACHE_PATH)
+        with ocr_cache.OCRCache(cache_path, max_bytes=step5.CACHE_MAX_MB * 1024 * 1024) as cache:
+            ocr_chapters(workspace, pending, inputs_by_chapter, pool,
+                         step5.NUM_WORKERS if num_workers is None else num_workers,
+                         batch_size or step5.BATCH_SIZE, cache, preprocess)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def make_generator(stub_latency=None):
+    """The STEP6 model backend: the local fake model with --stub, otherwise the configured one."""
+    import STEP6_process_chapters_with_AI as step6
+
+    if stub_latency is not None:
+        return step6.make_generator('stub', stub_latency=stub_latency)
+    return step6.make_generator()
+
+
+async def correct_chapters(workspace, generate, cache, limiter=None, force=False, concurrency=None):
+    """STEP6 for the chapters whose OCR text or settings changed; returns the number of failed chapters."""
+    import text_normalizer
+    import STEP6_process_chapters_with_AI as step6
+
+    state = workspace.state
+    # Changing the model (or its endpoint), the prompt, the chunking or the selective mode redoes every chapter
+    settings = [generate.name, step6.build_prompt(''), step6.CHUNK_TOKENS,
+                step6.SELECTIVE and step6.MIN_CONFIDENCE, step6.NORMALIZE]
+
+    pending = []
+    inputs_by_file = {}
+    file_paths = step6.find_input_files(workspace.folder, workspace.ocr_folder)
+    for file_path in file_paths:
+        output_path = os.path.join(workspace.output_folder, os.path.relpath(file_path, workspace.ocr_folder))
+        inputs = fingerprint(settings, state.file_hash(file_path))
+        inputs_by_file[file_path] = inputs
+        if force or not state.is_current('step6', file_path, inputs, [output_path]):
+            pending.append(file_path)
+
+    print(f"{workspace.prefix}STEP6: {len(file_paths) - len(pending)} chapters up to date, "
+          f"{len(pending)} to correct.")
+    if not pending:
+        return 0
+
+    def on_chapter_done(file_path, output_path):
+        # Not called for chapters saved with an error marker: they are retried on the next run
+        state.record('step6', file_path, inputs_by_file[file_path], [output_path])
+
+    # The normalizer learns headers and vocabulary from the whole book, not only the pending chapters
+    normalizer = text_normalizer.fit_book(file_paths)[0] if step6.NORMALIZE else None
+    failures, _ = await step6.process_files(pending, workspace.ocr_folder, workspace.output_folder, generate,
+                                            concurrency or step6.CONCURRENCY, on_chapter_done=on_chapter_done,
+                                            cache=cache, normalizer=normalizer, limiter=limiter)
+    if failures:
+        print(f"{workspace.prefix}STEP6: {failures} chapters failed; run again to retry them.")
+    return failures
+
+
+def run_step6(workspace, force=False, stub_latency=None):
+    import STEP6_process_chapters_with_AI as step6
+
+    generate = make_generator(stub_latency)
+    with step6.open_cache(generate.name, os.path.join(script_dir, step6.CACHE_PATH)) as cache:
+        asyncio.run(correct_chapters(workspace, generate, cache, force=force))
+        print(f"STEP6: response cache {cache.hits} hits, {cache.misses} misses.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs STEP4-STEP6, redoing only the work whose inputs changed.")
+    parser.add_argument('--from', dest='first_stage', choices=STAGES, default=STAGES[0],
+                        help="First stage to run.")
+    parser.add_argument('--to', dest='last_stage', choices=STAGES, default=STAGES[-1],
+                        help="Last stage to run.")
+    parser.add_argument('--force', action='store_true', help="Redo every item of the selected stages.")
+    parser.add_argument('--dedup', action='store_true', help="Leave repeated screenshots out of the chapters.")
+    parser.add_argument('--workers', type=int, help="STEP5 OCR worker processes.")
+    parser.add_argument('--batch-size', type=int, help="STEP5 pages per OCR batch.")
+    parser.add_argument('--stub', type=float, metavar='LATENCY',
+                        help="Use the local fake model in STEP6 instead of calling the API.")
+    parser.add_argument('--state', default=STATE_PATH, help="State file with the fingerprints.")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    # --profile alone profiles the whole run; --profile step5 only that stage
+    metrics.setup(args, 'pipeline')
+
+    # The STEP scripts use paths relative to the repository
+    os.chdir(script_dir)
+    sys.path.insert(0, script_dir)
+    workspace = Workspace(state_path=args.state)
+
+    selected = STAGES[STAGES.index(args.first_stage):STAGES.index(args.last_stage) + 1]
+    runs = {
+        'step4': lambda: run_step4(workspace, args.force, args.dedup),
+        'step5': lambda: run_step5(workspace, args.force, args.workers, args.batch_size),
+        'step6': lambda: run_step6(workspace, args.force, args.stub),
+    }
+    with metrics.profile('pipeline'):
+        for stage in selected:
+            with metrics.profile(stage), metrics.timer(stage, 'total'):
+                runs[stage]()
+
+    print("\nPipeline finished.")
+
+
+if __name__ == "__main__":
+    main()
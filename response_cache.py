@@ -0,0 +1,108 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+# This module keeps the answers of the STEP6 model, keyed by the model name and
+# the full prompt (prompt template + chapter text), so re-running STEP6 after a
+# crash or on a book seen before does not pay again for identical requests.
+
+DEFAULT_CACHE_PATH = 'STEP6_cache/responses.sqlite3'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def response_key(model, prompt):
+    """Hashes the model name together with the prompt sent to it."""
+    digest = hashlib.sha256(model.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(prompt.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of model answers for one model, stored in SQLite.
+    Entries older than ttl seconds (None = never) are ignored and evicted; the total
+    size is capped at max_bytes, evicting the least recently used entries first.
+    """
+
+    def __init__(self, model, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, ttl=None):
+        self.model = model
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self.connection.commit()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, prompt):
+        """Returns the cached answer to prompt, or None."""
+        key = response_key(self.model, prompt)
+        row = self.connection.execute("SELECT text, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or self._expired(row[1]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, prompt, text):
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses (key, model, text, size, created, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (response_key(self.model, prompt), self.model, text, len(text.encode('utf-8')), now, now),
+        )
+        # Answers cost money; don't lose them if the run is interrupted
+        self.connection.commit()
+
+    def total_bytes(self):
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def evict(self):
+        """Deletes expired entries, then the least recently used ones until the cache fits in max_bytes."""
+        removed = 0
+        if self.ttl is not None:
+            removed += self.connection.execute("DELETE FROM responses WHERE created < ?",
+                                               (time.time() - self.ttl,)).rowcount
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return removed
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY last_access")
+        stale_keys = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            stale_keys.append((key,))
+            excess -= size
+            removed += 1
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        return removed
+
+    def close(self):
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,185 @@
+import os
+import time
+import random
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+# Screen sources for STEP2. The capture loop only needs to grab a region and
+# click a point, so the real screen (pyautogui) can be swapped for a replay of
+# an already captured book, which lets the whole capture side run headless.
+
+# Page-settle detection: thumbnail size, polling period and thresholds (mean gray-level difference, 0-255)
+SIGNATURE_SIZE = (32, 32)
+POLL_INTERVAL = 0.05
+SETTLE_TIMEOUT = 5.0
+# No change at all after this long means the click was missed and is retried. Keep it above
+# the slowest page render: clicking again on a page that was only slow skips a page.
+CHANGE_TIMEOUT = 3.0
+CHANGE_THRESHOLD = 2.0
+STABLE_THRESHOLD = 0.5
+STABLE_POLLS = 2
+
+
+class PyAutoGUIScreen:
+    """The real screen, through pyautogui."""
+
+    def __init__(self):
+        # Imported here so headless runs (replays, tests) don't need a display
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def grab(self, region):
+        """Returns a PIL image of region (left, top, width, height)."""
+        return self.pyautogui.screenshot(region=region)
+
+    def click(self, point):
+        self.pyautogui.click(point)
+
+
+@lru_cache(maxsize=8)
+def _load_image(file_path):
+    # The pages around the current one are grabbed over and over while polling
+    with Image.open(file_path) as image:
+        image.load()
+        return image
+
+
+class ReplayScreen:
+    """
+    Fake screen that replays the column screenshots of a STEP2 folder.
+    Each "page" shows two consecutive images: the first one is returned for the
+    left column region and the second for the right column region. Clicking
+    anywhere turns the page.
+    """
+
+    def __init__(self, folder, left_region=None):
+        self.images = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith('.png'))
+        self.left_region = left_region
+        self.page = 0
+
+    @property
+    def num_pages(self):
+        return (len(self.images) + 1) // 2
+
+    def _image_for(self, region):
+        column = 0 if self.left_region is None or tuple(region) == tuple(self.left_region) else 1
+        index = min(2 * self.page + column, len(self.images) - 1)
+        return self.images[index]
+
+    def grab(self, region):
+        return _load_image(self._image_for(region)).copy()
+
+    def click(self, point):
+        self.page = min(self.page + 1, self.num_pages - 1)
+
+
+
+class SimulatedReaderScreen(ReplayScreen):
+    """
+    ReplayScreen that behaves like a slow e-book reader: after a click the old page
+    stays on screen for `render_latency` seconds, then the new page fades in over
+    `transition` seconds. A fraction `miss_rate` of the clicks is ignored.
+    """
+
+    def __init__(self, folder, left_region=None, render_latency=0.5, transition=0.1, miss_rate=0.0, seed=None):
+        super().__init__(folder, left_region)
+        self.render_latency = render_latency
+        self.transition = transition
+        self.miss_rate = miss_rate
+        self.random = random.Random(seed)
+        self.previous_page = 0
+        self.turned_at = None
+
+    def visible_page(self):
+        """The page fully shown right now (the old one while the new one is rendering)."""
+        if self.turned_at is None or time.monotonic() - self.turned_at >= self.render_latency + self.transition:
+            return self.page
+        return self.previous_page
+
+    def grab(self, region):
+        if self.turned_at is None:
+            return super().grab(region)
+        elapsed = time.monotonic() - self.turned_at
+        if elapsed >= self.render_latency + self.transition:
+            return super().grab(region)
+
+        new_page = self.page
+        self.page = self.previous_page
+        old_image = super().grab(region)
+        self.page = new_page
+        if elapsed < self.render_latency:
+            return old_image
+        # Half-rendered frame: a blend of both pages
+        new_image = super().grab(region)
+        if new_image.size != old_image.size:
+            new_image = new_image.resize(old_image.size)
+        return Image.blend(old_image.convert('RGB'), new_image.convert('RGB'),
+                           (elapsed - self.render_latency) / self.transition)
+
+    def click(self, point):
+        if self.random.random() < self.miss_rate:
+            return
+        self.previous_page = self.visible_page()
+        self.turned_at = time.monotonic()
+        super().click(point)
+
+
+def signature(image, size=SIGNATURE_SIZE):
+    """A small grayscale thumbnail of image, as a float array, for cheap frame comparisons."""
+    return np.asarray(image.convert('L').resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def frame_difference(a, b):
+    """Mean absolute difference between two signatures (0-255)."""
+    return float(np.abs(a - b).mean())
+
+
+class PageSettleDetector:
+    """
+    Waits for a page turn by polling small thumbnails of the column regions: first the
+    content must change from the previous page, then it must stop changing for
+    `stable_polls` polls in a row before the page is considered rendered.
+    """
+
+    def __init__(self, screen, regions, poll_interval=POLL_INTERVAL, timeout=SETTLE_TIMEOUT,
+                 change_timeout=CHANGE_TIMEOUT, change_threshold=CHANGE_THRESHOLD,
+                 stable_threshold=STABLE_THRESHOLD, stable_polls=STABLE_POLLS):
+        self.screen = screen
+        self.regions = regions
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.change_timeout = min(change_timeout, timeout)
+        self.change_threshold = change_threshold
+        self.stable_threshold = stable_threshold
+        self.stable_polls = stable_polls
+
+    def snapshot(self):
+        return np.stack([signature(self.screen.grab(region)) for region in self.regions])
+
+    def wait_for_new_page(self, previous):
+        """
+        Returns the snapshot of the settled new page, or None if nothing changed within
+        change_timeout (the page didn't turn). A page that changed but never settled is
+        returned as it was when the timeout expired.
+        """
+        start = time.monotonic()
+        last = None
+        stable = 0
+        while time.monotonic() - start < self.timeout:
+            current = self.snapshot()
+            if last is None:
+                if frame_difference(current, previous) > self.change_threshold:
+                    last = current
+                elif time.monotonic() - start >= self.change_timeout:
+                    return None
+            elif frame_difference(current, last) <= self.stable_threshold:
+                stable += 1
+                if stable >= self.stable_polls:
+                    return current
+            else:
+                stable = 0
+                last = current
+            time.sleep(self.poll_interval)
+        return last
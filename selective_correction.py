@@ -0,0 +1,119 @@
+import re
+from collections import namedtuple
+
+from llm_client import estimate_tokens
+
+# Selective AI correction: instead of sending whole chapters, only the lines where
+# easyocr was unsure (a detection below the confidence threshold) are sent, with a
+# line of read-only context on each side. The spans of a chapter are numbered and
+# packed into as few requests as the token budget allows, so the instructions are
+# not paid again for every span. The corrected lines are spliced back into the
+# chapter; everything else is kept exactly as STEP5 read it.
+
+# Lines with any detection below this confidence are sent to the model
+CONFIDENCE_THRESHOLD = 0.5
+
+# Lines of context given on each side of a span
+CONTEXT_LINES = 1
+
+# Suspect lines separated by at most this many good lines are sent together,
+# so one request covers them and the good lines between them
+MERGE_GAP = 1
+
+NUMBER = re.compile(r'^\s*\[\[(\d+)\]\]\s?', re.MULTILINE)
+
+Span = namedtuple('Span', ['paragraph', 'start', 'end', 'context_before', 'text', 'context_after'])
+
+
+def paragraph_lines(records):
+    """
+    Groups STEP5 records (see ocr_layout.py) into paragraphs of lines.
+    Returns a list of paragraphs, each a list of (line text, lowest confidence).
+    """
+    paragraphs = []
+    current_paragraph = current_line = None
+    for record in records:
+        if record['paragraph'] != current_paragraph:
+            current_paragraph, current_line = record['paragraph'], None
+            paragraphs.append([])
+        lines = paragraphs[-1]
+        if record['line'] != current_line:
+            current_line = record['line']
+            lines.append([[], 1.0])
+        lines[-1][0].append(record['text'])
+        lines[-1][1] = min(lines[-1][1], record['confidence'])
+    return [[(' '.join(words), confidence) for words, confidence in lines] for lines in paragraphs]
+
+
+def find_spans(paragraphs, threshold=CONFIDENCE_THRESHOLD, context_lines=CONTEXT_LINES, merge_gap=MERGE_GAP):
+    """Returns the spans of suspect lines to correct; a span never crosses a paragraph boundary."""
+    spans = []
+    for p, lines in enumerate(paragraphs):
+        suspect = [i for i, (_, confidence) in enumerate(lines) if confidence < threshold]
+        groups = []
+        for i in suspect:
+            if groups and i - groups[-1][1] <= merge_gap + 1:
+                groups[-1][1] = i
+            else:
+                groups.append([i, i])
+        for start, last in groups:
+            end = last + 1
+            texts = [text for text, _ in lines]
+            spans.append(Span(p, start, end,
+                              ' '.join(texts[max(0, start - context_lines):start]),
+                              ' '.join(texts[start:end]),
+                              ' '.join(texts[end:end + context_lines])))
+    return spans
+
+
+def pack_spans(spans, max_tokens):
+    """Groups consecutive span indexes into requests of at most max_tokens (0 = a single request)."""
+    groups = []
+    tokens = 0
+    for i, span in enumerate(spans):
+        span_tokens = estimate_tokens(span.context_before + span.text + span.context_after)
+        if not groups or (max_tokens and tokens + span_tokens > max_tokens):
+            groups.append([])
+            tokens = 0
+        groups[-1].append(i)
+        tokens += span_tokens
+    return groups
+
+
+def numbered(texts):
+    """Numbers the texts of a request as [[1]] text, [[2]] text, ... one per line."""
+    return '\n'.join(f"[[{number}]] {text}" for number, text in enumerate(texts, start=1))
+
+
+def parse_numbered(answer, count):
+    """The texts of a numbered answer, in order; None for numbers the model left out."""
+    texts = [None] * count
+    parts = NUMBER.split(answer)
+    # split() alternates: text before the first number, number, text, number, text...
+    for number, text in zip(parts[1::2], parts[2::2]):
+        index = int(number) - 1
+        if 0 <= index < count and text.strip():
+            texts[index] = text.strip()
+    return texts
+
+
+def splice(paragraphs, spans, corrected):
+    """The chapter text with each span replaced by its correction (None keeps the OCR text)."""
+    replacements = {}
+    for span, text in zip(spans, corrected):
+        if text is not None:
+            replacements[(span.paragraph, span.start)] = (span.end, ' '.join(text.split()))
+
+    result = []
+    for p, lines in enumerate(paragraphs):
+        parts = []
+        i = 0
+        while i < len(lines):
+            if (p, i) in replacements:
+                i, text = replacements[(p, i)]
+                parts.append(text)
+            else:
+                parts.append(lines[i][0])
+                i += 1
+        result.append(' '.join(part for part in parts if part))
+    return '\n\n'.join(result)
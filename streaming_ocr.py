@@ -0,0 +1,84 @@
+import queue
+import threading
+
+import metrics
+
+# OCR that runs while STEP2 is still capturing. Each saved column image goes on
+# a bounded queue; consumer threads take what is waiting (up to a batch) and
+# hand it to read_batch, which is normally backed by the STEP5 worker pool.
+# When OCR falls behind, the full queue makes the capture wait instead of
+# piling up images in memory.
+
+_DONE = object()
+
+
+class StreamingOCR:
+
+    def __init__(self, read_batch, num_consumers=2, batch_size=4, queue_size=16, on_batch=None):
+        """
+        read_batch(paths) must return one detections list (or None) per path, in order.
+        on_batch(paths, detections) is called from a consumer thread as each batch is read.
+        """
+        self.read_batch = read_batch
+        self.on_batch = on_batch
+        self.batch_size = max(1, batch_size)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.results = {}
+        self.lock = threading.Lock()
+        self.max_queue_depth = 0
+        self.threads = [threading.Thread(target=self._consume, daemon=True) for _ in range(max(1, num_consumers))]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, file_path):
+        """Queues a captured image; blocks while the queue is full."""
+        # The wait is the time capture was held back because OCR fell behind
+        with metrics.timer('step2', 'ocr_queue_wait'):
+            self.queue.put(file_path)
+        depth = self.queue.qsize()
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        metrics.gauge('step2', 'ocr_queue_depth', depth)
+
+    def _next_batch(self):
+        """Waits for one image, then takes whatever else is already queued. Returns (batch, done)."""
+        item = self.queue.get()
+        if item is _DONE:
+            return [], True
+        batch = [item]
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _consume(self):
+        done = False
+        while not done:
+            batch, done = self._next_batch()
+            if not batch:
+                continue
+            try:
+                with metrics.timer('step2', 'ocr_batch', item=f"{len(batch)} images"):
+                    detections = self.read_batch(batch)
+            except Exception as e:
+                print(f"    Error reading {', '.join(batch)}: {e}")
+                detections = [None] * len(batch)
+            with self.lock:
+                self.results.update(zip(batch, detections))
+            if self.on_batch is not None:
+                try:
+                    self.on_batch(batch, detections)
+                except Exception as e:
+                    print(f"    Error saving the OCR of {', '.join(batch)}: {e}")
+
+    def close(self):
+        """Waits until every queued image is read and returns {file_path: detections}."""
+        for _ in self.threads:
+            self.queue.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+        return self.results
@@ -0,0 +1,243 @@
+import os
+import re
+import time
+import argparse
+import unicodedata
+from collections import Counter
+
+import ocr_layout
+
+# Cheap, local clean-up of the STEP5 text before (or instead of) the AI correction:
+# ligatures and quote confusion, words hyphenated across lines, stray spaces
+# before punctuation, and running headers / page numbers repeated on every page.
+# The normalizer is first fitted on the whole book: the book's own words are the
+# dictionary used to rejoin hyphenated words, and lines seen at the top or bottom
+# of many pages are taken as headers. Headers are only removed where they were
+# found, from the first and last line of each page of the STEP5 records, never
+# from the running text. An optional word list (one word per line)
+# extends that dictionary and restores accents the OCR dropped (entao -> então),
+# where only one accented spelling exists.
+
+INPUT_FOLDER = 'STEP5_ocr'
+OUTPUT_FOLDER = 'STEP5_normalized'
+
+# Word list of the book's language, e.g. a hunspell/aspell export (None = only the book's own words)
+DICTIONARY_PATH = None
+
+# A page-edge line (digits ignored) seen on at least this fraction of the pages,
+# and on at least HEADER_MIN_PAGES pages, is a running header or footer
+HEADER_MIN_FRACTION = 0.3
+HEADER_MIN_PAGES = 3
+
+# Longer lines are never headers
+HEADER_MAX_CHARS = 60
+
+# Portuguese clitic pronouns: "sentou- se" at a line break is "sentou-se"
+CLITICS = {'me', 'te', 'se', 'nos', 'vos', 'lhe', 'lhes', 'o', 'a', 'os', 'as', 'lo', 'la', 'los', 'las',
+           'no', 'na', 'nas', 'mo', 'ma', 'to', 'ta'}
+
+# Words that follow a suspended hyphen ("pré- e pós-operatório", "micro- ou
+# macroeconomia"): unless the joined word is known, a hyphen before them is not
+# a word cut by a line break
+SUSPENDED_HYPHEN_WORDS = {'e', 'ou', 'a', 'o', 'de'}
+
+CHARACTER_FIXES = str.maketrans({
+    'ﬁ': 'fi', 'ﬂ': 'fl', 'ﬀ': 'ff', 'ﬃ': 'ffi', 'ﬄ': 'ffl', 'ﬅ': 'st', 'ﬆ': 'st',
+    '“': '"', '”': '"', '„': '"', '‟': '"', '″': '"',
+    '‘': "'", '’': "'", '‚': "'", '‛': "'", '´': "'", '`': "'",
+    '­': '', '​': '', '﻿': '',
+})
+
+WORD = re.compile(r"\w+")
+COMPOUND = re.compile(r"\w+(?:-\w+)+")
+DIGITS = re.compile(r"\d+")
+PAGE_NUMBER = re.compile(r"^\s*\d{1,4}\s*$")
+QUOTE_PAIRS = re.compile(r"''|,,")
+HYPHENATED = re.compile(r"(\w+)-\s+(\w+)")
+SPACE_BEFORE_PUNCTUATION = re.compile(r"[ \t]+([,.;:!?…%)\]}])")
+SPACE_AFTER_OPENING = re.compile(r"([(\[{])[ \t]+")
+MULTIPLE_SPACES = re.compile(r"[ \t]{2,}")
+
+
+def strip_accents(word):
+    return ''.join(c for c in unicodedata.normalize('NFD', word) if not unicodedata.combining(c))
+
+
+def load_dictionary(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def header_key(line):
+    """Lines that differ only in their numbers (page 12, page 13...) count as the same header."""
+    return DIGITS.sub('#', ' '.join(line.split()).lower())
+
+
+def _page_lines(records):
+    """{page: {line number: [texts]}} of STEP5 records (see ocr_layout.py)."""
+    pages = {}
+    for record in records:
+        lines = pages.setdefault(record['page'], {})
+        lines.setdefault(record['line'], []).append(record['text'])
+    return pages
+
+
+def _edge_numbers(lines):
+    numbers = sorted(lines)
+    return numbers[:1] + numbers[-1:] if len(numbers) > 1 else numbers
+
+
+def page_edge_lines(records):
+    """The first and last line of each page in STEP5 records (see ocr_layout.py), as [[first, last], ...]."""
+    return [[' '.join(lines[number]) for number in _edge_numbers(lines)] for lines in _page_lines(records).values()]
+
+
+def chapter_records(file_path):
+    """The STEP5 records (.jsonl) of a chapter .txt file, or None if there are none."""
+    records_path = os.path.splitext(file_path)[0] + '.jsonl'
+    return list(ocr_layout.read_records(records_path)) if os.path.isfile(records_path) else None
+
+
+class TextNormalizer:
+
+    def __init__(self):
+        self.vocabulary = Counter()
+        self.compounds = Counter()
+        self.headers = set()
+        self.accented = {}
+
+    def fit(self, texts, page_edges=(), dictionary=()):
+        """
+        Learns the book's vocabulary from texts (the chapters) and its running headers
+        from page_edges (the first/last lines of each page, see page_edge_lines).
+        Without page edges, short lines repeated across the chapters are used instead.
+        dictionary is an optional list of words of the book's language.
+        """
+        words = {word.lower() for word in dictionary}
+        self.vocabulary.update(words)
+        # Unaccented spelling -> the only accented word with that spelling
+        candidates = {}
+        for word in words:
+            plain = strip_accents(word)
+            if plain != word and plain not in words:
+                candidates.setdefault(plain, set()).add(word)
+        self.accented = {plain: spellings.pop() for plain, spellings in candidates.items() if len(spellings) == 1}
+
+        for text in texts:
+            text = text.translate(CHARACTER_FIXES).lower()
+            self.vocabulary.update(WORD.findall(text))
+            self.compounds.update(COMPOUND.findall(text))
+
+        pages = list(page_edges)
+        if not pages:
+            pages = [[line] for text in texts for line in text.splitlines() if line.strip()]
+        counts = Counter()
+        for edge in pages:
+            counts.update({header_key(line) for line in edge if len(line) <= HEADER_MAX_CHARS})
+        minimum = max(HEADER_MIN_PAGES, HEADER_MIN_FRACTION * len(pages))
+        self.headers = {key for key, count in counts.items() if count >= minimum and WORD.search(key)}
+        return self
+
+    def _is_header(self, line):
+        return bool(PAGE_NUMBER.match(line)) or header_key(line) in self.headers
+
+    def strip_headers(self, records):
+        """The records without the running headers and page numbers on the first and last line of each page."""
+        pages = _page_lines(records)
+        dropped = {(page, number) for page, lines in pages.items() for number in _edge_numbers(lines)
+                   if self._is_header(' '.join(lines[number]))}
+        return [record for record in records if (record['page'], record['line']) not in dropped]
+
+    def strip_header_lines(self, text):
+        """For a text without records: drops the lines that are, as a whole, a running header or page number."""
+        return '\n'.join(line for line in text.splitlines() if not self._is_header(line))
+
+    def _join_hyphenated(self, match):
+        first, second = match.group(1), match.group(2)
+        # The book's own spelling decides: a word the book or the word list has is
+        # rejoined ("cida- de"); otherwise a suspended hyphen stays as written (or is a
+        # clitic: "chamou- o") and any other hyphen is kept
+        if self.compounds[f"{first}-{second}".lower()]:
+            return f"{first}-{second}"
+        if self.vocabulary[(first + second).lower()]:
+            return first + second
+        if second.lower() in SUSPENDED_HYPHEN_WORDS:
+            return f"{first}-{second}" if second.lower() in CLITICS else match.group(0)
+        return f"{first}-{second}"
+
+    def _restore_accents(self, match):
+        word = match.group(0)
+        accented = self.accented.get(word.lower())
+        if accented is None:
+            return word
+        if word.isupper() and len(word) > 1:
+            return accented.upper()
+        return accented[0].upper() + accented[1:] if word[0].isupper() else accented
+
+    def normalize_chapter(self, text, records=None):
+        """normalize() for a STEP5 chapter, without its running headers (see strip_headers)."""
+        if records is not None:
+            text = ocr_layout.records_to_text(self.strip_headers(records))
+        else:
+            text = self.strip_header_lines(text)
+        return self.normalize(text)
+
+    def normalize(self, text):
+        """Character, hyphenation, spacing and accent fixes of a text (headers are left alone)."""
+        text = text.translate(CHARACTER_FIXES)
+        text = QUOTE_PAIRS.sub('"', text)
+        text = HYPHENATED.sub(self._join_hyphenated, text)
+        text = SPACE_BEFORE_PUNCTUATION.sub(r'\1', text)
+        text = SPACE_AFTER_OPENING.sub(r'\1', text)
+        text = MULTIPLE_SPACES.sub(' ', text)
+        if self.accented:
+            text = WORD.sub(self._restore_accents, text)
+        return '\n'.join(line.strip() for line in text.splitlines()).strip()
+
+
+def fit_book(file_paths, dictionary_path=DICTIONARY_PATH):
+    """Returns (normalizer fitted on all chapters, {file_path: text}). Uses the .jsonl pages when present."""
+    texts = {}
+    page_edges = []
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            texts[file_path] = f.read()
+        records = chapter_records(file_path)
+        if records is not None:
+            page_edges.extend(page_edge_lines(records))
+    dictionary = load_dictionary(dictionary_path) if dictionary_path else ()
+    return TextNormalizer().fit(texts.values(), page_edges, dictionary), texts
+
+
+def main(input_folder=INPUT_FOLDER, output_folder=OUTPUT_FOLDER, dictionary_path=DICTIONARY_PATH):
+    file_paths = sorted(os.path.join(input_folder, name) for name in os.listdir(input_folder) if name.endswith('.txt'))
+    if not file_paths:
+        print(f"No .txt files found in '{input_folder}'.")
+        return
+
+    start = time.perf_counter()
+    normalizer, texts = fit_book(file_paths, dictionary_path)
+    normalized = {file_path: normalizer.normalize_chapter(text, chapter_records(file_path))
+                  for file_path, text in texts.items()}
+    elapsed = time.perf_counter() - start
+
+    os.makedirs(output_folder, exist_ok=True)
+    for file_path, text in normalized.items():
+        with open(os.path.join(output_folder, os.path.basename(file_path)), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    before = sum(len(text) for text in texts.values())
+    after = sum(len(text) for text in normalized.values())
+    print(f"Normalized {len(file_paths)} chapters in {elapsed * 1000:.0f} ms: {before} -> {after} characters, "
+          f"{len(normalizer.headers)} running headers removed. Output in '{output_folder}'.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rule-based clean-up of the STEP5 text (no AI, no network).")
+    parser.add_argument('--input', default=INPUT_FOLDER)
+    parser.add_argument('--output', default=OUTPUT_FOLDER)
+    parser.add_argument('--dictionary', default=DICTIONARY_PATH,
+                        help="Word list (one word per line) used to rejoin words and restore accents.")
+    args = parser.parse_args()
+
+    main(args.input, args.output, args.dictionary)